@@ -0,0 +1,897 @@
+#!/usr/bin/env python3
+"""
+离线 AnkiConnect 替身 — 不开 Anki 也能跑脚本，做可复现的 benchmark / 回归
+  - 讲 AnkiConnect v6 JSON 协议（POST {action, version, params} → {result, error}），
+    实现脚本用到的全部 action（EmulatedCollection / Emulator 的 _xxx 方法），返回格式与 AnkiConnect 一致
+  - 每个 Profile 一个 SQLite collection：默认内存，--data DIR 时存 DIR/<profile>.sqlite（媒体也在库里）
+  - 搜索语法子集：deck: note: tag: nid: cid: card: is: prop: 字段:通配（* _ 和 \\ 转义）、
+    裸词、引号、括号、or、-取反；不支持的写法直接报错，不会悄悄返回空结果
+  - --latency：每个请求的固定延迟；--action-latency：每个 action 的延迟（multi 里逐个算）；
+    --switch-delay：loadProfile 后多久切换完成，期间 getActiveProfile 仍是旧 Profile、操作 collection 报错
+  - 请求串行处理（和 Anki 主线程一样），并发请求只省网络往返，不省处理时间
+  - addNotes 有一条失败整批报错、一条都不加（新版 AnkiConnect）；--legacy-add 改回失败的位置返回 null
+  - 不依赖 anki 库；importPackage 读 schema 11 的 .apkg（apkg_writer / blank.apkg）
+
+用法:
+  python3 anki/anki_emulator.py                                   # :8765，szmz + czh，内存
+  python3 anki/anki_emulator.py --port 8799 --latency 5 --switch-delay 1500 --data /tmp/emu
+  ANKICONNECT_URL=http://127.0.0.1:8799 python3 anki/import_apkg.py --package
+
+  with anki_emulator.serve(latency=0.002) as url:                  # 进程内（benchmark / 测试）
+      ankiconnect.ANKI_URL = url
+"""
+import argparse
+import base64
+import contextlib
+import fnmatch
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+PROFILES = ["szmz", "czh"]
+PORT = 8765
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS models (id INTEGER PRIMARY KEY, name TEXT UNIQUE, fields TEXT,
+    templates TEXT, css TEXT, mod INTEGER);
+CREATE TABLE IF NOT EXISTS decks (id INTEGER PRIMARY KEY, name TEXT UNIQUE, conf INTEGER);
+CREATE TABLE IF NOT EXISTS dconf (id INTEGER PRIMARY KEY, config TEXT);
+CREATE TABLE IF NOT EXISTS notes (id INTEGER PRIMARY KEY, guid TEXT UNIQUE, mid INTEGER,
+    mod INTEGER, tags TEXT, flds TEXT);
+CREATE TABLE IF NOT EXISTS cards (id INTEGER PRIMARY KEY, nid INTEGER, did INTEGER, ord INTEGER,
+    mod INTEGER, type INTEGER, queue INTEGER, due INTEGER, ivl INTEGER, factor INTEGER,
+    reps INTEGER, lapses INTEGER, left INTEGER);
+CREATE TABLE IF NOT EXISTS media (name TEXT PRIMARY KEY, data BLOB);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+CREATE INDEX IF NOT EXISTS ix_cards_nid ON cards (nid);
+"""
+
+DEFAULT_DCONF = {
+    "name": "Default", "replayq": True, "autoplay": True, "timer": 0, "maxTaken": 60, "dyn": False,
+    "new": {"perDay": 20, "delays": [1.0, 10.0], "ints": [1, 4, 0], "initialFactor": 2500,
+            "order": 1, "bury": False},
+    "rev": {"perDay": 200, "ease4": 1.3, "maxIvl": 36500, "hardFactor": 1.2, "bury": False},
+    "lapse": {"delays": [10.0], "mult": 0.0, "minInt": 1, "leechFails": 8, "leechAction": 1},
+}
+DEFAULT_MODELS = [
+    ("Basic", ["Front", "Back"], [{"Name": "Card 1", "Front": "{{Front}}",
+                                   "Back": "{{FrontSide}}<hr id=answer>{{Back}}"}]),
+    ("Basic (and reversed card)", ["Front", "Back"],
+     [{"Name": "Card 1", "Front": "{{Front}}", "Back": "{{FrontSide}}<hr id=answer>{{Back}}"},
+      {"Name": "Card 2", "Front": "{{Back}}", "Back": "{{FrontSide}}<hr id=answer>{{Front}}"}]),
+]
+CARD_KEYS = {"type", "queue", "due", "ivl", "factor", "reps", "lapses", "left", "mod"}
+
+_FIELD_REF_RE = re.compile(r"\{\{[#^]?([^}#^/][^}]*)\}\}")
+_SPECIAL_REFS = {"FrontSide", "Tags", "Type", "Deck", "Subdeck", "Card", "CardFlag"}
+_PROP_RE = re.compile(r"^(ivl|due|reps|lapses|ease|pos)(<=|>=|!=|=|<|>)(-?[\d.]+)$")
+_PROP_COLUMN = {"ivl": "ivl", "due": "due", "reps": "reps", "lapses": "lapses",
+                "ease": "factor", "pos": "due"}
+_OPS = {"<=": lambda a, b: a <= b, ">=": lambda a, b: a >= b, "!=": lambda a, b: a != b,
+        "=": lambda a, b: a == b, "<": lambda a, b: a < b, ">": lambda a, b: a > b}
+
+
+# ── search ───────────────────────────────────────────
+
+def _glob_re(pattern, whole=True):
+    """Anki wildcard text (* any, _ one char, \\x literal) → compiled case-insensitive regex."""
+    out = []
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\" and i + 1 < len(pattern):
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+            continue
+        out.append(".*" if ch == "*" else "." if ch == "_" else re.escape(ch))
+        i += 1
+    body = "".join(out)
+    return re.compile(f"^{body}$" if whole else body, re.I | re.S)
+
+
+def _tokens(query):
+    """Split a search string into terms, "(", ")" — quotes group, \\" escapes."""
+    out = []
+    i = 0
+    while i < len(query):
+        ch = query[i]
+        if ch.isspace():
+            i += 1
+        elif ch in "()":
+            out.append(ch)
+            i += 1
+        else:
+            term = []
+            quoted = False
+            while i < len(query) and (quoted or not (query[i].isspace() or query[i] in "()")):
+                c = query[i]
+                if c == "\\" and i + 1 < len(query):
+                    # \" 只是引号本身；其它转义（\* \_ \\）留给通配符解析
+                    term.append(query[i + 1] if query[i + 1] == '"' else query[i:i + 2])
+                    i += 2
+                    continue
+                if c == '"':
+                    quoted = not quoted
+                else:
+                    term.append(c)
+                i += 1
+            out.append("".join(term))
+    return out
+
+
+def compile_query(query):
+    """Search string → predicate(row) over card rows (see EmulatedCollection._rows)."""
+    toks = _tokens(query)
+    pos = 0
+
+    def parse_or():
+        nonlocal pos
+        preds = [parse_and()]
+        while pos < len(toks) and toks[pos].lower() == "or":
+            pos += 1
+            preds.append(parse_and())
+        return preds[0] if len(preds) == 1 else (lambda r: any(p(r) for p in preds))
+
+    def parse_and():
+        nonlocal pos
+        preds = []
+        while pos < len(toks) and toks[pos] != ")" and toks[pos].lower() != "or":
+            if toks[pos].lower() == "and":
+                pos += 1
+                continue
+            preds.append(parse_unary())
+        if not preds:
+            raise Exception(f"invalid search: {query}")
+        return preds[0] if len(preds) == 1 else (lambda r: all(p(r) for p in preds))
+
+    def parse_unary():
+        nonlocal pos
+        tok = toks[pos]
+        pos += 1
+        if tok == "(":
+            pred = parse_or()
+            if pos >= len(toks) or toks[pos] != ")":
+                raise Exception(f"invalid search: {query}")
+            pos += 1
+            return pred
+        if tok == "-" and pos < len(toks) and toks[pos] == "(":
+            inner = parse_unary()
+            return lambda r: not inner(r)
+        if tok.startswith("-") and len(tok) > 1:
+            inner = _term(tok[1:])
+            return lambda r: not inner(r)
+        return _term(tok)
+
+    if not toks:
+        return lambda r: True
+    pred = parse_or()
+    if pos != len(toks):
+        raise Exception(f"invalid search: {query}")
+    return pred
+
+
+def _term(term):
+    key, sep, value = term.partition(":")
+    if not sep:
+        text = _glob_re(term, whole=False)
+        return lambda r: any(text.search(v) for v in r.fields.values())
+    k = key.lower()
+    if k == "deck":
+        if value == "*":
+            return lambda r: True
+        pat = _glob_re(value)
+        return lambda r: any(pat.match(d) for d in _parents(r.deck))
+    if k == "note":
+        pat = _glob_re(value)
+        return lambda r: bool(pat.match(r.model))
+    if k == "tag":
+        if value.lower() == "none":
+            return lambda r: not r.tags
+        pat = _glob_re(value)
+        return lambda r: any(pat.match(p) for t in r.tags for p in _parents(t))
+    if k in ("nid", "cid"):
+        ids = {int(x) for x in value.split(",") if x}
+        return (lambda r: r.nid in ids) if k == "nid" else (lambda r: r.cid in ids)
+    if k == "card":
+        if value.isdigit():
+            return lambda r: r.ord == int(value) - 1
+        pat = _glob_re(value)
+        return lambda r: bool(pat.match(r.template))
+    if k == "is":
+        states = {"new": lambda r: r.type == 0, "suspended": lambda r: r.queue == -1,
+                  "review": lambda r: r.type == 2, "learn": lambda r: r.type in (1, 3),
+                  "buried": lambda r: r.queue in (-2, -3),
+                  "due": lambda r: r.type == 2 and r.queue == 2 and r.due <= r.today}
+        if value.lower() not in states:
+            raise Exception(f"unsupported search: {term}")
+        return states[value.lower()]
+    if k == "prop":
+        m = _PROP_RE.match(value.lower())
+        if not m:
+            raise Exception(f"unsupported search: {term}")
+        col, op, num = _PROP_COLUMN[m.group(1)], _OPS[m.group(2)], float(m.group(3))
+        if col == "factor":
+            num *= 1000
+        return lambda r: op(getattr(r, col), num)
+    if k in ("re", "dupe", "flag", "rated", "added", "edited", "introduced"):
+        raise Exception(f"unsupported search: {term}")
+    # 字段搜索：整个字段匹配通配（空值 = 字段为空）
+    name = _glob_re(key)
+    pat = _glob_re(value)
+    return lambda r: any(name.match(f) and pat.match(v) for f, v in r.fields.items())
+
+
+def _parents(name):
+    """'a::b::c' → ['a::b::c', 'a::b', 'a'] (deck: / tag: also match children)."""
+    parts = name.split("::")
+    return ["::".join(parts[:i]) for i in range(len(parts), 0, -1)]
+
+
+class _Row:
+    """One card joined with its note, deck and model, as search predicates see it."""
+    __slots__ = ("cid", "nid", "ord", "type", "queue", "due", "ivl", "factor", "reps", "lapses",
+                 "deck", "model", "template", "tags", "_flds", "_names", "_fields", "today")
+
+    def __init__(self, row, decks, models, today):
+        (self.cid, self.nid, self.ord, self.type, self.queue, self.due, self.ivl, self.factor,
+         self.reps, self.lapses, did, mid, tags, self._flds) = row
+        self.deck = decks.get(did, "")
+        model = models[mid]
+        self.model = model["name"]
+        tmpls = model["templates"]
+        self.template = tmpls[self.ord]["Name"] if self.ord < len(tmpls) else ""
+        self._names = model["fields"]
+        self.tags = tags.split()
+        self._fields = None
+        self.today = today
+
+    @property
+    def fields(self):
+        if self._fields is None:
+            self._fields = dict(zip(self._names, json.loads(self._flds)))
+        return self._fields
+
+
+# ── collection ───────────────────────────────────────
+
+class EmulatedCollection:
+    """AnkiConnect-compatible action handler over one profile's SQLite collection.
+    Same dispatch as collection_backend.DirectCollection, so it also works with
+    ankiconnect.use_backend() for in-process tests."""
+
+    def __init__(self, path=":memory:", legacy_add=False):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.legacy_add = legacy_add
+        self._last_id = 0
+        if not self.db.execute("SELECT 1 FROM decks").fetchone():
+            self.db.execute("INSERT INTO dconf VALUES (1, ?)", (json.dumps(dict(DEFAULT_DCONF, id=1)),))
+            self.db.execute("INSERT INTO decks VALUES (1, 'Default', 1)")
+            for name, fields, templates in DEFAULT_MODELS:
+                self._createModel(name, fields, templates)
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    # ── dispatch ─────────────────────────────────────
+    def request(self, payload):
+        """Handle one AnkiConnect payload dict, return {result, error}."""
+        try:
+            result = self.invoke(payload["action"], **payload.get("params", {}))
+            self.db.commit()
+            return {"result": result, "error": None}
+        except Exception as e:
+            self.db.rollback()
+            return {"result": None, "error": str(e)}
+
+    def invoke(self, action, **params):
+        handler = getattr(self, "_" + action, None)
+        if handler is None:
+            raise Exception("unsupported action")
+        return handler(**params)
+
+    def _multi(self, actions):
+        return [self.request(a) for a in actions]
+
+    def _version(self):
+        return 6
+
+    # ── helpers ──────────────────────────────────────
+    def _new_id(self):
+        """Millisecond-timestamp ids, strictly increasing (like Anki)."""
+        self._last_id = max(int(time.time() * 1000), self._last_id + 1,
+                            self.db.execute("SELECT max(max(ifnull((SELECT max(id) FROM notes), 0),"
+                                            " ifnull((SELECT max(id) FROM cards), 0)),"
+                                            " ifnull((SELECT max(id) FROM models), 0))").fetchone()[0] + 1)
+        return self._last_id
+
+    def _next_pos(self):
+        pos = (self.db.execute("SELECT value FROM meta WHERE key = 'nextPos'").fetchone() or [1])[0]
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES ('nextPos', ?)", (pos + 1,))
+        return pos
+
+    def _models(self):
+        return {mid: {"id": mid, "name": name, "fields": json.loads(fields),
+                      "templates": json.loads(templates), "css": css, "mod": mod}
+                for mid, name, fields, templates, css, mod in self.db.execute("SELECT * FROM models")}
+
+    def _model(self, name):
+        m = next((m for m in self._models().values() if m["name"] == name), None)
+        if m is None:
+            raise Exception(f"model was not found: {name}")
+        return m
+
+    def _save_model(self, m):
+        self.db.execute("UPDATE models SET fields = ?, templates = ?, css = ?, mod = ? WHERE id = ?",
+                        (json.dumps(m["fields"], ensure_ascii=False),
+                         json.dumps(m["templates"], ensure_ascii=False), m["css"], int(time.time()),
+                         m["id"]))
+
+    def _deck_id(self, name, create=True):
+        row = self.db.execute("SELECT id FROM decks WHERE name = ?", (name,)).fetchone()
+        if row:
+            return row[0]
+        if not create:
+            return None
+        if "::" in name:
+            self._deck_id(name.rsplit("::", 1)[0])
+        did = self._new_id()
+        self.db.execute("INSERT INTO decks VALUES (?, ?, 1)", (did, name))
+        return did
+
+    def _note(self, nid):
+        row = self.db.execute("SELECT id, guid, mid, mod, tags, flds FROM notes WHERE id = ?",
+                              (nid,)).fetchone()
+        if row is None:
+            raise Exception(f"note was not found: {nid}")
+        return row
+
+    def _rows(self, query):
+        models = self._models()
+        decks = dict(self.db.execute("SELECT id, name FROM decks"))
+        pred = compile_query(query)
+        today = int(time.time() // 86400)
+        cur = self.db.execute(
+            "SELECT c.id, c.nid, c.ord, c.type, c.queue, c.due, c.ivl, c.factor, c.reps, c.lapses,"
+            " c.did, n.mid, n.tags, n.flds FROM cards c JOIN notes n ON n.id = c.nid ORDER BY c.id")
+        return [r for r in (_Row(row, decks, models, today) for row in cur) if pred(r)]
+
+    @staticmethod
+    def _card_ords(model, values):
+        """Templates whose front references a non-empty field (Anki's card generation, roughly)."""
+        filled = {name for name, v in zip(model["fields"], values) if v.strip()}
+        ords = []
+        for i, t in enumerate(model["templates"]):
+            refs = {r.split(":")[-1].strip() for r in _FIELD_REF_RE.findall(t["Front"])} - _SPECIAL_REFS
+            if not refs or refs & filled:
+                ords.append(i)
+        return ords
+
+    def _insert_cards(self, nid, did, ords, queue=0):
+        for o in ords:
+            self.db.execute("INSERT INTO cards VALUES (?,?,?,?,?,0,?,?,0,0,0,0,0)",
+                            (self._new_id(), nid, did, o, int(time.time()), queue, self._next_pos()))
+
+    # ── decks ────────────────────────────────────────
+    def _deckNames(self):
+        return [name for (name,) in self.db.execute("SELECT name FROM decks ORDER BY name")]
+
+    def _deckNamesAndIds(self):
+        return dict(self.db.execute("SELECT name, id FROM decks"))
+
+    def _createDeck(self, deck):
+        return self._deck_id(deck)
+
+    def _deleteDecks(self, decks, cardsToo=True):
+        for name in decks:
+            dids = [did for (did,) in self.db.execute(
+                "SELECT id FROM decks WHERE name = ? OR name LIKE ? ESCAPE '\\'",
+                (name, name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "::%"))]
+            for did in dids:
+                self.db.execute("DELETE FROM cards WHERE did = ?", (did,))
+                self.db.execute("DELETE FROM decks WHERE id = ? AND id != 1", (did,))
+        self.db.execute("DELETE FROM notes WHERE id NOT IN (SELECT nid FROM cards)")
+
+    def _changeDeck(self, cards, deck):
+        did = self._deck_id(deck)
+        self.db.executemany("UPDATE cards SET did = ? WHERE id = ?", [(did, c) for c in cards])
+
+    def _getDeckConfig(self, deck):
+        row = self.db.execute("SELECT conf FROM decks WHERE name = ?", (deck,)).fetchone()
+        if row is None:
+            return False
+        return json.loads(self.db.execute("SELECT config FROM dconf WHERE id = ?", row).fetchone()[0])
+
+    def _saveDeckConfig(self, config):
+        if not self.db.execute("SELECT 1 FROM dconf WHERE id = ?", (config["id"],)).fetchone():
+            return False
+        self.db.execute("UPDATE dconf SET config = ? WHERE id = ?",
+                        (json.dumps(config, ensure_ascii=False), config["id"]))
+        return True
+
+    def _setDeckConfigId(self, decks, configId):
+        if not self.db.execute("SELECT 1 FROM dconf WHERE id = ?", (configId,)).fetchone():
+            return False
+        for name in decks:
+            if self._deck_id(name, create=False) is None:
+                return False
+        self.db.executemany("UPDATE decks SET conf = ? WHERE name = ?", [(configId, d) for d in decks])
+        return True
+
+    def _cloneDeckConfigId(self, name, cloneFrom=1):
+        row = self.db.execute("SELECT config FROM dconf WHERE id = ?", (cloneFrom,)).fetchone()
+        if row is None:
+            return False
+        cid = self._new_id()
+        self.db.execute("INSERT INTO dconf VALUES (?, ?)",
+                        (cid, json.dumps(dict(json.loads(row[0]), id=cid, name=name), ensure_ascii=False)))
+        return cid
+
+    # ── models ───────────────────────────────────────
+    def _modelNames(self):
+        return [name for (name,) in self.db.execute("SELECT name FROM models ORDER BY name")]
+
+    def _modelNamesAndIds(self):
+        return dict(self.db.execute("SELECT name, id FROM models"))
+
+    def _modelFieldNames(self, modelName):
+        return self._model(modelName)["fields"]
+
+    def _modelTemplates(self, modelName):
+        return {t["Name"]: {"Front": t["Front"], "Back": t["Back"]}
+                for t in self._model(modelName)["templates"]}
+
+    def _modelStyling(self, modelName):
+        return {"css": self._model(modelName)["css"]}
+
+    def _createModel(self, modelName, inOrderFields, cardTemplates, css="", isCloze=False,
+                     model_id=None):
+        if self.db.execute("SELECT 1 FROM models WHERE name = ?", (modelName,)).fetchone():
+            raise Exception("Model name already exists")
+        mid = model_id or self._new_id()
+        templates = [{"Name": t.get("Name", f"Card {i + 1}"), "Front": t["Front"], "Back": t["Back"]}
+                     for i, t in enumerate(cardTemplates)]
+        self.db.execute("INSERT INTO models VALUES (?,?,?,?,?,?)",
+                        (mid, modelName, json.dumps(list(inOrderFields), ensure_ascii=False),
+                         json.dumps(templates, ensure_ascii=False), css, int(time.time())))
+        return {"id": mid, "name": modelName, "css": css,
+                "flds": [{"name": f, "ord": i} for i, f in enumerate(inOrderFields)],
+                "tmpls": [{"name": t["Name"], "ord": i, "qfmt": t["Front"], "afmt": t["Back"]}
+                          for i, t in enumerate(templates)]}
+
+    def _modelFieldAdd(self, modelName, fieldName, index=None):
+        m = self._model(modelName)
+        if fieldName in m["fields"]:
+            raise Exception(f"field already exists: {fieldName}")
+        index = len(m["fields"]) if index is None else min(index, len(m["fields"]))
+        m["fields"].insert(index, fieldName)
+        self._save_model(m)
+        rows = self.db.execute("SELECT id, flds FROM notes WHERE mid = ?", (m["id"],)).fetchall()
+        self.db.executemany("UPDATE notes SET flds = ? WHERE id = ?", [
+            (json.dumps(json.loads(flds)[:index] + [""] + json.loads(flds)[index:], ensure_ascii=False), nid)
+            for nid, flds in rows])
+
+    def _updateModelStyling(self, model):
+        m = self._model(model["name"])
+        m["css"] = model["css"]
+        self._save_model(m)
+
+    def _updateModelTemplates(self, model):
+        m = self._model(model["name"])
+        for t in m["templates"]:
+            new = model["templates"].get(t["Name"])
+            if new:
+                t["Front"] = new.get("Front", t["Front"])
+                t["Back"] = new.get("Back", t["Back"])
+        self._save_model(m)
+
+    # ── notes ────────────────────────────────────────
+    def _findNotes(self, query):
+        return sorted({r.nid for r in self._rows(query)})
+
+    def _notesInfo(self, notes):
+        models = self._models()
+        out = []
+        for nid in notes:
+            try:
+                _, _, mid, mod, tags, flds = self._note(nid)
+            except Exception:
+                out.append({})  # AnkiConnect 对不存在的 id 回空对象
+                continue
+            m = models[mid]
+            out.append({
+                "noteId": nid, "modelName": m["name"], "tags": tags.split(),
+                "fields": {name: {"value": v, "order": i}
+                           for i, (name, v) in enumerate(zip(m["fields"], json.loads(flds)))},
+                "cards": [cid for (cid,) in self.db.execute(
+                    "SELECT id FROM cards WHERE nid = ? ORDER BY ord", (nid,))],
+                "mod": mod,
+            })
+        return out
+
+    def _notesModTime(self, notes):
+        return [{"noteId": nid, "mod": self._note(nid)[3]} for nid in notes]
+
+    def _check_note(self, note):
+        """→ (model, field values); raises AnkiConnect's errors for bad notes."""
+        m = self._model(note["modelName"])
+        if self._deck_id(note["deckName"], create=False) is None:
+            raise Exception(f"deck was not found: {note['deckName']}")
+        lower = {k.lower(): v for k, v in note["fields"].items()}  # 未知字段忽略，大小写不敏感
+        values = [lower.get(name.lower(), "") for name in m["fields"]]
+        if not values or not values[0].strip():
+            raise Exception("cannot create note because it is empty")
+        dup = note.get("options", {}).get("allowDuplicate", False)
+        if not dup and self.db.execute("SELECT 1 FROM notes WHERE mid = ? AND json_extract(flds, '$[0]') = ?",
+                                       (m["id"], values[0])).fetchone():
+            raise Exception("cannot create note because it is a duplicate")
+        if not self._card_ords(m, values):
+            raise Exception("cannot create note because it would not generate any cards")
+        return m, values
+
+    def _addNote(self, note):
+        m, values = self._check_note(note)
+        nid = self._new_id()
+        self.db.execute("INSERT INTO notes VALUES (?,?,?,?,?,?)",
+                        (nid, uuid.uuid4().hex[:10], m["id"], int(time.time()),
+                         " ".join(note.get("tags", [])), json.dumps(values, ensure_ascii=False)))
+        self._insert_cards(nid, self._deck_id(note["deckName"]), self._card_ords(m, values))
+        return nid
+
+    def _addNotes(self, notes):
+        if self.legacy_add:
+            ids = []
+            for note in notes:
+                try:
+                    ids.append(self._addNote(note))
+                except Exception:
+                    ids.append(None)
+            return ids
+        errors = []
+        firsts = set()
+        for i, note in enumerate(notes):
+            try:
+                m, values = self._check_note(note)
+                # 同一批里第一字段重复也算
+                if (m["id"], values[0]) in firsts and not note.get("options", {}).get("allowDuplicate"):
+                    raise Exception("cannot create note because it is a duplicate")
+                firsts.add((m["id"], values[0]))
+            except Exception as e:
+                errors.append(f"[{i}]: {e}")
+        if errors:
+            raise Exception(str(errors))
+        return [self._addNote(note) for note in notes]
+
+    def _set_fields(self, nid, fields):
+        _, _, mid, _, _, flds = self._note(nid)
+        names = self._models()[mid]["fields"]
+        values = json.loads(flds)
+        for k, v in fields.items():
+            if k in names:
+                values[names.index(k)] = v
+        self.db.execute("UPDATE notes SET flds = ?, mod = ? WHERE id = ?",
+                        (json.dumps(values, ensure_ascii=False), int(time.time()), nid))
+
+    def _updateNoteFields(self, note):
+        self._set_fields(note["id"], note["fields"])
+
+    def _updateNote(self, note):
+        self._note(note["id"])
+        if "fields" in note:
+            self._set_fields(note["id"], note["fields"])
+        if "tags" in note:
+            self.db.execute("UPDATE notes SET tags = ?, mod = ? WHERE id = ?",
+                            (" ".join(note["tags"]), int(time.time()), note["id"]))
+
+    def _addTags(self, notes, tags):
+        for nid in notes:
+            cur = self._note(nid)[4].split()
+            new = cur + [t for t in tags.split() if t not in cur]
+            self.db.execute("UPDATE notes SET tags = ? WHERE id = ?", (" ".join(new), nid))
+
+    def _deleteNotes(self, notes):
+        self.db.executemany("DELETE FROM cards WHERE nid = ?", [(n,) for n in notes])
+        self.db.executemany("DELETE FROM notes WHERE id = ?", [(n,) for n in notes])
+
+    # ── cards ────────────────────────────────────────
+    def _findCards(self, query):
+        return [r.cid for r in self._rows(query)]
+
+    def _cardsInfo(self, cards):
+        models = self._models()
+        decks = dict(self.db.execute("SELECT id, name FROM decks"))
+        out = []
+        for cid in cards:
+            row = self.db.execute(
+                "SELECT c.id, c.nid, c.did, c.ord, c.type, c.queue, c.due, c.ivl, c.factor,"
+                " c.reps, c.lapses, c.left, c.mod, n.mid, n.flds FROM cards c"
+                " JOIN notes n ON n.id = c.nid WHERE c.id = ?", (cid,)).fetchone()
+            if row is None:
+                out.append({})
+                continue
+            (cid, nid, did, ord_, type_, queue, due, ivl, factor, reps, lapses, left, mod,
+             mid, flds) = row
+            m = models[mid]
+            out.append({
+                "cardId": cid, "note": nid, "ord": ord_, "deckName": decks.get(did, ""),
+                "modelName": m["name"], "fieldOrder": ord_,
+                "fields": {name: {"value": v, "order": i}
+                           for i, (name, v) in enumerate(zip(m["fields"], json.loads(flds)))},
+                "type": type_, "queue": queue, "due": due, "interval": ivl, "factor": factor,
+                "reps": reps, "lapses": lapses, "left": left, "mod": mod,
+            })
+        return out
+
+    def _suspend(self, cards):
+        self.db.executemany("UPDATE cards SET queue = -1 WHERE id = ?", [(c,) for c in cards])
+        return True
+
+    def _unsuspend(self, cards):
+        self.db.executemany("UPDATE cards SET queue = type WHERE id = ? AND queue = -1",
+                            [(c,) for c in cards])
+        return True
+
+    def _areSuspended(self, cards):
+        return [bool(r and r[0] == -1) for r in (
+            self.db.execute("SELECT queue FROM cards WHERE id = ?", (c,)).fetchone() for c in cards)]
+
+    def _forgetCards(self, cards):
+        for c in cards:
+            self.db.execute("UPDATE cards SET type = 0, queue = 0, ivl = 0, factor = 0, due = ?"
+                            " WHERE id = ?", (self._next_pos(), c))
+
+    def _setSpecificValueOfCard(self, card, keys, newValues):
+        if not self.db.execute("SELECT 1 FROM cards WHERE id = ?", (card,)).fetchone():
+            raise Exception(f"card was not found: {card}")
+        ok = []
+        for k, v in zip(keys, newValues):
+            if k in CARD_KEYS:
+                self.db.execute(f"UPDATE cards SET {k} = ? WHERE id = ?", (int(v), card))
+            ok.append(k in CARD_KEYS)
+        return ok
+
+    # ── media ────────────────────────────────────────
+    def _storeMediaFile(self, filename, data=None, path=None, url=None, deleteExisting=True):
+        if data is not None:
+            raw = base64.b64decode(data)
+        elif path is not None:
+            with open(path, "rb") as f:
+                raw = f.read()
+        else:
+            raise Exception("You must provide a \"data\", \"path\", or \"url\" field.")
+        if not deleteExisting and self.db.execute("SELECT 1 FROM media WHERE name = ?", (filename,)).fetchone():
+            return filename
+        self.db.execute("INSERT OR REPLACE INTO media VALUES (?, ?)", (filename, raw))
+        return filename
+
+    def _retrieveMediaFile(self, filename):
+        row = self.db.execute("SELECT data FROM media WHERE name = ?", (filename,)).fetchone()
+        return base64.b64encode(row[0]).decode("utf-8") if row else False
+
+    def _getMediaFilesNames(self, pattern="*"):
+        return fnmatch.filter([n for (n,) in self.db.execute("SELECT name FROM media")], pattern)
+
+    def _deleteMediaFile(self, filename):
+        self.db.execute("DELETE FROM media WHERE name = ?", (filename,))
+
+    # ── packages ─────────────────────────────────────
+    def _importPackage(self, path):
+        """Legacy-schema .apkg: notes matched by guid (updated when newer), new notes
+        get their cards with the package's queue (suspension kept), media copied."""
+        from apkg_reader import ApkgReader
+        with ApkgReader(path) as apkg:
+            raw_models = json.loads(apkg.db.execute("SELECT models FROM col").fetchone()[0])
+            deck_names = apkg.decks()
+            mids = {}
+            for pm in raw_models.values():
+                fields = [f["name"] for f in sorted(pm["flds"], key=lambda f: f["ord"])]
+                tmpls = [{"Name": t["name"], "Front": t["qfmt"], "Back": t["afmt"]}
+                         for t in sorted(pm["tmpls"], key=lambda t: t["ord"])]
+                # 同 id 或同名的笔记类型直接并入（不比较字段），否则新建
+                row = self.db.execute("SELECT id FROM models WHERE id = ? OR name = ?",
+                                      (int(pm["id"]), pm["name"])).fetchone()
+                mids[int(pm["id"])] = row[0] if row else self._createModel(
+                    pm["name"], fields, tmpls, pm.get("css", ""), model_id=int(pm["id"]))["id"]
+            models = self._models()
+            cards = {}
+            for nid, ord_, did, queue in apkg.db.execute("SELECT nid, ord, did, queue FROM cards"):
+                cards.setdefault(nid, []).append((ord_, did, queue))
+            for pid, guid, mid, mod, tags, flds in apkg.db.execute(
+                    "SELECT id, guid, mid, mod, tags, flds FROM notes"):
+                values = flds.split("\x1f")
+                mid = mids[mid]
+                values = (values + [""] * len(models[mid]["fields"]))[:len(models[mid]["fields"])]
+                row = self.db.execute("SELECT id, mod FROM notes WHERE guid = ?", (guid,)).fetchone()
+                if row:
+                    if mod > row[1]:
+                        self.db.execute("UPDATE notes SET flds = ?, tags = ?, mod = ? WHERE id = ?",
+                                        (json.dumps(values, ensure_ascii=False), tags.strip(), mod, row[0]))
+                    continue
+                taken = self.db.execute("SELECT 1 FROM notes WHERE id = ?", (pid,)).fetchone()
+                nid = self._new_id() if taken else pid
+                self.db.execute("INSERT INTO notes VALUES (?,?,?,?,?,?)",
+                                (nid, guid, mid, mod, tags.strip(), json.dumps(values, ensure_ascii=False)))
+                for ord_, did, queue in sorted(cards.get(pid, [])):
+                    self._insert_cards(nid, self._deck_id(deck_names.get(did, "Default")), [ord_],
+                                       queue=-1 if queue == -1 else 0)
+            for num, name in apkg.media_map().items():
+                if apkg.has_media(num):
+                    self.db.execute("INSERT OR REPLACE INTO media VALUES (?, ?)",
+                                    (name, apkg.read_media(num)))
+        return True
+
+
+# ── server ───────────────────────────────────────────
+
+class Emulator:
+    """Profiles + latency + profile switching in front of one EmulatedCollection per profile."""
+
+    PROFILE_ACTIONS = {"version", "requestPermission", "getProfiles", "getActiveProfile",
+                       "loadProfile", "multi"}
+
+    def __init__(self, profiles=PROFILES, data_dir=None, latency=0.0, action_latency=0.0,
+                 switch_delay=0.0, legacy_add=False):
+        self.data_dir = data_dir
+        self.latency = latency
+        self.action_latency = action_latency
+        self.switch_delay = switch_delay
+        self.legacy_add = legacy_add
+        names = list(profiles)
+        if data_dir:
+            os.makedirs(data_dir, exist_ok=True)
+            names += [f[:-7] for f in sorted(os.listdir(data_dir))
+                      if f.endswith(".sqlite") and f[:-7] not in names]
+        self.collections = {name: self._open(name) for name in names}
+        self.active = names[0]
+        self._pending = None  # (profile, ready_at) while a loadProfile is in progress
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def _open(self, name):
+        path = os.path.join(self.data_dir, f"{name}.sqlite") if self.data_dir else ":memory:"
+        return EmulatedCollection(path, legacy_add=self.legacy_add)
+
+    def close(self):
+        for col in self.collections.values():
+            col.close()
+
+    def _switching(self):
+        if self._pending and time.monotonic() >= self._pending[1]:
+            self.active = self._pending[0]
+            self._pending = None
+        return self._pending is not None
+
+    # ── dispatch ─────────────────────────────────────
+    def request(self, payload):
+        """One HTTP request body → response dict (latency applied once per request)."""
+        with self.lock:
+            if self.latency:
+                time.sleep(self.latency)
+            return self.handle(payload)
+
+    def handle(self, payload):
+        action = payload.get("action")
+        self.calls[action] = self.calls.get(action, 0) + 1
+        if self.action_latency:
+            time.sleep(self.action_latency)
+        switching = self._switching()
+        if action in self.PROFILE_ACTIONS:
+            try:
+                result = getattr(self, "_" + action)(**payload.get("params", {}))
+                return {"result": result, "error": None}
+            except Exception as e:
+                return {"result": None, "error": str(e)}
+        if switching:
+            return {"result": None, "error": "collection is not available"}
+        return self.collections[self.active].request(payload)
+
+    def _multi(self, actions):
+        return [self.handle(a) for a in actions]
+
+    def _version(self):
+        return 6
+
+    def _requestPermission(self):
+        return {"permission": "granted", "requireApikey": False, "version": 6}
+
+    def _getProfiles(self):
+        return list(self.collections)
+
+    def _getActiveProfile(self):
+        return self.active
+
+    def _loadProfile(self, name):
+        if name not in self.collections:
+            return False
+        if name != self.active and not self._pending:
+            self._pending = (name, time.monotonic() + self.switch_delay)
+            self._switching()
+        return True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    emulator = None
+    close_each = False
+
+    def do_POST(self):
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            response = self.emulator.request(payload)
+        except ValueError:
+            response = {"result": None, "error": "invalid JSON"}
+        body = json.dumps(response, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if self.close_each:
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+def make_server(emulator, host="127.0.0.1", port=PORT, close_each=False):
+    handler = type("Handler", (_Handler,), {"emulator": emulator, "close_each": close_each})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+@contextlib.contextmanager
+def serve(port=0, close_each=False, **options):
+    """Run an Emulator(**options) on a background thread; yields its URL.
+    The emulator itself is available as serve.emulator while running."""
+    emulator = Emulator(**options)
+    server = make_server(emulator, port=port, close_each=close_each)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    serve.emulator = emulator
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+        emulator.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线 AnkiConnect 替身")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--profiles", default=",".join(PROFILES), help="逗号分隔，第一个为当前 Profile")
+    parser.add_argument("--data", help="SQLite 目录（默认内存，退出即丢）")
+    parser.add_argument("--latency", type=float, default=0, help="每个请求的延迟（毫秒）")
+    parser.add_argument("--action-latency", type=float, default=0, help="每个 action 的延迟（毫秒，multi 逐个算）")
+    parser.add_argument("--switch-delay", type=float, default=0, help="loadProfile 到切换完成（毫秒）")
+    parser.add_argument("--legacy-add", action="store_true", help="addNotes 失败的位置返回 null（旧版行为）")
+    parser.add_argument("--close", action="store_true", help="每次响应后断开连接（部分 AnkiConnect 版本）")
+    args = parser.parse_args()
+
+    emulator = Emulator(profiles=[p for p in args.profiles.split(",") if p], data_dir=args.data,
+                        latency=args.latency / 1000, action_latency=args.action_latency / 1000,
+                        switch_delay=args.switch_delay / 1000, legacy_add=args.legacy_add)
+    server = make_server(emulator, port=args.port, close_each=args.close)
+    print(f"✓ AnkiConnect 替身 http://127.0.0.1:{args.port}  Profile: {', '.join(emulator.collections)}"
+          f"  ({args.data or '内存'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        emulator.close()
+        print("\n  " + ", ".join(f"{k} ×{v}" for k, v in sorted(emulator.calls.items(), key=lambda kv: -kv[1])))
+
+
+if __name__ == "__main__":
+    main()
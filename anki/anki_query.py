@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Anki 搜索语句构造 — 把「有例句、没例句音频」这类条件写成精确的 search string，
+让 findNotes 在 Anki 里筛好，notesInfo 只拉真正要处理的笔记
+  - filled("例句")  → "例句:_*"   （至少一个字符）
+  - empty("例句音频") → "例句音频:"  （字段为空）
+  - 每一项都加引号，牌组名 / 字段名里有空格也没问题；字面值用 escape() 转义 * _ \\ "
+  - build(deck=…, filled=[…], empty=[…], …) 拼成一条 AND 查询
+
+用法:
+  q = anki_query.build(deck=DECK, filled=["例句"], empty=["例句音频"])
+  # '"deck:みんなの日本語初级1-2 単語" "例句:_*" "例句音频:"'
+  q = anki_query.build(deck=DECK, card=2, extra=[anki_query.is_("suspended")])
+"""
+
+
+def escape(text):
+    """Literal text for a search term: no wildcards."""
+    for ch in ("\\", "*", "_"):
+        text = text.replace(ch, "\\" + ch)
+    return text
+
+
+def quote(term):
+    return '"' + term.replace('"', '\\"') + '"'
+
+
+def deck(name):
+    return quote(f"deck:{escape(name)}")
+
+
+def note(model):
+    return quote(f"note:{escape(model)}")
+
+
+def tag(name):
+    return quote(f"tag:{escape(name)}")
+
+
+def field(name, pattern):
+    """Field `name` matches Anki wildcard `pattern` (use escape() for literals)."""
+    return quote(f"{escape(name)}:{pattern}")
+
+
+def filled(name):
+    return field(name, "_*")
+
+
+def empty(name):
+    return field(name, "")
+
+
+def card(ord_):
+    return f"card:{ord_}"
+
+
+def is_(state):
+    """is:new / is:suspended / is:due …"""
+    return f"is:{state}"
+
+
+def prop(expr):
+    """prop:reps>=3 / prop:ivl>=21 …"""
+    return f"prop:{expr}"
+
+
+def nids(ids):
+    return "nid:" + ",".join(map(str, ids))
+
+
+def all_of(*terms):
+    return " ".join(t for t in terms if t)
+
+
+def _compound(term):
+    """Does `term` contain a space outside quotes (i.e. several terms)?"""
+    quoted = escaped = False
+    for ch in term:
+        if escaped:
+            escaped = False
+        elif ch == "\\":
+            escaped = True
+        elif ch == '"':
+            quoted = not quoted
+        elif ch == " " and not quoted:
+            return True
+    return False
+
+
+def any_of(*terms):
+    terms = [f"({t})" if _compound(t) else t for t in terms if t]
+    return terms[0] if len(terms) == 1 else "(" + " or ".join(terms) + ")"
+
+
+def not_(term):
+    return "-" + term
+
+
+# build() 的参数名和上面的函数同名，先留一份引用
+_deck, _note, _card, _filled, _empty = deck, note, card, filled, empty
+
+
+def build(deck=None, note=None, card=None, filled=(), empty=(), tags=(), extra=()):
+    """AND of every given predicate."""
+    terms = []
+    if deck:
+        terms.append(_deck(deck))
+    if note:
+        terms.append(_note(note))
+    if card is not None:
+        terms.append(_card(card))
+    terms += [_filled(f) for f in filled]
+    terms += [_empty(f) for f in empty]
+    terms += [tag(t) for t in tags]
+    terms += list(extra)
+    return all_of(*terms)
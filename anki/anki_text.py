@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Anki 字段文本 — 一个预编译正则、一次扫描，把字段切成带类型的 token
+  - TEXT 普通文本 / RUBY_BASE + RUBY_READING（「 食[た]」）/ TAG（<b>、<br>）/ SOUND（[sound:x.mp3]）
+  - furigana 规则和 Anki 一致：[ ] 前面连续的非空白字符是 base，base 前的一个空格是分隔符，不输出
+  - 渲染器：plain()（TTS / 匹配用纯文本）、kana()（读音）、ruby_html()（<ruby>）、sounds()
+    tokens() 是参照实现；渲染器各用一个只匹配标记的正则，普通文本不产生 match，plain() 是纯删除（不走 Python 回调）
+  - 替代 tts / tts_minna_examples / add / fill_* / fix_supplement 里各自的正则链
+
+用法:
+  anki_text.plain(" 食[た]べます<br>[sound:a.mp3]")  # '食べます'
+  anki_text.kana(" 食[た]べます")                      # 'たべます'
+  anki_text.ruby_html(" 食[た]べます")                 # '<ruby>食<rt>た</rt></ruby>べます'
+  for kind, value in anki_text.tokens(field): ...
+"""
+import re
+
+TEXT = "text"
+RUBY_BASE = "ruby_base"
+RUBY_READING = "ruby_reading"
+TAG = "tag"
+SOUND = "sound"
+
+# ruby 在 text 前：同一位置先试 base[reading]，text 就不会把 base 吃掉；[sound:…] 不算读音
+TOKEN_RE = re.compile(r"""
+    (?P<sound>\[sound:(?P<file>[^\]]*)\])
+  | (?P<tag><[^>]*>)
+  | \ ?(?P<base>[^\s\[\]<>]+)\[(?!sound:)(?P<reading>[^\]]*)\]
+  | (?P<text>[^\s\[\]<>]+|\s|[\[\]<>])
+""", re.X)
+
+# 渲染器只匹配要去掉 / 替换的部分，普通文本原样跳过（切分规则和 TOKEN_RE 一致）
+# plain：删标签、sound、base 前的空格、base 后的 [reading] → 空串替换，整个在 C 里完成
+PLAIN_DROP_RE = re.compile(r"""
+    <[^>]*>
+  | \[sound:[^\]]*\]
+  | \ (?=[^\s\[\]<>]+\[(?!sound:)[^\]]*\])
+  | (?<=[^\s\[\]<>])\[(?!sound:)[^\]]*\]
+""", re.X)
+KANA_RE = re.compile(r"""
+    <[^>]*>
+  | \[sound:[^\]]*\]
+  | \ ?[^\s\[\]<>]+\[(?!sound:)(?P<reading>[^\]]*)\]
+""", re.X)
+RUBY_HTML_RE = re.compile(r"""
+    (?P<tag><[^>]*>)
+  | \[sound:[^\]]*\]
+  | \ ?(?P<base>[^\s\[\]<>]+)\[(?!sound:)(?P<reading>[^\]]*)\]
+""", re.X)
+
+
+def tokens(text):
+    """[(kind, value), …] in field order; a ruby yields RUBY_BASE then RUBY_READING."""
+    out = []
+    for m in TOKEN_RE.finditer(text):
+        kind = m.lastgroup
+        if kind == "text":
+            out.append((TEXT, m.group("text")))
+        elif kind == "reading":
+            out.append((RUBY_BASE, m.group("base")))
+            out.append((RUBY_READING, m.group("reading")))
+        elif kind == "tag":
+            out.append((TAG, m.group("tag")))
+        else:
+            out.append((SOUND, m.group("file")))
+    return out
+
+
+def plain(text):
+    """Text as read aloud: ruby bases kept, readings / HTML / sound refs dropped."""
+    return PLAIN_DROP_RE.sub("", text).strip()
+
+
+def kana(text):
+    """Like plain(), but ruby bases replaced by their readings."""
+    return KANA_RE.sub(r"\g<reading>", text).strip()
+
+
+def _ruby(m):
+    if m.lastgroup == "reading":
+        return f"<ruby>{m.group('base')}<rt>{m.group('reading')}</rt></ruby>"
+    return m.group("tag") or ""
+
+
+def ruby_html(text):
+    """HTML with <ruby> for furigana; tags kept, sound refs dropped."""
+    return RUBY_HTML_RE.sub(_ruby, text).strip()
+
+
+def sounds(text):
+    """Filenames of every [sound:…] in the field."""
+    return [m.group("file") for m in TOKEN_RE.finditer(text) if m.lastgroup == "sound"]
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+AnkiConnect 共享客户端 — 所有脚本统一 `from ankiconnect import anki`
+  - 每个线程复用一条 HTTP/1.1 keep-alive 连接（默认 localhost:8765）
+  - 对端关闭 / reset 空闲连接时自动重连并重发一次
+  - 若服务端每次响应后都断开（部分 AnkiConnect 版本如此），自动退化为
+    「每次请求新建连接」，不再白白多发一次
+  - Batch: 把互不依赖的 action 攒成 `multi` 请求，一次往返处理几十个
+  - iter_notes_info() / iter_cards_info(): 分块拉取的生成器，处理当前块时预取下一块，
+    内存只占两块，不再一次解析几 MB 的 JSON
+  - switch_profile(): loadProfile 后轮询 getActiveProfile，切换完成立即返回
+  - use_backend(): 改走 collection_backend（--direct，Anki 关闭时直接读写 collection）
+
+环境变量 ANKICONNECT_URL 可覆盖地址（如 benchmark / 本地替身）。
+"""
+import http.client
+import json
+import os
+import socket
+import threading
+import time
+import urllib.parse
+from concurrent.futures import Future, ThreadPoolExecutor
+
+ANKI_URL = os.environ.get("ANKICONNECT_URL", "http://localhost:8765")
+TIMEOUT = 120  # 秒；大批量 addNotes / storeMediaFile 可能较慢
+LEGACY_SETTLE = 3.0  # 无 getActiveProfile 时，指纹稳定多久算切换完成
+INFO_CHUNK = 200  # iter_notes_info / iter_cards_info 每次请求的条数
+
+# 对端在我们复用空闲连接时已关闭 → 请求根本没被处理，可安全重发
+# (RemoteDisconnected 是 ConnectionResetError 的子类)
+_STALE_ERRORS = (ConnectionResetError, ConnectionAbortedError, BrokenPipeError,
+                 http.client.CannotSendRequest)
+
+_local = threading.local()
+_keepalive = True  # 服务端是否真的保持连接；首次发现被关闭后置 False
+_backend = None  # 非 None 时 request() 不走 HTTP，交给 backend.request(payload)
+
+
+def _connect():
+    u = urllib.parse.urlsplit(ANKI_URL)
+    conn = http.client.HTTPConnection(u.hostname, u.port or 80, timeout=TIMEOUT)
+    conn.connect()
+    # 请求头和 body 分两次 send，关掉 Nagle 否则每次调用白等 ~40ms delayed-ACK
+    conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    _local.conn = conn
+    _local.url = ANKI_URL
+    _local.served = 0
+    return conn
+
+
+def close():
+    """Close this thread's connection (next call reconnects)."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+    _local.conn = None
+
+
+def _send(conn, body):
+    conn.request("POST", "/", body=body,
+                 headers={"Content-Type": "application/json",
+                          "Connection": "keep-alive"})
+    resp = conn.getresponse()
+    data = resp.read()
+    if resp.will_close:
+        close()
+    return data
+
+
+def post(body):
+    """POST raw JSON bytes to AnkiConnect, return raw response bytes."""
+    global _keepalive
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "url", None) != ANKI_URL:
+        close()
+        conn = _connect()
+    reused = _local.served > 0
+    try:
+        data = _send(conn, body)
+    except _STALE_ERRORS:
+        close()
+        if not reused:
+            raise
+        # 复用的连接已被服务端关闭：重连重发一次，并记住服务端不保持连接
+        _keepalive = False
+        conn = _connect()
+        data = _send(conn, body)
+    except Exception:
+        close()
+        raise
+    if _keepalive:
+        _local.served += 1
+    else:
+        close()
+    return data
+
+
+def use_backend(backend):
+    """Route request() / anki() / Batch to `backend.request(payload)`
+    (None → back to HTTP)."""
+    global _backend
+    _backend = backend
+
+
+def request(payload):
+    """POST one AnkiConnect payload dict, return the decoded response dict."""
+    if _backend is not None:
+        return _backend.request(payload)
+    return json.loads(post(json.dumps(payload).encode("utf-8")))
+
+
+def anki(action, **params):
+    r = request({"action": action, "version": 6, "params": params})
+    if r.get("error") and isinstance(r["error"], str):
+        raise Exception(r["error"])
+    return r.get("result")
+
+
+def _iter_chunks(action, key, ids, chunk):
+    ids = list(ids)
+    chunks = [ids[i:i + chunk] for i in range(0, len(ids), chunk)]
+    if _backend is not None or len(chunks) < 2:
+        # --direct 的 collection 不跨线程用；只有一块也没什么可预取
+        for part in chunks:
+            yield from anki(action, **{key: part})
+        return
+    # 调用方处理这一块时，另一个线程（自己的 keep-alive 连接）已经在拉下一块
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        ahead = pool.submit(anki, action, **{key: chunks[0]})
+        for part in chunks[1:]:
+            current, ahead = ahead, pool.submit(anki, action, **{key: part})
+            yield from current.result()
+        yield from ahead.result()
+
+
+def iter_notes_info(note_ids, chunk=INFO_CHUNK):
+    """notesInfo for `note_ids`, yielded one note at a time, `chunk` per request."""
+    return _iter_chunks("notesInfo", "notes", note_ids, chunk)
+
+
+def iter_cards_info(card_ids, chunk=INFO_CHUNK):
+    """cardsInfo for `card_ids`, yielded one card at a time, `chunk` per request."""
+    return _iter_chunks("cardsInfo", "cards", card_ids, chunk)
+
+
+def _backoff(timeout, first=0.05, cap=1.0):
+    """Yield once per attempt until `timeout` seconds pass, sleeping
+    exponentially longer (first → cap) between attempts."""
+    deadline = time.monotonic() + timeout
+    delay = first
+    while True:
+        yield
+        if time.monotonic() >= deadline:
+            return
+        time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+        delay = min(delay * 2, cap)
+
+
+def wait_for_anki(timeout=30):
+    """Poll until AnkiConnect answers `version`."""
+    for _ in _backoff(timeout):
+        try:
+            anki("version")
+            return True
+        except Exception:
+            close()
+    return False
+
+
+def _fingerprint():
+    """Collection identity for AnkiConnect builds without getActiveProfile:
+    the oldest note id differs between independently imported profiles."""
+    return min(anki("findNotes", query="deck:*") or [0])
+
+
+def switch_profile(name, timeout=60):
+    """Load profile `name` and return as soon as it is provably active.
+
+    Readiness is `getActiveProfile == name` plus the collection answering;
+    on older AnkiConnect builds it is the collection fingerprint changing (or
+    staying put for LEGACY_SETTLE seconds when the profile was already open).
+    Returns the switch latency in seconds, or None on timeout.
+    """
+    t0 = time.monotonic()
+    try:
+        if anki("getActiveProfile") == name:
+            return 0.0
+        legacy = None
+    except Exception:
+        try:
+            legacy = _fingerprint()
+        except Exception:
+            legacy = 0
+    try:
+        anki("loadProfile", name=name)
+    except Exception:
+        close()  # loadProfile 期间连接经常被 reset，下面轮询确认
+    unchanged = None
+    for _ in _backoff(timeout, cap=0.5):
+        try:
+            if legacy is None:
+                if anki("getActiveProfile") == name:
+                    anki("deckNames")  # collection 已打开
+                    return time.monotonic() - t0
+                continue
+            fp = _fingerprint()
+            if fp != legacy:
+                return time.monotonic() - t0
+            unchanged = unchanged or time.monotonic()
+            if time.monotonic() - unchanged >= LEGACY_SETTLE:
+                return time.monotonic() - t0
+        except Exception:
+            close()
+            unchanged = None
+    return None
+
+
+def unpack_multi(results, n):
+    """Split a v6 `multi` result list into n plain results / Exception objects."""
+    out = []
+    for i in range(n):
+        item = results[i] if i < len(results) else {"error": "missing multi result"}
+        if isinstance(item, dict) and item.get("error"):
+            out.append(Exception(item["error"]))
+        else:
+            out.append(item.get("result") if isinstance(item, dict) else item)
+    return out
+
+
+class Batch:
+    """Queue independent actions and send them together as `multi` requests.
+
+    A batch is flushed when it reaches max_size actions, when max_delay
+    seconds have passed since the first queued action, or on exit. Every
+    submit() returns its own Future, resolved with that action's result or
+    failed with that action's own error.
+
+        with Batch(max_size=50) as batch:
+            futs = [batch.submit("storeMediaFile", filename=f, data=b) for ...]
+        ok = sum(1 for f in futs if not f.exception())
+    """
+
+    def __init__(self, max_size=50, max_delay=1.0):
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.round_trips = 0
+        self.submitted = 0
+        self._queue = []
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def submit(self, action, **params):
+        fut = Future()
+        with self._lock:
+            self._queue.append((fut, {"action": action, "version": 6, "params": params}))
+            self.submitted += 1
+            full = len(self._queue) >= self.max_size
+            if not full and self._timer is None and self.max_delay is not None:
+                self._timer = threading.Timer(self.max_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+        return fut
+
+    def flush(self):
+        with self._lock:
+            pending, self._queue = self._queue, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return
+        self.round_trips += 1
+        try:
+            r = request({"action": "multi", "version": 6,
+                         "params": {"actions": [a for _, a in pending]}})
+            if r.get("error"):
+                raise Exception(r["error"])
+            results = r.get("result") or []
+        except Exception as e:
+            for fut, _ in pending:
+                fut.set_exception(e)
+            return
+        for (fut, _), item in zip(pending, unpack_multi(results, len(pending))):
+            if isinstance(item, Exception):
+                fut.set_exception(item)
+            else:
+                fut.set_result(item)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+AnkiConnect asyncio 客户端 — 与 `ankiconnect.anki()` 相同的 action 接口
+  - 最多 limit 个请求同时在途（Semaphore），保护 collection 不被并发写爆
+  - 每个在途请求占一条 keep-alive 连接，用完放回连接池
+  - run_bounded() 按需创建协程，在途数量有上限（生产者有背压）
+
+用法:
+  async with AsyncAnki(limit=4) as client:
+      await client.anki("updateNoteFields", note={...})
+      results = await run_bounded((client.anki(...) for ...), limit=8)
+"""
+import asyncio
+import json
+import os
+import sys
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import ankiconnect
+from ankiconnect import unpack_multi
+
+DEFAULT_LIMIT = 4
+
+
+class AsyncAnki:
+    def __init__(self, limit=DEFAULT_LIMIT):
+        self.limit = limit
+        self.requests = 0
+        self._sem = asyncio.Semaphore(limit)
+        self._idle = []  # [(reader, writer)]
+        self._keepalive = True
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+    async def _open(self):
+        u = urllib.parse.urlsplit(ankiconnect.ANKI_URL)
+        return await asyncio.open_connection(u.hostname, u.port or 80)
+
+    async def _roundtrip(self, reader, writer, body):
+        u = urllib.parse.urlsplit(ankiconnect.ANKI_URL)
+        head = (f"POST / HTTP/1.1\r\nHost: {u.netloc}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+        status = await reader.readline()
+        if not status:
+            raise ConnectionResetError("AnkiConnect closed the connection")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            k, _, v = line.decode("latin-1").partition(":")
+            headers[k.strip().lower()] = v.strip()
+        if "content-length" in headers:
+            data = await reader.readexactly(int(headers["content-length"]))
+            reusable = headers.get("connection", "").lower() != "close"
+        else:
+            data = await reader.read()
+            reusable = False
+        return data, reusable
+
+    async def post(self, body):
+        """POST raw JSON bytes, return raw response bytes."""
+        async with self._sem:
+            self.requests += 1
+            reused = bool(self._idle)
+            reader, writer = self._idle.pop() if reused else await self._open()
+            try:
+                data, reusable = await self._roundtrip(reader, writer, body)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if not reused:
+                    raise
+                # 复用的空闲连接已被服务端关闭：换新连接重发一次
+                self._keepalive = False
+                reader, writer = await self._open()
+                try:
+                    data, reusable = await self._roundtrip(reader, writer, body)
+                except Exception:
+                    writer.close()
+                    raise
+            except Exception:
+                writer.close()
+                raise
+            if reusable and self._keepalive:
+                self._idle.append((reader, writer))
+            else:
+                writer.close()
+            return data
+
+    async def request(self, payload):
+        if ankiconnect._backend is not None:
+            self.requests += 1
+            return ankiconnect._backend.request(payload)
+        return json.loads(await self.post(json.dumps(payload).encode("utf-8")))
+
+    async def anki(self, action, **params):
+        r = await self.request({"action": action, "version": 6, "params": params})
+        if r.get("error") and isinstance(r["error"], str):
+            raise Exception(r["error"])
+        return r.get("result")
+
+    async def multi(self, actions):
+        """actions: [(action, params)] → list of results / Exception objects"""
+        results = await self.anki("multi", actions=[
+            {"action": a, "version": 6, "params": p} for a, p in actions])
+        return unpack_multi(results or [], len(actions))
+
+
+async def run_bounded(aws, limit=DEFAULT_LIMIT * 2):
+    """Await coroutines from an iterable with at most `limit` pending at once.
+
+    Coroutines are pulled from `aws` lazily, so a generator that builds large
+    payloads (base64 media) only runs `limit` steps ahead. Returns results in
+    input order; failures are returned as Exception objects.
+    """
+    results = {}
+    pending = {}
+    i = 0
+    for aw in aws:
+        if len(pending) >= limit:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                results[pending.pop(t)] = t.exception() or t.result()
+        pending[asyncio.ensure_future(aw)] = i
+        i += 1
+    if pending:
+        await asyncio.wait(pending)
+        for t, idx in pending.items():
+            results[idx] = t.exception() or t.result()
+    return [results[k] for k in range(i)]
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+流式读取 .apkg — 内存占用与牌组大小无关
+  - collection 分块拷到私有临时文件（mkstemp, 0600），SQLite 只读 URI 打开
+  - iter_notes() 是生成器，游标逐行读取，不一次性 fetchall
+  - 媒体按需逐个读取（read_media / open_media），zip 不整体解压
+
+用法:
+  with ApkgReader("blank.apkg") as apkg:
+      for nid, did, fields in apkg.iter_notes():
+          ...
+      for num, filename in apkg.media_map().items():
+          data = apkg.read_media(num)
+"""
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import urllib.parse
+import zipfile
+
+COPY_CHUNK = 1024 * 1024
+# collection.anki21b 是 zstd 压缩的新格式，需要 Anki 导出时勾选「兼容旧版本」
+COLLECTION_NAMES = ["collection.anki21", "collection.anki2"]
+
+
+class ApkgReader:
+    def __init__(self, path):
+        self.path = path
+        self.zf = zipfile.ZipFile(path, "r")
+        self._tmp = None
+        self.db = None
+        try:
+            self._open_collection()
+        except Exception:
+            self.close()
+            raise
+
+    def _open_collection(self):
+        names = set(self.zf.namelist())
+        entry = next((n for n in COLLECTION_NAMES if n in names), None)
+        if entry is None:
+            raise Exception(f"{self.path}: 没有 collection.anki21 / collection.anki2"
+                            "（anki21b 格式请用「兼容旧版本」重新导出）")
+        fd, self._tmp = tempfile.mkstemp(suffix=".anki2")
+        with os.fdopen(fd, "wb") as out, self.zf.open(entry) as src:
+            shutil.copyfileobj(src, out, COPY_CHUNK)
+        uri = "file:" + urllib.parse.quote(self._tmp) + "?mode=ro"
+        self.db = sqlite3.connect(uri, uri=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close_collection(self):
+        """Drop the temp collection once notes are read (media stay readable)."""
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+        if self._tmp is not None:
+            os.unlink(self._tmp)
+            self._tmp = None
+
+    def close(self):
+        self.close_collection()
+        self.zf.close()
+
+    # ── collection ───────────────────────────────────
+    def models(self):
+        """mid → [field names in order]"""
+        raw = json.loads(self.db.execute("SELECT models FROM col").fetchone()[0])
+        return {int(mid): [f["name"] for f in sorted(m["flds"], key=lambda f: f["ord"])]
+                for mid, m in raw.items()}
+
+    def decks(self):
+        """did → deck name"""
+        raw = json.loads(self.db.execute("SELECT decks FROM col").fetchone()[0])
+        return {int(did): d["name"] for did, d in raw.items()}
+
+    def iter_notes(self):
+        """Yield (nid, did of the note's first card, {field: value}) lazily."""
+        fields_of = self.models()
+        cur = self.db.execute(
+            "SELECT n.id, n.mid, n.flds,"
+            " (SELECT c.did FROM cards c WHERE c.nid = n.id ORDER BY c.ord LIMIT 1)"
+            " FROM notes n ORDER BY n.id")
+        for nid, mid, flds, did in cur:
+            names = fields_of.get(mid, [])
+            values = flds.split("\x1f")
+            yield nid, did or 0, {name: (values[i] if i < len(values) else "")
+                                  for i, name in enumerate(names)}
+
+    # ── media ────────────────────────────────────────
+    def media_map(self):
+        """zip entry name ("0", "1", …) → media filename"""
+        return json.loads(self.zf.read("media"))
+
+    def has_media(self, num):
+        return num in self.zf.NameToInfo
+
+    def open_media(self, num):
+        """File-like stream for one media entry."""
+        return self.zf.open(num)
+
+    def read_media(self, num):
+        with self.zf.open(num) as f:
+            return f.read()
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+写 .apkg — 整个牌组打成一个包，每个 Profile 只要一次 importPackage
+  - 直接用 sqlite3 写 schema 11 的 collection.anki2（Anki 2.1 / 23.x / 24.x 都能导入），不依赖 anki 库
+  - 笔记沿用 addNotes 的格式（deckName / modelName / fields / tags），guid 由稳定 key 算出：
+    同一个单词 / 语法点每次打包 guid 相同，重复导入是更新而不是再加一份
+  - note / card / deck / model id 也由 key 算出，同样的输入得到同样的包
+  - model 可以传 Profile 里已有的 id 和字段顺序，导入时并到现有笔记类型，不会生成「xxx+」
+  - model mod = 0：导入不会覆盖 Profile 里改过的模板 / CSS（这些仍由 ensure_model / update_theme 管）
+  - 媒体按需从 opener 流式读进 zip，不整体载入内存
+
+⚠ importPackage 由 Anki 按路径读文件，AnkiConnect 必须在本机（同 media_stage.by_path()）
+
+用法:
+  w = ApkgWriter()
+  w.add_model("文法認識", fields, [{"Name": "認識", "Front": ..., "Back": ...}], css, model_id=mid)
+  w.add_note(note, guid_for("gid", "L1-1"), suspend=[1])   # note = addNotes 条目；suspend = 挂起的模板 ord
+  w.add_media("a.mp3", lambda: open(path, "rb"))
+  w.write("out.apkg")              # 或 import_package(w, "grammar") 直接导入当前 Profile
+
+  python3 anki/apkg_writer.py --vocab 単語.apkg      # blank.apkg + examples/*.json → 単語包
+  python3 anki/apkg_writer.py --grammar 文法.apkg    # grammar_data.json + grammar_quiz.json → 文法包
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ankiconnect import anki
+import media_stage
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+COPY_CHUNK = 1024 * 1024
+# genanki 同款 base91 字母表，guid 长度 / 字符集和 Anki 自己生成的一致
+GUID_CHARS = ("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+              "!#$%&()*+,-./:;<=>?@[]^_`{|}~")
+# 由 key 算出的 id 落在 2014 年的毫秒时间戳区间，不会和 Anki 按当前时间生成的 id 撞
+ID_BASE = 1_400_000_000_000
+ID_SPAN = 100_000_000_000
+
+_STRIP_RE = re.compile(r"<[^>]*>|\[sound:[^\]]*\]")
+
+SCHEMA = """
+CREATE TABLE col (id integer primary key, crt integer not null, mod integer not null,
+    scm integer not null, ver integer not null, dty integer not null, usn integer not null,
+    ls integer not null, conf text not null, models text not null, decks text not null,
+    dconf text not null, tags text not null);
+CREATE TABLE notes (id integer primary key, guid text not null, mid integer not null,
+    mod integer not null, usn integer not null, tags text not null, flds text not null,
+    sfld integer not null, csum integer not null, flags integer not null, data text not null);
+CREATE TABLE cards (id integer primary key, nid integer not null, did integer not null,
+    ord integer not null, mod integer not null, usn integer not null, type integer not null,
+    queue integer not null, due integer not null, ivl integer not null, factor integer not null,
+    reps integer not null, lapses integer not null, left integer not null, odue integer not null,
+    odid integer not null, flags integer not null, data text not null);
+CREATE TABLE revlog (id integer primary key, cid integer not null, usn integer not null,
+    ease integer not null, ivl integer not null, lastIvl integer not null, factor integer not null,
+    time integer not null, type integer not null);
+CREATE TABLE graves (usn integer not null, oid integer not null, type integer not null);
+CREATE INDEX ix_notes_usn ON notes (usn);
+CREATE INDEX ix_cards_usn ON cards (usn);
+CREATE INDEX ix_revlog_usn ON revlog (usn);
+CREATE INDEX ix_cards_nid ON cards (nid);
+CREATE INDEX ix_cards_sched ON cards (did, queue, due);
+CREATE INDEX ix_revlog_cid ON revlog (cid);
+CREATE INDEX ix_notes_csum ON notes (csum);
+"""
+
+DEFAULT_DCONF = {
+    "id": 1, "name": "Default", "mod": 0, "usn": 0, "maxTaken": 60, "autoplay": True,
+    "timer": 0, "replayq": True, "dyn": False,
+    "new": {"delays": [1, 10], "ints": [1, 4, 0], "initialFactor": 2500, "order": 1,
+            "perDay": 20, "bury": False, "separate": True},
+    "rev": {"perDay": 200, "ease4": 1.3, "ivlFct": 1, "maxIvl": 36500, "bury": False,
+            "fuzz": 0.05, "minSpace": 1},
+    "lapse": {"delays": [10], "mult": 0, "minInt": 1, "leechFails": 8, "leechAction": 1},
+}
+
+
+def guid_for(*parts):
+    """Stable note guid for a key such as ("vocab", apkg_nid) or ("gid", "L1-1")."""
+    digest = hashlib.sha256("\x1f".join(map(str, parts)).encode("utf-8")).digest()
+    n = int.from_bytes(digest[:8], "big")
+    out = ""
+    while n:
+        n, r = divmod(n, len(GUID_CHARS))
+        out = GUID_CHARS[r] + out
+    return out or GUID_CHARS[0]
+
+
+def stable_id(*parts):
+    """Stable 13-digit id (ms-timestamp sized) for a note / card / deck / model key."""
+    digest = hashlib.sha1("\x1f".join(map(str, parts)).encode("utf-8")).hexdigest()
+    return ID_BASE + int(digest[:15], 16) % ID_SPAN
+
+
+class ApkgWriter:
+    def __init__(self):
+        self.now = int(time.time())
+        self.models = {}  # name → legacy model dict
+        self.decks = {1: self._deck(1, "Default")}
+        self.deck_ids = {"Default": 1}
+        self.notes = []   # notes table rows
+        self.cards = []   # cards table rows
+        self.guids = set()
+        self.media = {}   # filename → opener
+
+    # ── models / decks ───────────────────────────────
+    def add_model(self, name, fields, templates, css="", model_id=None):
+        """Register a standard note type. templates: [{"Name", "Front", "Back"}] as for
+        createModel; model_id / fields: pass the Profile's to merge into its note type."""
+        mid = int(model_id) if model_id else stable_id("model", name)
+        self.models[name] = {
+            "id": mid, "name": name, "type": 0, "mod": 0, "usn": -1, "sortf": 0, "did": 1,
+            "flds": [{"name": f, "ord": i, "sticky": False, "rtl": False, "font": "Arial",
+                      "size": 20, "media": []} for i, f in enumerate(fields)],
+            "tmpls": [{"name": t["Name"], "ord": i, "qfmt": t["Front"], "afmt": t["Back"],
+                       "did": None, "bqfmt": "", "bafmt": ""} for i, t in enumerate(templates)],
+            "css": css, "latexPre": "", "latexPost": "", "latexsvg": False,
+            "req": [[i, "any", [0]] for i in range(len(templates))],
+            "tags": [], "vers": [],
+        }
+        return mid
+
+    def _deck(self, did, name):
+        return {"id": did, "name": name, "desc": "", "dyn": 0, "conf": 1, "usn": -1,
+                "mod": self.now, "collapsed": False, "browserCollapsed": False,
+                "extendNew": 0, "extendRev": 0, "newToday": [0, 0], "revToday": [0, 0],
+                "lrnToday": [0, 0], "timeToday": [0, 0]}
+
+    def deck_id(self, name):
+        """Deck id for `name`, registering it and its parent decks."""
+        if name not in self.deck_ids:
+            if "::" in name:
+                self.deck_id(name.rsplit("::", 1)[0])
+            did = stable_id("deck", name)
+            self.deck_ids[name] = did
+            self.decks[did] = self._deck(did, name)
+        return self.deck_ids[name]
+
+    # ── notes / media ────────────────────────────────
+    def add_note(self, note, guid, suspend=()):
+        """Add one addNotes-style note; one new card per template, ords in `suspend`
+        start suspended. Returns the note id used inside the package."""
+        model = self.models.get(note["modelName"])
+        if model is None:
+            raise Exception(f"model was not found: {note['modelName']}")
+        if guid in self.guids:
+            raise Exception(f"duplicate guid {guid} ({note['modelName']})")
+        names = [f["name"] for f in model["flds"]]
+        unknown = set(note["fields"]) - set(names)
+        if unknown:
+            raise Exception(f"{note['modelName']} has no field {', '.join(sorted(unknown))}")
+        values = [note["fields"].get(name, "") for name in names]
+        sort_field = _STRIP_RE.sub("", values[0])
+        nid = stable_id("note", guid)
+        tags = note.get("tags") or []
+        self.notes.append((
+            nid, guid, model["id"], self.now, -1,
+            f" {' '.join(tags)} " if tags else "", "\x1f".join(values), sort_field,
+            int(hashlib.sha1(sort_field.encode("utf-8")).hexdigest()[:8], 16), 0, ""))
+        self.guids.add(guid)
+        did = self.deck_id(note["deckName"])
+        due = len(self.notes)
+        for t in model["tmpls"]:
+            queue = -1 if t["ord"] in suspend else 0
+            self.cards.append((stable_id("card", guid, t["ord"]), nid, did, t["ord"], self.now, -1,
+                               0, queue, due, 0, 0, 0, 0, 0, 0, 0, 0, ""))
+        return nid
+
+    def add_media(self, filename, opener):
+        """opener() → readable binary stream; read only when the package is written."""
+        self.media[filename] = opener
+
+    # ── output ───────────────────────────────────────
+    def _collection(self, path):
+        db = sqlite3.connect(path)
+        db.executescript(SCHEMA)
+        first_model = next(iter(self.models.values()), {"id": 0})["id"]
+        conf = {"nextPos": len(self.notes) + 1, "estTimes": True, "activeDecks": [1],
+                "sortType": "noteFld", "timeLim": 0, "sortBackwards": False, "addToCur": True,
+                "curDeck": 1, "newSpread": 0, "dueCounts": True, "curModel": str(first_model),
+                "collapseTime": 1200}
+        db.execute("INSERT INTO col VALUES (1, ?, ?, ?, 11, 0, 0, 0, ?, ?, ?, ?, '{}')", (
+            self.now, self.now * 1000, self.now * 1000, json.dumps(conf),
+            json.dumps({str(m["id"]): m for m in self.models.values()}, ensure_ascii=False),
+            json.dumps({str(did): d for did, d in self.decks.items()}, ensure_ascii=False),
+            json.dumps({"1": DEFAULT_DCONF})))
+        db.executemany("INSERT INTO notes VALUES (?,?,?,?,?,?,?,?,?,?,?)", self.notes)
+        db.executemany("INSERT INTO cards VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", self.cards)
+        db.commit()
+        db.close()
+
+    def write(self, path):
+        """Write the .apkg (atomically: temp file + rename). Returns its size in bytes."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        fd, col_path = tempfile.mkstemp(suffix=".anki2")
+        os.close(fd)
+        os.unlink(col_path)
+        tmp = path + ".tmp"
+        try:
+            self._collection(col_path)
+            with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zf:
+                zf.write(col_path, "collection.anki2")
+                media_map = {}
+                for num, (name, opener) in enumerate(sorted(self.media.items())):
+                    # 音频本身已压缩，不再 deflate
+                    with opener() as src, zf.open(zipfile.ZipInfo(str(num)), "w") as dst:
+                        shutil.copyfileobj(src, dst, COPY_CHUNK)
+                    media_map[str(num)] = name
+                zf.writestr("media", json.dumps(media_map, ensure_ascii=False))
+            os.replace(tmp, path)
+        finally:
+            for p in (col_path, tmp):
+                if os.path.exists(p):
+                    os.unlink(p)
+        return os.path.getsize(path)
+
+    def summary(self):
+        return f"{len(self.notes)} 条笔记, {len(self.cards)} 张卡片, {len(self.media)} 个媒体"
+
+
+def can_import():
+    """importPackage hands Anki a local path — only possible when Anki runs here."""
+    return media_stage.by_path()
+
+
+def import_package(writer, name):
+    """Write `writer` to .cache/<name>.apkg, importPackage it into the current
+    Profile, delete the file. Returns seconds spent in importPackage."""
+    path = os.path.join(CACHE_DIR, f"{name}.apkg")
+    writer.write(path)
+    try:
+        t0 = time.perf_counter()
+        anki("importPackage", path=path)
+        return time.perf_counter() - t0
+    finally:
+        os.unlink(path)
+
+
+# ── standalone packages ──────────────────────────────
+
+def vocab_package(examples=None):
+    """blank.apkg (+ examples/*.json) → ApkgWriter for the vocab deck."""
+    import import_apkg
+    from fill_minna_examples import load_examples
+    examples = load_examples(verbose=False) if examples is None else examples
+    notes, media_map, apkg = import_apkg.extract_apkg()
+    w = ApkgWriter()
+    w.add_model(import_apkg.MODEL, import_apkg.MODEL_FIELDS, import_apkg.TEMPLATES, import_apkg.CSS)
+    for note in notes:
+        w.add_note(import_apkg.build_note(note, examples), import_apkg.note_guid(note), suspend=[1])
+    for num, name in media_map.items():
+        if apkg.has_media(num):
+            w.add_media(name, lambda num=num: apkg.open_media(num))
+    return w, apkg
+
+
+def grammar_package():
+    """grammar_data.json + grammar_quiz.json → ApkgWriter for the grammar deck."""
+    import create_grammar_deck as g
+    with open(g.GRAMMAR_DATA, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    quizzes = []
+    if os.path.exists(g.GRAMMAR_QUIZ):
+        with open(g.GRAMMAR_QUIZ, "r", encoding="utf-8") as f:
+            quizzes = json.load(f)
+    w = ApkgWriter()
+    for name, (fields, templates) in g.MODELS.items():
+        w.add_model(name, fields, templates, g.CSS)
+    for note in g.build_ninshiki_notes(data) + g.build_sentaku_notes(quizzes):
+        w.add_note(note, g.note_guid(note))
+    return w
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成可直接导入的 .apkg")
+    parser.add_argument("--vocab", metavar="OUT", help="単語牌组（blank.apkg + 例句）")
+    parser.add_argument("--grammar", metavar="OUT", help="文法牌组（認識 + 選択）")
+    args = parser.parse_args()
+    if not args.vocab and not args.grammar:
+        parser.error("需要 --vocab 和 / 或 --grammar")
+
+    if args.vocab:
+        t0 = time.perf_counter()
+        w, apkg = vocab_package()
+        size = w.write(args.vocab)
+        apkg.close()
+        print(f"✓ {args.vocab}: {w.summary()}, {size / 1024 / 1024:.1f} MB "
+              f"({time.perf_counter() - t0:.1f}s)")
+    if args.grammar:
+        t0 = time.perf_counter()
+        w = grammar_package()
+        size = w.write(args.grammar)
+        print(f"✓ {args.grammar}: {w.summary()}, {size / 1024:.0f} KB "
+              f"({time.perf_counter() - t0:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+TTS 音频压缩 — 合成出的 WAV 转成 Opus / MP3 再上传
+  - VOICEVOX 输出 24kHz 16bit 单声道 WAV，base64 后再 +33%；
+    32kbps 的 MP3 / Opus 通常只有 WAV 的 1/10 左右，媒体文件夹和 AnkiWeb 同步都更小
+  - 编码器用 ffmpeg（PATH 里找）；没装 ffmpeg 时提示一次，退回原样 WAV
+  - TTS_FORMAT=mp3 / opus / wav（默认 mp3：AnkiMobile / iOS 网页音频都能播）
+  - TTS_BITRATE 默认 32k（语音足够）
+  - 文件名扩展名跟着实际格式走（extension()），字段里的引用自然一致
+
+用法:
+  fname = f"tts_word_{h}.{audio_encode.extension()}"
+  data = audio_encode.encode(wav)
+"""
+import os
+import shutil
+import subprocess
+import threading
+
+FORMAT = os.environ.get("TTS_FORMAT", "mp3").lower()
+BITRATE = os.environ.get("TTS_BITRATE", "32k")
+
+# format → (ffmpeg codec, ffmpeg muxer, 文件扩展名)
+CODECS = {
+    "mp3": ("libmp3lame", "mp3", "mp3"),
+    "opus": ("libopus", "ogg", "opus"),
+}
+
+_format = None
+_lock = threading.Lock()
+
+
+def ffmpeg():
+    return shutil.which("ffmpeg")
+
+
+def output_format():
+    """The format encode() actually produces: FORMAT, or "wav" without ffmpeg."""
+    global _format
+    with _lock:
+        if _format is None:
+            if FORMAT == "wav":
+                _format = "wav"
+            elif FORMAT not in CODECS:
+                raise Exception(f"TTS_FORMAT={FORMAT} 不支持（可选 mp3 / opus / wav）")
+            elif ffmpeg() is None:
+                print(f"  ! 未找到 ffmpeg，TTS 音频保存为 WAV（装 ffmpeg 后自动用 {FORMAT}）")
+                _format = "wav"
+            else:
+                _format = FORMAT
+        return _format
+
+
+def extension():
+    fmt = output_format()
+    return "wav" if fmt == "wav" else CODECS[fmt][2]
+
+
+def encode(wav):
+    """WAV bytes → bytes in output_format()."""
+    fmt = output_format()
+    if fmt == "wav":
+        return wav
+    codec, muxer, _ = CODECS[fmt]
+    proc = subprocess.run(
+        [ffmpeg(), "-hide_banner", "-loglevel", "error", "-f", "wav", "-i", "pipe:0",
+         "-ac", "1", "-c:a", codec, "-b:a", BITRATE, "-f", muxer, "pipe:1"],
+        input=wav, capture_output=True)
+    if proc.returncode != 0 or not proc.stdout:
+        err = proc.stderr.decode("utf-8", "replace").strip().splitlines()
+        raise Exception(f"ffmpeg {fmt} 编码失败: {err[-1] if err else proc.returncode}")
+    return proc.stdout
+
+
+def describe():
+    fmt = output_format()
+    return "WAV" if fmt == "wav" else f"{fmt} {BITRATE}"
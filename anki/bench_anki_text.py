@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+字段清洗 benchmark — 旧版各脚本的正则链 vs anki_text 单次扫描
+
+数据：blank.apkg 全部笔记的全部字段（或 --profile：当前 Profile 的単語牌组），不需要 VOICEVOX。
+每个旧版清洗函数跑一遍全部字段，和替换它的新函数（anki_text.plain()，例句匹配用
+fill_minna_examples.example_key()）比耗时，并数输出不同的字段；最后汇总有多少字段
+至少一个旧清洗和新函数结果不同。
+
+用法:
+  python3 anki/bench_anki_text.py                 # anki/blank.apkg
+  python3 anki/bench_anki_text.py --apkg other.apkg -r 20
+  python3 anki/bench_anki_text.py --profile       # 从打开的 Anki 读
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fill_minna_examples import example_key
+import anki_text
+
+APKG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "blank.apkg")
+DECKS = ["みんなの日本語初级1-2 単語", "補充単語"]
+
+
+# ── 旧版（替换前原样保留，只用于对比）────────────────────
+
+def legacy_tts_clean_text(text):
+    text = re.sub(r"<[^>]+>", "", text)
+    text = re.sub(r"\[([^\]]*)\]", "", text)
+    text = re.sub(r"\[sound:[^\]]+\]", "", text)
+    return text.strip()
+
+
+def legacy_clean_for_tts(text):
+    text = re.sub(r"<[^>]+>", "", text)
+    text = re.sub(r" (\S+)\[([^\]]+)\]", r"\1", text)
+    text = re.sub(r"\[([^\]]*)\]", "", text)
+    text = re.sub(r"\[sound:[^\]]+\]", "", text)
+    return text.strip()
+
+
+def legacy_add_clean_tts(text):
+    clean = re.sub(r"<[^>]+>", "", text)
+    clean = re.sub(r" (\S+)\[([^\]]+)\]", r"\1", clean)
+    clean = re.sub(r"\[([^\]]*)\]", "", clean)
+    return clean.strip()
+
+
+def legacy_fill_minna_strip(text):
+    text = re.sub(r"\[[^\]]+\]", "", text)
+    text = text.replace(" ", "")
+    return text.strip()
+
+
+def legacy_fill_translations_strip(text):
+    return re.sub(r" ?(\S+)\[([^\]]+)\]", r"\1", text).strip()
+
+
+# (旧函数名, 旧实现, 现在替代它的函数)
+LEGACY = [
+    ("tts.clean_text", legacy_tts_clean_text, anki_text.plain),
+    ("tts_minna_examples.clean_for_tts", legacy_clean_for_tts, anki_text.plain),
+    ("add._clean_tts", legacy_add_clean_tts, anki_text.plain),
+    ("fill_minna_examples.strip_furigana", legacy_fill_minna_strip, example_key),
+    ("fill_translations.strip_furigana", legacy_fill_translations_strip, anki_text.plain),
+]
+
+
+def load_fields(apkg=None):
+    if apkg:
+        from apkg_reader import ApkgReader
+        with ApkgReader(apkg) as reader:
+            notes = [fields for _, _, fields in reader.iter_notes()]
+    else:
+        from ankiconnect import anki, iter_notes_info
+        import anki_query
+        nids = anki("findNotes", query=anki_query.any_of(*(anki_query.deck(d) for d in DECKS)))
+        notes = [{k: v["value"] for k, v in n["fields"].items()}
+                 for n in iter_notes_info(nids) if n]
+    return len(notes), [v for fields in notes for v in fields.values() if v]
+
+
+def run(fn, fields, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for f in fields:
+            fn(f)
+    return (time.perf_counter() - t0) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Anki field cleaner benchmark")
+    parser.add_argument("--apkg", default=APKG, help="数据来源 .apkg")
+    parser.add_argument("--profile", action="store_true", help="从当前 Profile 读")
+    parser.add_argument("-r", "--repeat", type=int, default=10, help="重复次数")
+    args = parser.parse_args()
+
+    n_notes, fields = load_fields(None if args.profile else args.apkg)
+    print(f"{n_notes} 条笔记，{len(fields)} 个非空字段，每项跑 {args.repeat} 遍\n")
+
+    timings = {fn: run(fn, fields, args.repeat) for fn in (anki_text.plain, example_key)}
+    print(f"  {'anki_text.plain':36s} {timings[anki_text.plain] * 1000:8.1f}ms")
+    print(f"  {'fill_minna_examples.example_key':36s} {timings[example_key] * 1000:8.1f}ms")
+    differ = set()
+    for name, fn, repl in LEGACY:
+        t = run(fn, fields, args.repeat)
+        base = timings[repl]
+        diffs = [(i, fn(f), repl(f)) for i, f in enumerate(fields) if fn(f) != repl(f)]
+        differ.update(i for i, _, _ in diffs)
+        print(f"  {name:36s} {t * 1000:8.1f}ms  ×{t / base:4.1f}  "
+              f"输出不同 {len(diffs)} 个字段 ({len(diffs) / len(fields):.2%})")
+        for i, old, p in diffs[:2]:
+            print(f"      {fields[i][:40]!r}: {old[:30]!r} → {p[:30]!r}")
+    print(f"\n  至少一个旧清洗输出不同: {len(differ)} / {len(fields)} 个字段 "
+          f"({len(differ) / len(fields):.2%})\n")
+    for name, fn in [("anki_text.kana", anki_text.kana), ("anki_text.ruby_html", anki_text.ruby_html),
+                     ("anki_text.tokens", anki_text.tokens)]:
+        print(f"  {name:36s} {run(fn, fields, args.repeat) * 1000:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+AnkiConnect 客户端 benchmark — 旧版 urllib 每次新建连接 vs ankiconnect 共享连接
+
+在进程内起 anki_emulator（离线 AnkiConnect 替身），不需要打开 Anki；
+除了 version，再比一组真实读请求（findNotes + notesInfo，逐条 vs 分块）。
+
+用法:
+  python3 anki/bench_ankiconnect.py              # 默认 2000 次调用
+  python3 anki/bench_ankiconnect.py -n 5000
+  python3 anki/bench_ankiconnect.py --close      # 替身每次响应后断开（模拟旧版 AnkiConnect）
+  python3 anki/bench_ankiconnect.py --latency 2  # 每个请求加 2ms 处理延迟
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import ankiconnect
+import anki_emulator
+
+DECK = "bench"
+NOTES = 500  # 读请求 benchmark 的笔记数
+
+
+def legacy_anki(url, action, **params):
+    """Baseline: the per-script helper every script used to copy."""
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+    payload = json.dumps({"action": action, "version": 6, "params": params})
+    req = urllib.request.Request(url, data=payload.encode("utf-8"),
+                                 headers={"Content-Type": "application/json"})
+    r = json.loads(opener.open(req).read())
+    if r.get("error") and isinstance(r["error"], str):
+        raise Exception(r["error"])
+    return r.get("result")
+
+
+def run(label, fn, n):
+    fn()  # warm-up
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    dt = time.perf_counter() - t0
+    print(f"  {label:<24} {n / dt:>9.0f} calls/s  ({dt * 1000 / n:.3f} ms/call)")
+    return n / dt
+
+
+def seed(n):
+    ankiconnect.anki("createDeck", deck=DECK)
+    ankiconnect.anki("addNotes", notes=[
+        {"deckName": DECK, "modelName": "Basic", "fields": {"Front": f"word{i}", "Back": f"意味{i}"}}
+        for i in range(n)])
+
+
+def read_per_note(url):
+    for nid in legacy_anki(url, "findNotes", query=f'"deck:{DECK}"'):
+        legacy_anki(url, "notesInfo", notes=[nid])
+
+
+def read_chunked():
+    nids = ankiconnect.anki("findNotes", query=f'"deck:{DECK}"')
+    for _ in ankiconnect.iter_notes_info(nids):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AnkiConnect client benchmark")
+    parser.add_argument("-n", type=int, default=2000, help="调用次数")
+    parser.add_argument("--close", action="store_true", help="替身每次响应后断开连接")
+    parser.add_argument("--latency", type=float, default=0, help="替身每个请求的处理延迟（毫秒）")
+    args = parser.parse_args()
+
+    with anki_emulator.serve(close_each=args.close, latency=args.latency / 1000) as url:
+        ankiconnect.ANKI_URL = url
+        mode = "close-per-response" if args.close else "keep-alive"
+        print(f"AnkiConnect emulator: {url} ({mode}, {args.latency:g}ms/request), {args.n} × version")
+        before = run("urllib (per-call conn)", lambda: legacy_anki(url, "version"), args.n)
+        after = run("ankiconnect (shared)", lambda: ankiconnect.anki("version"), args.n)
+        print(f"  speed-up: ×{after / before:.1f}")
+
+        seed(NOTES)
+        print(f"\n{NOTES} notes × notesInfo")
+        before = run("per-note notesInfo", lambda: read_per_note(url), 1)
+        after = run("iter_notes_info (chunked)", read_chunked, 1)
+        print(f"  speed-up: ×{after / before:.1f}")
+        ankiconnect.close()
+
+
+if __name__ == "__main__":
+    main()
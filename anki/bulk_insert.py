@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+批量 addNotes — 失败批次二分定位坏笔记，批大小按实测延迟自适应
+  - 新版 AnkiConnect 的 addNotes 只要有一条失败整批报错；旧版 / --direct 对失败的返回 null
+  - 有的 AnkiConnect 版本先把合法的笔记加进去再报错：二分前先用一个 multi(findNotes)
+    按 牌组 + 类型 + 全部字段 查这批笔记，id 不早于这次请求的算已加入，不再重发
+  - 整批报错时对半拆开重发；同一层的所有半批放进一个 multi 请求，
+    一批里不管有几条坏笔记，都只多 ~log₂(批大小) 个请求（原来是逐条重发 = 批大小个请求）
+  - 批大小：每个请求后按「每条笔记耗时」调整，让单个请求接近 TARGET_SECONDS（翻倍 / 减半封顶）
+  - 返回 InsertReport：每条笔记的 id 或错误、请求数、用过的批大小
+
+用法:
+  report = bulk_insert.insert(notes, label="認識")
+  report.ids          # 与 notes 对齐：新 note id 或 None
+  report.failures()   # [(index, error)]
+  print(report.summary())
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ankiconnect import anki, unpack_multi
+import anki_query
+
+BATCH = 50            # 初始批大小
+MIN_BATCH = 5
+MAX_BATCH = 500
+TARGET_SECONDS = 1.0  # 单个 addNotes 请求的目标耗时
+NULL_ERROR = "not added (duplicate or invalid)"  # 旧版 AnkiConnect 只回 null，没有原因
+
+
+class InsertReport:
+    def __init__(self, n):
+        self.ids = [None] * n
+        self.errors = [None] * n
+        self.requests = 0
+        self.bisect_requests = 0
+        self.batch_sizes = []
+        self.elapsed = 0.0
+
+    @property
+    def added(self):
+        return sum(1 for nid in self.ids if nid)
+
+    def failures(self):
+        """[(index, error)] for every note that was not added."""
+        return [(i, e) for i, e in enumerate(self.errors) if e is not None]
+
+    def results(self):
+        """Per-note report: [{"index", "id", "error"}]."""
+        return [{"index": i, "id": nid, "error": err}
+                for i, (nid, err) in enumerate(zip(self.ids, self.errors))]
+
+    def summary(self):
+        sizes = f"{min(self.batch_sizes)}–{max(self.batch_sizes)}" if self.batch_sizes else "-"
+        return (f"{self.added} 新增, {len(self.failures())} 失败, {self.requests} 次请求 "
+                f"(二分 {self.bisect_requests}), 批大小 {sizes}, {self.elapsed:.1f}s")
+
+
+def _record(report, idx, result):
+    """Store addNotes' result (list of ids / nulls) for note indexes `idx`."""
+    for i, nid in zip(idx, result or [None] * len(idx)):
+        report.ids[i] = nid
+        report.errors[i] = None if nid else NULL_ERROR
+
+
+def _note_query(note):
+    return anki_query.all_of(
+        anki_query.deck(note["deckName"]), anki_query.note(note["modelName"]),
+        *(anki_query.field(k, anki_query.escape(v)) for k, v in note["fields"].items()))
+
+
+def _landed(notes, idx, since_ms, report):
+    """Notes of a failed batch that were added anyway: record them and
+    return the indexes still to resend. Note ids are creation timestamps
+    (bumped past the clock when many are added at once), so only ids from
+    since_ms and above every id already reported can come from this batch;
+    older matches are real duplicates."""
+    floor = max([since_ms] + [nid + 1 for nid in report.ids if nid])
+    results = unpack_multi(anki("multi", actions=[
+        {"action": "findNotes", "version": 6, "params": {"query": _note_query(notes[i])}}
+        for i in idx]), len(idx))
+    report.requests += 1
+    rest = []
+    for i, r in zip(idx, results):
+        new = [nid for nid in r if nid >= floor] if not isinstance(r, Exception) else []
+        if new:
+            report.ids[i] = max(new)
+            report.errors[i] = None
+        else:
+            rest.append(i)
+    return rest
+
+
+def _bisect(notes, idx, report):
+    """Resend a failed batch by halves until every bad note is isolated.
+    Each level is one multi request with all halves that still fail."""
+    failing = [idx]
+    while failing:
+        halves = [h for part in failing for h in (part[:len(part) // 2], part[len(part) // 2:]) if h]
+        results = unpack_multi(anki("multi", actions=[
+            {"action": "addNotes", "version": 6, "params": {"notes": [notes[i] for i in h]}}
+            for h in halves]), len(halves))
+        report.requests += 1
+        report.bisect_requests += 1
+        failing = []
+        for h, r in zip(halves, results):
+            if not isinstance(r, Exception):
+                _record(report, h, r)
+            elif len(h) == 1:
+                report.errors[h[0]] = str(r)
+            else:
+                failing.append(h)
+
+
+def insert(notes, batch=BATCH, target=TARGET_SECONDS, label=None):
+    """addNotes for every note; returns an InsertReport aligned with `notes`."""
+    report = InsertReport(len(notes))
+    t_start = time.perf_counter()
+    pos = 0
+    while pos < len(notes):
+        idx = list(range(pos, min(pos + batch, len(notes))))
+        pos = idx[-1] + 1
+        report.batch_sizes.append(len(idx))
+        t0 = time.perf_counter()
+        since_ms = int(time.time() * 1000)
+        try:
+            result = anki("addNotes", notes=[notes[i] for i in idx])
+            report.requests += 1
+            _record(report, idx, result)
+        except Exception as e:
+            report.requests += 1
+            rest = _landed(notes, idx, since_ms, report)
+            if len(idx) == 1 and rest:
+                report.errors[idx[0]] = str(e)
+            elif rest:
+                _bisect(notes, rest, report)  # 只剩一条时也重发一次，拿它自己的错误
+        else:
+            # 只按成功的整批调整：每条耗时 → 让下一批接近 target 秒
+            per_note = (time.perf_counter() - t0) / len(idx)
+            ideal = int(target / per_note) if per_note > 0 else MAX_BATCH
+            batch = max(MIN_BATCH, min(MAX_BATCH, batch * 2, max(batch // 2, ideal)))
+        if label:
+            sys.stdout.write(f"\r  {label}: [{pos}/{len(notes)}] +{report.added}")
+            sys.stdout.flush()
+    if label and notes:
+        print()
+    report.elapsed = time.perf_counter() - t_start
+    return report
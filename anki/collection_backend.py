@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+直接读写 collection 的后端（--direct）— Anki 关闭时不经 GUI / AnkiConnect
+  - 用 Anki 官方 Python 库（`pip install anki`）直接打开 <profile>/collection.anki2
+  - 实现脚本用到的 AnkiConnect action 子集，参数 / 返回值与 AnkiConnect 一致，
+    装上后 `ankiconnect.anki()` / Batch / AsyncAnki 照常调用，脚本无需改写
+  - run_profiles(): 每个 profile 一个子进程并行跑同一个任务，无需切换 Profile
+
+Profile 目录：环境变量 ANKI_BASE，否则按系统默认
+  macOS ~/Library/Application Support/Anki2 | Windows %APPDATA%\\Anki2 | Linux ~/.local/share/Anki2
+
+⚠ Anki 桌面版打开时不能用（同一个 collection 不能被两个进程同时写）。
+"""
+import base64
+import contextlib
+import fnmatch
+import importlib
+import io
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import ankiconnect
+
+
+def anki_base():
+    """Anki 数据目录（含各 Profile 子目录）"""
+    if os.environ.get("ANKI_BASE"):
+        return os.environ["ANKI_BASE"]
+    home = os.path.expanduser("~")
+    if sys.platform == "darwin":
+        return os.path.join(home, "Library", "Application Support", "Anki2")
+    if sys.platform == "win32":
+        return os.path.join(os.environ.get("APPDATA", home), "Anki2")
+    return os.path.join(os.environ.get("XDG_DATA_HOME",
+                                       os.path.join(home, ".local", "share")), "Anki2")
+
+
+def collection_path(profile):
+    return os.path.join(anki_base(), profile, "collection.anki2")
+
+
+def list_profiles():
+    base = anki_base()
+    if not os.path.isdir(base):
+        return []
+    return sorted(p for p in os.listdir(base)
+                  if os.path.isfile(os.path.join(base, p, "collection.anki2")))
+
+
+def check_direct(profiles):
+    """Return an error message if direct mode can't run, else None."""
+    try:
+        importlib.import_module("anki.collection")
+    except ImportError:
+        return "需要 Anki Python 库: pip install anki（版本与桌面版一致）"
+    if ankiconnect.wait_for_anki(0):
+        return "Anki 仍在运行，--direct 需要先关闭 Anki"
+    if not profiles:
+        return f"{anki_base()} 下没有可用的 Profile（可设置 ANKI_BASE）"
+    for p in profiles:
+        if not os.path.isfile(collection_path(p)):
+            return f"找不到 {collection_path(p)}（可设置 ANKI_BASE）"
+    return None
+
+
+class DirectCollection:
+    """AnkiConnect-compatible action handler over an open Collection."""
+
+    def __init__(self, profile):
+        from anki.collection import Collection
+        self.profile = profile
+        self.col = Collection(collection_path(profile))
+
+    def close(self):
+        self.col.close()
+
+    # ── dispatch ─────────────────────────────────────
+    def request(self, payload):
+        """Handle one AnkiConnect payload dict, return {result, error}."""
+        try:
+            return {"result": self.invoke(payload["action"], **payload.get("params", {})),
+                    "error": None}
+        except Exception as e:
+            return {"result": None, "error": str(e)}
+
+    def invoke(self, action, **params):
+        handler = getattr(self, "_" + action, None)
+        if handler is None:
+            raise Exception(f"unsupported action in direct mode: {action}")
+        return handler(**params)
+
+    def _multi(self, actions):
+        return [self.request(a) for a in actions]
+
+    # ── misc ─────────────────────────────────────────
+    def _version(self):
+        return 6
+
+    def _getActiveProfile(self):
+        return self.profile
+
+    def _getProfiles(self):
+        return list_profiles()
+
+    # ── decks ────────────────────────────────────────
+    def _deckNames(self):
+        return [d.name for d in self.col.decks.all_names_and_ids()]
+
+    def _createDeck(self, deck):
+        return self.col.decks.id(deck)
+
+    def _deleteDecks(self, decks, cardsToo=True):
+        ids = [self.col.decks.id_for_name(d) for d in decks]
+        self.col.decks.remove([i for i in ids if i])
+
+    def _getDeckConfig(self, deck):
+        did = self.col.decks.id_for_name(deck)
+        if not did:
+            raise Exception(f"deck was not found: {deck}")
+        return self.col.decks.config_dict_for_deck_id(did)
+
+    def _saveDeckConfig(self, config):
+        self.col.decks.update_config(config)
+        return True
+
+    def _setDeckConfigId(self, decks, configId):
+        for name in decks:
+            d = self.col.decks.by_name(name)
+            if d is None:
+                raise Exception(f"deck was not found: {name}")
+            d["conf"] = configId
+            self.col.decks.save(d)
+        return True
+
+    def _cloneDeckConfigId(self, name, cloneFrom=1):
+        src = self.col.decks.get_config(cloneFrom)
+        return self.col.decks.add_config_returning_id(name, clone_from=src)
+
+    # ── models ───────────────────────────────────────
+    def _model(self, name):
+        m = self.col.models.by_name(name)
+        if m is None:
+            raise Exception(f"model was not found: {name}")
+        return m
+
+    def _modelNames(self):
+        return [m.name for m in self.col.models.all_names_and_ids()]
+
+    def _modelNamesAndIds(self):
+        return {m.name: m.id for m in self.col.models.all_names_and_ids()}
+
+    def _modelFieldNames(self, modelName):
+        return self.col.models.field_names(self._model(modelName))
+
+    def _modelFieldAdd(self, modelName, fieldName, index=None):
+        mm = self.col.models
+        m = self._model(modelName)
+        fld = mm.new_field(fieldName)
+        mm.add_field(m, fld)
+        if index is not None and index < len(m["flds"]) - 1:
+            mm.reposition_field(m, fld, index)
+        mm.save(m)
+
+    def _createModel(self, modelName, inOrderFields, cardTemplates, css=None,
+                     isCloze=False):
+        mm = self.col.models
+        m = mm.new(modelName)
+        for name in inOrderFields:
+            mm.add_field(m, mm.new_field(name))
+        for i, t in enumerate(cardTemplates):
+            tmpl = mm.new_template(t.get("Name", f"Card {i + 1}"))
+            tmpl["qfmt"] = t["Front"]
+            tmpl["afmt"] = t["Back"]
+            mm.add_template(m, tmpl)
+        if css is not None:
+            m["css"] = css
+        mm.add(m)
+        return m
+
+    def _updateModelStyling(self, model):
+        m = self._model(model["name"])
+        m["css"] = model["css"]
+        self.col.models.save(m)
+
+    def _updateModelTemplates(self, model):
+        m = self._model(model["name"])
+        for tmpl in m["tmpls"]:
+            t = model["templates"].get(tmpl["name"])
+            if t:
+                tmpl["qfmt"] = t.get("Front", tmpl["qfmt"])
+                tmpl["afmt"] = t.get("Back", tmpl["afmt"])
+        self.col.models.save(m)
+
+    # ── notes ────────────────────────────────────────
+    def _findNotes(self, query):
+        return list(self.col.find_notes(query))
+
+    def _notesInfo(self, notes):
+        out = []
+        for nid in notes:
+            note = self.col.get_note(nid)
+            model = note.note_type()
+            out.append({
+                "noteId": note.id,
+                "modelName": model["name"],
+                "tags": note.tags,
+                "fields": {f["name"]: {"value": note.fields[f["ord"]], "order": f["ord"]}
+                           for f in model["flds"]},
+                "cards": [c.id for c in note.cards()],
+                "mod": note.mod,
+            })
+        return out
+
+    def _notesModTime(self, notes):
+        return [{"noteId": nid, "mod": self.col.get_note(nid).mod} for nid in notes]
+
+    def _addNote(self, note):
+        from anki.notes import NoteFieldsCheckResult
+        model = self._model(note["modelName"])
+        n = self.col.new_note(model)
+        for k, v in note["fields"].items():
+            n[k] = v
+        n.tags = list(note.get("tags", []))
+        allow_dup = note.get("options", {}).get("allowDuplicate", False)
+        check = n.fields_check()
+        if check == NoteFieldsCheckResult.EMPTY:
+            raise Exception("cannot create note because it is empty")
+        if check == NoteFieldsCheckResult.DUPLICATE and not allow_dup:
+            raise Exception("cannot create note because it is a duplicate")
+        self.col.add_note(n, self.col.decks.id(note["deckName"]))
+        return n.id
+
+    def _addNotes(self, notes):
+        ids = []
+        for note in notes:
+            try:
+                ids.append(self._addNote(note))
+            except Exception:
+                ids.append(None)
+        return ids
+
+    def _updateNoteFields(self, note):
+        n = self.col.get_note(note["id"])
+        for k, v in note["fields"].items():
+            n[k] = v
+        self.col.update_note(n)
+
+    def _updateNote(self, note):
+        n = self.col.get_note(note["id"])
+        for k, v in note.get("fields", {}).items():
+            n[k] = v
+        if "tags" in note:
+            n.tags = list(note["tags"])
+        self.col.update_note(n)
+
+    def _deleteNotes(self, notes):
+        self.col.remove_notes(notes)
+
+    # ── cards ────────────────────────────────────────
+    def _findCards(self, query):
+        return list(self.col.find_cards(query))
+
+    def _cardsInfo(self, cards):
+        out = []
+        for cid in cards:
+            c = self.col.get_card(cid)
+            out.append({
+                "cardId": c.id, "note": c.nid, "ord": c.ord,
+                "deckName": self.col.decks.name(c.did),
+                "modelName": c.note_type()["name"],
+                "type": c.type, "queue": c.queue, "due": c.due,
+                "interval": c.ivl, "factor": c.factor,
+                "reps": c.reps, "lapses": c.lapses, "mod": c.mod,
+            })
+        return out
+
+    def _changeDeck(self, cards, deck):
+        self.col.set_deck(cards, self.col.decks.id(deck))
+
+    def _suspend(self, cards):
+        self.col.sched.suspend_cards(cards)
+        return True
+
+    def _unsuspend(self, cards):
+        self.col.sched.unsuspend_cards(cards)
+        return True
+
+    def _forgetCards(self, cards):
+        self.col.sched.schedule_cards_as_new(cards)
+
+    def _setSpecificValueOfCard(self, card, keys, newValues):
+        c = self.col.get_card(card)
+        for k, v in zip(keys, newValues):
+            setattr(c, k, int(v) if isinstance(getattr(c, k, None), int) else v)
+        self.col.update_card(c)
+        return [True] * len(keys)
+
+    # ── media ────────────────────────────────────────
+    def _storeMediaFile(self, filename, data=None, path=None, deleteExisting=True):
+        if data is not None:
+            raw = base64.b64decode(data)
+        elif path is not None:
+            with open(path, "rb") as f:
+                raw = f.read()
+        else:
+            raise Exception("storeMediaFile needs data or path")
+        if deleteExisting and os.path.exists(os.path.join(self.col.media.dir(), filename)):
+            self.col.media.trash_files([filename])
+        return self.col.media.write_data(filename, raw)
+
+    def _retrieveMediaFile(self, filename):
+        path = os.path.join(self.col.media.dir(), filename)
+        if not os.path.exists(path):
+            return False
+        with open(path, "rb") as f:
+            return base64.b64encode(f.read()).decode("utf-8")
+
+    def _getMediaFilesNames(self, pattern="*"):
+        return fnmatch.filter(os.listdir(self.col.media.dir()), pattern)
+
+    # ── packages ─────────────────────────────────────
+    def _importPackage(self, path):
+        from anki.collection import ImportAnkiPackageOptions, ImportAnkiPackageRequest
+        # 和 AnkiConnect 一样带调度导入（包里挂起的卡片保持挂起）；
+        # guid 相同的笔记 / 笔记类型默认较新才更新（IF_NEWER）
+        self.col.import_anki_package(ImportAnkiPackageRequest(
+            package_path=path,
+            options=ImportAnkiPackageOptions(with_scheduling=True, with_deck_configs=False)))
+        return True
+
+
+@contextlib.contextmanager
+def open_profile(profile):
+    """Open `profile` directly and route ankiconnect.anki() to it."""
+    backend = DirectCollection(profile)
+    ankiconnect.use_backend(backend)
+    try:
+        yield backend
+    finally:
+        ankiconnect.use_backend(None)
+        backend.close()
+
+
+def _worker(profile, fn, args):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        with open_profile(profile):
+            result = fn(*args)
+    return result, out.getvalue()
+
+
+def run_profiles(fn, profiles, *args):
+    """Run fn(*args) once per profile, all profiles in parallel processes.
+
+    `fn` must be a module-level function. Each worker's output is printed
+    after it finishes (so the two profiles don't interleave). Returns
+    {profile: result or Exception}; {} when `profiles` is empty.
+    """
+    results = {}
+    if not profiles:
+        return results
+    with ProcessPoolExecutor(max_workers=len(profiles)) as pool:
+        futs = {p: pool.submit(_worker, p, fn, args) for p in profiles}
+        for p, fut in futs.items():
+            try:
+                results[p], out = fut.result()
+            except Exception as e:
+                results[p], out = e, f"  ✗ {e}\n"
+            print(f"\n=== {p} (direct) ===")
+            print(out, end="")
+    return results
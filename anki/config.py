@@ -2,20 +2,19 @@
 """设置 Anki 牌组选项 — 应用到两个 Profile
   単語: 百词斩风格（短间隔、高频复习）
   文法: 大间隔低频（~1周复习一轮）
+
+用法:
+  python3 anki/config.py            # 通过 AnkiConnect，依次切换两个 Profile
+  python3 anki/config.py --direct   # Anki 关闭时直接改 collection，两个 Profile 并行
 """
-import json
-import urllib.request
+import argparse
 import os
-import time
+import sys
 
-os.environ.pop("http_proxy", None)
-os.environ.pop("https_proxy", None)
-os.environ.pop("HTTP_PROXY", None)
-os.environ.pop("HTTPS_PROXY", None)
-os.environ["no_proxy"] = "localhost,127.0.0.1"
-_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ankiconnect import anki, switch_profile, wait_for_anki
+from collection_backend import check_direct, run_profiles
 
-ANKI_URL = "http://localhost:8765"
 PROFILES = ["szmz", "czh"]
 
 # ─── 牌组配置 ──────────────────────────────────────────
@@ -47,26 +46,6 @@ GRAMMAR_CONFIG = {
 }
 
 
-def anki(action, **params):
-    payload = json.dumps({"action": action, "version": 6, "params": params})
-    req = urllib.request.Request(ANKI_URL, data=payload.encode("utf-8"),
-                                 headers={"Content-Type": "application/json"})
-    resp = _opener.open(req)
-    r = json.loads(resp.read())
-    if r.get("error") and isinstance(r["error"], str):
-        raise Exception(r["error"])
-    return r.get("result")
-
-
-def wait(timeout=30):
-    for _ in range(timeout):
-        try:
-            anki("version")
-            return True
-        except Exception:
-            time.sleep(1)
-    return False
-
 
 def apply_config(deck_name, cfg, config_name=None):
     """Apply config dict to a deck. If config_name is given, ensure a
@@ -76,6 +55,9 @@ def apply_config(deck_name, cfg, config_name=None):
     except Exception as e:
         print(f"    ✗ {deck_name}: {e}")
         return False
+    if not config:  # AnkiConnect 对不存在的牌组返回 false
+        print(f"    ✗ {deck_name}: 牌组不存在")
+        return False
 
     # If we need a dedicated config group, create one via cloneDeckConfigId
     if config_name and config["name"] != config_name:
@@ -122,35 +104,44 @@ def apply_config(deck_name, cfg, config_name=None):
     return True
 
 
-def main():
-    if not wait(5):
-        print("✗ 请打开 Anki")
-        return
+def configure_profile():
+    """Apply both configs to the current profile."""
+    # 単語（用"系统默认"即可，先配置）
+    for deck in VOCAB_DECKS:
+        apply_config(deck, VOCAB_CONFIG)
 
-    for profile in PROFILES:
-        print(f"\n  [{profile}]")
-        try:
-            anki("loadProfile", name=profile)
-        except Exception:
-            pass
-        time.sleep(10)
-        if not wait():
-            print(f"    ✗ 超时")
-            continue
-
-        # 単語（用"系统默认"即可，先配置）
-        for deck in VOCAB_DECKS:
-            apply_config(deck, VOCAB_CONFIG)
-
-        # 文法（独立选项组「文法」，含所有子牌组）
-        apply_config(GRAMMAR_DECK, GRAMMAR_CONFIG, config_name="文法")
-
-    # Switch back
-    try:
-        anki("loadProfile", name="szmz")
-    except Exception:
-        pass
-    time.sleep(3)
+    # 文法（独立选项组「文法」，含所有子牌组）
+    apply_config(GRAMMAR_DECK, GRAMMAR_CONFIG, config_name="文法")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="设置 Anki 牌组选项")
+    parser.add_argument("--direct", action="store_true",
+                        help="Anki 关闭时直接读写 collection，两个 Profile 并行")
+    args = parser.parse_args()
+
+    if args.direct:
+        err = check_direct(PROFILES)
+        if err:
+            print(f"✗ {err}")
+            return
+        run_profiles(configure_profile, PROFILES)
+    else:
+        if not wait_for_anki(5):
+            print("✗ 请打开 Anki")
+            return
+
+        for profile in PROFILES:
+            print(f"\n  [{profile}]")
+            elapsed = switch_profile(profile)
+            if elapsed is None:
+                print(f"    ✗ 超时")
+                continue
+            print(f"    切换 {elapsed:.1f}s")
+            configure_profile()
+
+        # Switch back
+        switch_profile("szmz")
 
     print("\n" + "=" * 55)
     print("  ✅ 牌组选项已更新")
@@ -3,23 +3,28 @@
 文法 Anki 卡包 — 語法認識 + 多邻国风選択問題
   Model 1: 文法認識 — 正面：句型 + 代表例句，背面：中文说明 + 全部例句
   Model 2: 文法選択 — 多邻国风 4 选 1 选择题
+
+增量 upsert，不删牌组（保留复习记录）：
+  - 每条笔记用语法点 id 打 tag：認識 gid::L12-3，選択 quiz::L12-3
+  - 每次和牌组里已有的笔记比对，只新增 / 改字段和 tag / 移动子牌组
+  - --prune：另外删除数据里已没有的语法点；grammar_data / grammar_quiz.json 里还在的 id 不删
+    （题目没填好被跳过的也算还在），grammar_quiz.json 不存在时不删選択笔记
+  - 旧版脚本建的笔记（没有 id tag）第一次按 正面 / 課+問題 认领，补上 tag
+  - --package：要新增的笔记打成一个 .apkg（guid 由 id tag 算出），每个 Profile 一次 importPackage
 """
+import argparse
 import json
-import urllib.request
 import os
+import re
 import sys
-import time
 
-# ─── Proxy bypass ──────────────────────────────────────
-os.environ.pop("http_proxy", None)
-os.environ.pop("https_proxy", None)
-os.environ.pop("HTTP_PROXY", None)
-os.environ.pop("HTTPS_PROXY", None)
-os.environ["no_proxy"] = "localhost,127.0.0.1"
-_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ankiconnect import Batch, anki, iter_cards_info, iter_notes_info, switch_profile, wait_for_anki
+import anki_query
+import apkg_writer
+import bulk_insert
 
 # ─── Config ────────────────────────────────────────────
-ANKI_URL = "http://localhost:8765"
 PROFILES = ["szmz", "czh"]
 DECK = "みんなの日本語初级1-2 文法"
 MODEL_NINSHIKI = "文法認識"
@@ -29,27 +34,12 @@ DIR = os.path.dirname(os.path.abspath(__file__))
 GRAMMAR_DATA = os.path.join(DIR, "grammar", "grammar_data.json")
 GRAMMAR_QUIZ = os.path.join(DIR, "grammar", "grammar_quiz.json")
 
-
-def anki(action, **params):
-    payload = json.dumps({"action": action, "version": 6, "params": params})
-    req = urllib.request.Request(ANKI_URL, data=payload.encode("utf-8"),
-                                 headers={"Content-Type": "application/json"})
-    resp = _opener.open(req)
-    r = json.loads(resp.read())
-    if r.get("error") and isinstance(r["error"], str):
-        raise Exception(r["error"])
-    return r.get("result")
+KEY_TAGS = ("gid::", "quiz::")  # 認識 / 選択 笔记的语法点 id
+LESSON_TAG_RE = re.compile(r"^第\d+課$")
+# 没有 id tag 的旧笔记按这些字段认领
+LEGACY_KEY_FIELDS = {MODEL_NINSHIKI: ("正面",), MODEL_SENTAKU: ("課", "問題")}
 
 
-def wait_for_anki(timeout=30):
-    for _ in range(timeout):
-        try:
-            anki("version")
-            return True
-        except Exception:
-            time.sleep(1)
-    return False
-
 
 # ─── CSS ───────────────────────────────────────────────
 CSS = r"""
@@ -342,6 +332,14 @@ SENTAKU_BACK = """
 </script>
 """
 
+# model → (字段, 模板)
+MODELS = {
+    MODEL_NINSHIKI: (["正面", "代表例句", "背面", "例句一覧", "課"],
+                     [{"Name": "認識", "Front": NINSHIKI_FRONT, "Back": NINSHIKI_BACK}]),
+    MODEL_SENTAKU: (["問題", "選択肢A", "選択肢B", "選択肢C", "選択肢D", "正解", "解説", "課"],
+                    [{"Name": "選択", "Front": SENTAKU_FRONT, "Back": SENTAKU_BACK}]),
+}
+
 
 def lesson_deck(lesson_num):
     """Get sub-deck name: 文法::第01課"""
@@ -390,7 +388,7 @@ def build_ninshiki_notes(data):
                 "課": item["lesson"],
             },
             "options": {"allowDuplicate": False},
-            "tags": [item["lesson"]],
+            "tags": [item["lesson"], f"gid::{item['id']}"],
         })
 
     return notes
@@ -414,8 +412,7 @@ def build_sentaku_notes(quizzes):
         ans_letter = "ABCD"[ans_idx]
 
         # Extract lesson number for sub-deck
-        import re as _re
-        lnum = int(_re.search(r"\d+", q["lesson"]).group())
+        lnum = int(re.search(r"\d+", q["lesson"]).group())
 
         notes.append({
             "deckName": lesson_deck(lnum),
@@ -431,7 +428,7 @@ def build_sentaku_notes(quizzes):
                 "課": q["lesson"],
             },
             "options": {"allowDuplicate": False},
-            "tags": [q["lesson"]],
+            "tags": [q["lesson"], f"quiz::{q['id']}"],
         })
 
     return notes
@@ -472,63 +469,151 @@ def add_notes(notes, label):
     """Batch add notes, return (added, skipped)"""
     if not notes:
         return 0, 0
+    report = bulk_insert.insert(notes, label=label)
+    for i, err in report.failures()[:10]:
+        print(f"  ⚠ {label} {notes[i]['tags'][-1]}: {err}")
+    print(f"  {label}: {report.summary()}")
+    return report.added, len(notes) - report.added
 
-    added = 0
-    skipped = 0
 
-    # Add in batches of 50
-    batch_size = 50
-    for i in range(0, len(notes), batch_size):
-        batch = notes[i:i+batch_size]
-        try:
-            ids = anki("addNotes", notes=batch)
-            for nid in ids:
-                if nid:
-                    added += 1
-                else:
-                    skipped += 1
-        except Exception as e:
-            print(f"  ⚠ {label} batch error: {e}")
-            # Fall back to one-by-one
-            for note in batch:
-                try:
-                    ids = anki("addNotes", notes=[note])
-                    if ids and ids[0]:
-                        added += 1
-                    else:
-                        skipped += 1
-                except Exception:
-                    skipped += 1
-
-        sys.stdout.write(f"\r  {label}: [{min(i+batch_size, len(notes))}/{len(notes)}] +{added}")
-        sys.stdout.flush()
-
-    print()
-    return added, skipped
+def note_key(tags):
+    """The gid:: / quiz:: tag identifying a grammar note, or None."""
+    return next((t for t in tags if t.startswith(KEY_TAGS)), None)
+
+
+def note_guid(note):
+    """Deterministic guid from the id tag (same grammar point → same guid)."""
+    return apkg_writer.guid_for(note_key(note["tags"]))
+
+
+def package_notes(notes, label):
+    """Import notes as one .apkg (models merged into the Profile's). Returns (added, skipped)."""
+    if not notes:
+        return 0, 0
+    before = set(anki("findNotes", query=anki_query.deck(DECK)))
+    model_ids = anki("modelNamesAndIds")
+    writer = apkg_writer.ApkgWriter()
+    for name, (_, templates) in MODELS.items():
+        writer.add_model(name, anki("modelFieldNames", modelName=name), templates, CSS,
+                         model_id=model_ids[name])
+    for note in notes:
+        writer.add_note(note, note_guid(note))
+    seconds = apkg_writer.import_package(writer, "grammar")
+    added = len(set(anki("findNotes", query=anki_query.deck(DECK))) - before)
+    print(f"  {label}: {writer.summary()}, importPackage {seconds:.1f}s")
+    return added, len(notes) - added
+
+
+def legacy_key(model, fields):
+    return (model,) + tuple(fields.get(f, "") for f in LEGACY_KEY_FIELDS.get(model, ()))
+
+
+def sync_notes(desired, package=False, prune=(), keep=()):
+    """Upsert `desired` notes into DECK, keyed by their id tag; package=True imports
+    the new ones as one .apkg instead of addNotes. Notes whose id tag starts with one of
+    `prune` and is neither desired nor in `keep` are deleted; by default nothing is.
+    Returns {"added", "updated", "moved", "deleted", "unchanged"} counts."""
+    want = {note_key(n["tags"]): n for n in desired}
+    legacy = {legacy_key(n["modelName"], n["fields"]): key for key, n in want.items()}
+
+    infos = [n for n in iter_notes_info(anki("findNotes", query=anki_query.deck(DECK))) if n]
+    card_deck = {c["cardId"]: c["deckName"]
+                 for c in iter_cards_info([cid for n in infos for cid in n["cards"]]) if c}
+    have = {}
+    for n in infos:
+        key = note_key(n["tags"])
+        if key is None and n["modelName"] in LEGACY_KEY_FIELDS:
+            key = legacy.get(legacy_key(n["modelName"],
+                                        {k: f["value"] for k, f in n["fields"].items()}))
+        if key is not None and key not in have:
+            have[key] = n
+
+    stats = {"added": 0, "updated": 0, "moved": 0, "deleted": 0, "unchanged": 0}
+    updates = []
+    moves = {}  # deck → card ids
+    for key, n in want.items():
+        cur = have.get(key)
+        if cur is None:
+            continue
+        change = {}
+        fields = {k: v for k, v in n["fields"].items()
+                  if cur["fields"].get(k, {}).get("value") != v}
+        if fields:
+            change["fields"] = fields
+        # 只管 课号 tag 和 id tag，用户自己加的 tag（leech / marked…）保留
+        tags = sorted({t for t in cur["tags"] if not (t.startswith(KEY_TAGS) or LESSON_TAG_RE.match(t))}
+                      | set(n["tags"]))
+        if tags != sorted(cur["tags"]):
+            change["tags"] = tags
+        if change:
+            updates.append(dict(change, id=cur["noteId"]))
+        wrong = [cid for cid in cur["cards"] if card_deck.get(cid) != n["deckName"]]
+        if wrong:
+            moves.setdefault(n["deckName"], []).extend(wrong)
+            stats["moved"] += 1
+        if not change and not wrong:
+            stats["unchanged"] += 1
+    stale = [n["noteId"] for key, n in have.items()
+             if prune and key.startswith(tuple(prune)) and key not in want and key not in keep]
+
+    existing_decks = set(anki("deckNames"))
+    for deck in sorted({DECK} | {n["deckName"] for n in desired}):
+        if deck not in existing_decks:
+            anki("createDeck", deck=deck)
+
+    to_add = [n for key, n in want.items() if key not in have]
+    stats["added"], _ = (package_notes if package else add_notes)(to_add, "新增")
+    with Batch(max_size=50, max_delay=None) as batch:
+        futs = [batch.submit("updateNote", note=u) for u in updates]
+        futs += [batch.submit("changeDeck", cards=cards, deck=deck) for deck, cards in moves.items()]
+        if stale:
+            futs.append(batch.submit("deleteNotes", notes=stale))
+    for f in futs:
+        if f.exception():
+            print(f"  ⚠ {f.exception()}")
+    stats["updated"] = sum(1 for f in futs[:len(updates)] if not f.exception())
+    stats["deleted"] = len(stale) if stale and not futs[-1].exception() else 0
+    return stats
 
 
 def main():
+    parser = argparse.ArgumentParser(description="文法 Anki 卡包")
+    parser.add_argument("--package", action="store_true",
+                        help="新笔记打成 .apkg，每个 Profile 一次 importPackage")
+    parser.add_argument("--prune", action="store_true",
+                        help="删除 grammar_data / grammar_quiz.json 里已没有的语法点笔记")
+    args = parser.parse_args()
+    if args.package and not apkg_writer.can_import():
+        print("⚠ AnkiConnect 不在本机，importPackage 读不到本地文件，改用 addNotes")
+        args.package = False
+
     print("=" * 55)
     print("  文法 Anki — 語法認識 + 選択問題")
     print("=" * 55)
 
     # 1. Load data
-    print("\n[1/4] 读取数据...")
+    print("\n[1/3] 读取数据...")
     with open(GRAMMAR_DATA, "r", encoding="utf-8") as f:
         grammar_data = json.load(f)
     print(f"  語法認識: {len(grammar_data)} 个语法点")
 
     quiz_notes = []
+    prune = ("gid::",) if args.prune else ()
     if os.path.exists(GRAMMAR_QUIZ):
         with open(GRAMMAR_QUIZ, "r", encoding="utf-8") as f:
             quiz_data = json.load(f)
-        # Filter only filled entries
-        filled = [q for q in quiz_data if q.get("question") and q.get("answer")]
-        print(f"  選択問題: {len(filled)} / {len(quiz_data)} 已填写")
+        if args.prune:
+            prune += ("quiz::",)
     else:
         quiz_data = []
-        filled = []
         print("  選択問題: grammar_quiz.json 不存在，跳过")
+    # 数据里还在的 id 一律不删（題目没填好 / 选项有误被跳过的也算）
+    keep = ({f"gid::{g['id']}" for g in grammar_data}
+            | {f"quiz::{q['id']}" for q in quiz_data})
+    desired = build_ninshiki_notes(grammar_data) + build_sentaku_notes(quiz_data)
+    n_sentaku = sum(1 for n in desired if n["modelName"] == MODEL_SENTAKU)
+    if quiz_data:
+        print(f"  選択問題: {n_sentaku} / {len(quiz_data)} 可用")
 
     # 2. Connect
     if not wait_for_anki(5):
@@ -540,76 +625,35 @@ def main():
         print(f"  [{profile}]")
         print(f"{'─' * 40}")
 
-        try:
-            anki("loadProfile", name=profile)
-        except Exception:
-            pass
-        time.sleep(10)
-        if not wait_for_anki(30):
+        elapsed = switch_profile(profile)
+        if elapsed is None:
             print(f"  ✗ 超时")
             continue
+        print(f"  切换 {elapsed:.1f}s")
 
         # Sanity check
         nids = anki("findNotes", query='"deck:みんなの日本語初级1-2 単語"')
         print(f"  Profile 确认: {profile} ({len(nids)} vocab notes)")
 
         # 3. Create models
-        print("\n[2/4] 创建模型...")
+        print("\n[2/3] 创建模型...")
+        for name, (fields, templates) in MODELS.items():
+            ensure_model(name, fields, templates)
 
-        # Clean old deck
-        try:
-            deck_names = anki("deckNames")
-            to_delete = [d for d in deck_names if d == DECK or d.startswith(DECK + "::")]
-            if to_delete:
-                anki("deleteDecks", decks=to_delete, cardsToo=True)
-                print(f"  已删除旧牌组 {DECK}")
-                time.sleep(3)
-                wait_for_anki(10)
-        except Exception:
-            pass
-
-        anki("createDeck", deck=DECK)
-
-        # Create sub-decks per lesson
-        lessons = sorted(set(item["lesson_num"] for item in grammar_data))
-        for lnum in lessons:
-            anki("createDeck", deck=lesson_deck(lnum))
-        print(f"  子牌组: {len(lessons)} 课")
-
-        ensure_model(MODEL_NINSHIKI,
-                     ["正面", "代表例句", "背面", "例句一覧", "課"],
-                     [{"Name": "認識", "Front": NINSHIKI_FRONT, "Back": NINSHIKI_BACK}])
-
-        ensure_model(MODEL_SENTAKU,
-                     ["問題", "選択肢A", "選択肢B", "選択肢C", "選択肢D", "正解", "解説", "課"],
-                     [{"Name": "選択", "Front": SENTAKU_FRONT, "Back": SENTAKU_BACK}])
-
-        # 4. Build and add notes
-        print("\n[3/4] 导入認識卡...")
-        ninshiki_notes = build_ninshiki_notes(grammar_data)
-        n_added, n_skipped = add_notes(ninshiki_notes, "認識")
-        print(f"  → {n_added} 张新卡片, {n_skipped} 张跳过")
-
-        if filled:
-            print("\n[4/4] 导入選択卡...")
-            sentaku_notes = build_sentaku_notes(quiz_data)
-            s_added, s_skipped = add_notes(sentaku_notes, "選択")
-            print(f"  → {s_added} 张新卡片, {s_skipped} 张跳过")
-        else:
-            print("\n[4/4] 選択卡: 无数据，跳过")
+        # 4. Diff against the deck and upsert
+        print("\n[3/3] 同步笔记...")
+        stats = sync_notes(desired, package=args.package, prune=prune, keep=keep)
+        print(f"  → +{stats['added']} 新增, ~{stats['updated']} 更新, "
+              f"→{stats['moved']} 移动, -{stats['deleted']} 删除, {stats['unchanged']} 未变")
 
     # Switch back
-    try:
-        anki("loadProfile", name="szmz")
-    except Exception:
-        pass
-    time.sleep(3)
+    switch_profile("szmz")
 
     print(f"\n{'=' * 55}")
     print(f"  ✅ 导入完成！")
     print(f"  牌组: {DECK}")
     print(f"  認識卡: {len(grammar_data)} 个语法点")
-    print(f"  選択卡: {len(filled)} 道选择题")
+    print(f"  選択卡: {n_sentaku} 道选择题")
     print(f"{'=' * 55}")
 
 
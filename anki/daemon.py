@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+后台守护进程 — 解锁 / 例句填充 / 例句 TTS 定时或按变化增量运行
+  - 常驻：AnkiConnect keep-alive 连接、每个 Profile 的笔记镜像一直保持，不再每次启动
+  - 只处理 Anki 当前打开的 Profile，不切换 Profile（不打断正在复习的人）
+  - 触发：每个任务按各自间隔定时；另外每 --poll 秒跑一次探测查询（只回 id），
+    结果和该任务上次运行后不同就排队（新词达到复习次数 / 有例句缺音频 / 新增笔记 / 例句 JSON 更新）
+  - 一个工作线程串行执行，同一任务在队列里只排一次
+  - 任务依赖的服务不可用（tts：VOICEVOX 没开）时不排队，恢复后照常触发；
+    运行出错后退避重试（--poll 起，每次翻倍，最多 BACKOFF_MAX 秒）
+  - 状态：GET http://127.0.0.1:8766/ → JSON（队列、每个任务上次运行时间 / 耗时 / 结果）
+
+用法:
+  python3 anki/daemon.py                                  # unlock 每 30 分钟，fill / tts 每 60 分钟
+  python3 anki/daemon.py --unlock-every 10 --tts-every 0  # 0 = 只按变化触发
+  curl -s localhost:8766 | python3 -m json.tool
+"""
+import argparse
+import collections
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ankiconnect import anki, close
+from note_mirror import NoteMirror
+import anki_query
+import fill_minna_examples
+import tts_minna_examples
+import tts_pipeline
+import unlock
+import voicevox
+
+DECK = "みんなの日本語初级1-2 単語"
+STATUS_PORT = 8766
+POLL = 60  # 秒；探测查询间隔
+BACKOFF_MAX = 30 * 60  # 秒；连续出错后的最长重试间隔
+
+
+def log(msg):
+    print(f"[{time.strftime('%H:%M:%S')}] {msg}", flush=True)
+
+
+def _ids(query):
+    return hash(tuple(sorted(anki("findNotes", query=query) or [])))
+
+
+class Task:
+    def __init__(self, name, every, run, probe, ready=None):
+        self.name = name
+        self.every = every * 60 if every else None  # 分钟 → 秒；None = 只按变化
+        self.run = run      # run(profile) → 结果描述
+        self.probe = probe  # probe(profile) → 签名；和上次运行后不同就排队
+        self.ready = ready  # ready() → None 可以运行，否则是不能运行的原因
+        self.next_due = time.time()
+        self.waiting = None   # ready() 给出的原因（不可运行时）
+        self.failures = 0     # 连续出错次数
+        self.retry_at = 0.0   # 出错后退避到这个时间之前不排队
+        self.signature = {}  # profile → 上次运行后的签名
+        self.runs = 0
+        self.errors = 0
+        self.last_start = None
+        self.last_seconds = None
+        self.last_result = None
+        self.last_error = None
+
+    def status(self):
+        return {
+            "every_min": self.every / 60 if self.every else None,
+            "runs": self.runs,
+            "errors": self.errors,
+            "last_start": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.last_start))
+                          if self.last_start else None,
+            "last_seconds": round(self.last_seconds, 3) if self.last_seconds is not None else None,
+            "last_result": self.last_result,
+            "last_error": self.last_error,
+            "next_due_in": round(self.next_due - time.time()) if self.every else None,
+            "waiting": self.waiting,
+            "retry_in": round(self.retry_at - time.time()) if self.retry_at > time.time() else None,
+        }
+
+    def failed(self, base):
+        """Back off after an error: base, 2×base, 4×base … up to BACKOFF_MAX seconds."""
+        self.failures += 1
+        delay = min(BACKOFF_MAX, base * 2 ** (self.failures - 1))
+        self.retry_at = time.time() + delay
+        return delay
+
+
+class Daemon:
+    def __init__(self, args):
+        self.args = args
+        self.queue = collections.deque()
+        self.cond = threading.Condition()
+        self.running = None
+        self.profile = None
+        self.started = time.time()
+        self.mirrors = {}  # profile → NoteMirror（只在工作线程里用）
+        self._examples = None
+        self._examples_mtime = None
+        self.tasks = {t.name: t for t in [
+            Task("unlock", args.unlock_every, self.run_unlock, self.probe_unlock),
+            Task("fill", args.fill_every, self.run_fill, self.probe_fill),
+            Task("tts", args.tts_every, self.run_tts, self.probe_tts, self.ready_tts),
+        ]}
+
+    # ── tasks ─────────────────────────────────────────
+    def run_unlock(self, profile):
+        _, ready, unlocked, remaining = unlock.unlock(self.args.threshold)
+        return f"解锁 {unlocked} 张，可解锁词 {ready}，剩余挂起 {remaining}"
+
+    def probe_unlock(self, profile):
+        return _ids(anki_query.build(deck=DECK, card=1, extra=[
+            anki_query.prop(f"reps>={self.args.threshold}")]))
+
+    def examples_mtime(self):
+        files = glob.glob(os.path.join(fill_minna_examples.EXAMPLES_DIR, "lesson_*.json"))
+        return max((os.path.getmtime(f) for f in files), default=0)
+
+    def run_fill(self, profile):
+        mtime = self.examples_mtime()
+        if self._examples is None or mtime != self._examples_mtime:
+            self._examples = fill_minna_examples.load_examples()
+            self._examples_mtime = mtime
+        updated, skipped, missing = fill_minna_examples.fill_profile(
+            self._examples, mirror=self.mirror(profile))
+        return f"{updated} 填入, {skipped} 已有, {missing} 未匹配"
+
+    def probe_fill(self, profile):
+        return (_ids(anki_query.build(deck=DECK, empty=["例句"])), self.examples_mtime())
+
+    def ready_tts(self):
+        if not voicevox.is_running():
+            return f"VOICEVOX 未运行 ({voicevox.VOICEVOX_URL})"
+        return None
+
+    def run_tts(self, profile):
+        if not voicevox.is_running():
+            raise Exception(f"VOICEVOX 未运行 ({voicevox.VOICEVOX_URL})")
+        if tts_minna_examples.SPEAKER_ID is None and not tts_minna_examples.resolve_speaker():
+            raise Exception("WhiteCUL not found in VOICEVOX speakers")
+        count = tts_minna_examples.process_profile(workers=self.args.workers,
+                                                   mirror=self.mirror(profile))
+        return f"生成 {count} 条（{voicevox.stats()}）"
+
+    def probe_tts(self, profile):
+        return _ids(anki_query.build(deck=DECK, filled=["例句"], empty=["例句音频"]))
+
+    def mirror(self, profile):
+        if profile not in self.mirrors:
+            self.mirrors[profile] = NoteMirror(profile)
+        return self.mirrors[profile]
+
+    # ── queue ─────────────────────────────────────────
+    def enqueue(self, name, reason):
+        with self.cond:
+            if name in self.queue:
+                return
+            self.queue.append(name)
+            self.cond.notify()
+        log(f"排队 {name}（{reason}），队列 {len(self.queue)}")
+
+    def worker(self):
+        while True:
+            with self.cond:
+                while not self.queue:
+                    self.cond.wait()
+                name = self.running = self.queue.popleft()
+            task = self.tasks[name]
+            task.last_start = time.time()
+            t0 = time.perf_counter()
+            try:
+                profile = anki("getActiveProfile")
+                task.last_result = task.run(profile)
+                task.last_error = None
+                task.signature[profile] = task.probe(profile)  # 运行后的状态
+                task.failures = 0
+                task.retry_at = 0.0
+                log(f"✓ {name} @ {profile}: {task.last_result} ({time.perf_counter() - t0:.1f}s)")
+            except Exception as e:
+                task.errors += 1
+                task.last_error = str(e)
+                close()
+                delay = task.failed(self.args.poll)
+                log(f"✗ {name}: {e}（{delay:g}s 后重试）")
+            task.runs += 1
+            task.last_seconds = time.perf_counter() - t0
+            with self.cond:
+                self.running = None
+
+    def tick(self):
+        """Queue tasks that are due or whose probe changed since their last run."""
+        try:
+            profile = anki("getActiveProfile")
+        except Exception:
+            close()
+            if self.profile is not None:
+                log("Anki 未运行，等待…")
+            self.profile = None
+            return
+        if profile != self.profile:
+            log(f"当前 Profile: {profile}")
+            self.profile = profile
+        now = time.time()
+        for task in self.tasks.values():
+            if now < task.retry_at:
+                continue
+            waiting = task.ready() if task.ready else None
+            if waiting != task.waiting:
+                log(f"⚠ {task.name} 暂停: {waiting}" if waiting else f"✓ {task.name} 恢复")
+                task.waiting = waiting
+            if waiting:
+                continue  # 到期的定时任务留到恢复后再跑
+            if task.every and now >= task.next_due:
+                task.next_due = now + task.every
+                self.enqueue(task.name, "定时")
+                continue
+            try:
+                sig = task.probe(profile)
+            except Exception as e:
+                close()
+                log(f"✗ 探测 {task.name}: {e}")
+                continue
+            if task.signature.get(profile) != sig:
+                self.enqueue(task.name, "有变化" if profile in task.signature else "首次")
+
+    def status(self):
+        with self.cond:
+            queue = list(self.queue)
+            running = self.running
+        return {
+            "profile": self.profile,
+            "uptime_s": round(time.time() - self.started),
+            "queue_depth": len(queue),
+            "queue": queue,
+            "running": running,
+            "tasks": {name: t.status() for name, t in self.tasks.items()},
+        }
+
+    def serve_status(self, port):
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(daemon.status(), ensure_ascii=False, indent=2).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def run_forever(self):
+        threading.Thread(target=self.worker, daemon=True).start()
+        while True:
+            self.tick()
+            time.sleep(self.args.poll)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Anki 后台守护：解锁 / 例句填充 / 例句 TTS")
+    parser.add_argument("--unlock-every", type=float, default=30, metavar="MIN",
+                        help="解锁间隔（分钟，0 = 只按变化触发）")
+    parser.add_argument("--fill-every", type=float, default=60, metavar="MIN",
+                        help="例句填充间隔（分钟，0 = 只按变化触发）")
+    parser.add_argument("--tts-every", type=float, default=60, metavar="MIN",
+                        help="例句 TTS 间隔（分钟，0 = 只按变化触发）")
+    parser.add_argument("--poll", type=float, default=POLL, metavar="SEC",
+                        help="探测变化的间隔（秒）")
+    parser.add_argument("--threshold", type=int, default=unlock.MIN_REVIEWS,
+                        help="解锁：日文→含义 至少复习几次")
+    parser.add_argument("--workers", type=int, default=tts_pipeline.WORKERS,
+                        help="TTS 同时在途的合成请求数")
+    parser.add_argument("--port", type=int, default=STATUS_PORT, help="状态接口端口")
+    args = parser.parse_args()
+
+    daemon = Daemon(args)
+    daemon.serve_status(args.port)
+    log(f"daemon 启动，状态: http://127.0.0.1:{args.port}/")
+    try:
+        daemon.run_forever()
+    except KeyboardInterrupt:
+        log("退出")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,14 @@
 #!/usr/bin/env python3
 """一次性脚本：为補充単語的43个词填入例句（两个Profile）"""
-import json
-import urllib.request
 import os
-import time
+import sys
 
-os.environ.pop("http_proxy", None)
-os.environ.pop("https_proxy", None)
-os.environ.pop("HTTP_PROXY", None)
-os.environ.pop("HTTPS_PROXY", None)
-os.environ["no_proxy"] = "localhost,127.0.0.1"
-_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ankiconnect import anki, switch_profile, wait_for_anki
+from note_mirror import NoteMirror
+import anki_query
+import anki_text
 
-ANKI_URL = "http://localhost:8765"
 PROFILES = ["szmz", "czh"]
 
 # 手写的 N5 水平例句，自然、实用
@@ -63,38 +59,17 @@ EXAMPLES = {
 }
 
 
-def anki(action, **params):
-    payload = json.dumps({"action": action, "version": 6, "params": params})
-    req = urllib.request.Request(ANKI_URL, data=payload.encode("utf-8"),
-                                 headers={"Content-Type": "application/json"})
-    resp = _opener.open(req)
-    r = json.loads(resp.read())
-    if r.get("error") and isinstance(r["error"], str):
-        raise Exception(r["error"])
-    return r.get("result")
-
-
-def wait(timeout=30):
-    for _ in range(timeout):
-        try:
-            anki("version")
-            return True
-        except Exception:
-            time.sleep(1)
-    return False
-
 
 def fill_profile():
-    nids = anki("findNotes", query="deck:補充単語")
-    if not nids:
+    query = anki_query.build(deck="補充単語", empty=["例句"])
+    mirror = NoteMirror()
+    if not mirror.refresh(query):
         return 0
-    infos = anki("notesInfo", notes=nids)
+    infos = mirror.notes(query)
     updated = 0
     for n in infos:
         jp_raw = n["fields"]["日文"]["value"]
-        # Strip furigana markup to match keys
-        import re
-        clean = re.sub(r" ?(\S+)\[([^\]]+)\]", r"\1", jp_raw)
+        clean = anki_text.plain(jp_raw)
         ex = EXAMPLES.get(clean, "")
         if not ex:
             continue
@@ -110,27 +85,20 @@ def fill_profile():
 
 
 def main():
-    if not wait(5):
+    if not wait_for_anki(5):
         print("✗ 请打开 Anki")
         return
 
     for profile in PROFILES:
-        try:
-            anki("loadProfile", name=profile)
-        except Exception:
-            pass
-        time.sleep(5)
-        if not wait():
+        elapsed = switch_profile(profile)
+        if elapsed is None:
             print(f"  ✗ {profile} 超时")
             continue
+        print(f"  {profile}: 切换 {elapsed:.1f}s")
         count = fill_profile()
         print(f"  ✓ {profile}: {count} 个例句已填入")
 
-    try:
-        anki("loadProfile", name="szmz")
-    except Exception:
-        pass
-    time.sleep(3)
+    switch_profile("szmz")
     print("✅ 例句填充完成")
 
 
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 从 anki/examples/lesson_XX.json 读取例句数据，填入「みんなの日本語」卡片。
-- 匹配 日文 字段（去掉 furigana 后与 JSON key 比对）
+- 匹配 日文 字段（去掉 furigana 和空格后与 JSON key 比对）
 - 填入 例句 + 例句翻译
 - 跳过已有例句的卡片
 - 操作两个 Profile（szmz / czh）
@@ -11,57 +11,35 @@
   python3 anki/fill_minna_examples.py --lessons 1-5    # 只填前5课
   python3 anki/fill_minna_examples.py --dry-run        # 预览不写入
 """
+import asyncio
 import json
-import urllib.request
 import os
+import sys
 import re
-import time
 import argparse
 import glob
 
-os.environ.pop("http_proxy", None)
-os.environ.pop("https_proxy", None)
-os.environ.pop("HTTP_PROXY", None)
-os.environ.pop("HTTPS_PROXY", None)
-os.environ["no_proxy"] = "localhost,127.0.0.1"
-_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ankiconnect import anki, switch_profile, wait_for_anki
+from ankiconnect_async import AsyncAnki, run_bounded
+from note_mirror import NoteMirror
+import anki_query
+import anki_text
 
-ANKI_URL = "http://localhost:8765"
 DECK = "みんなの日本語初级1-2 単語"
 PROFILES = ["szmz", "czh"]
 EXAMPLES_DIR = os.path.join(os.path.dirname(__file__), "examples")
+ASYNC_LIMIT = 4  # 同时在途的 updateNoteFields 请求数
 
 
-def anki(action, **params):
-    payload = json.dumps({"action": action, "version": 6, "params": params})
-    req = urllib.request.Request(ANKI_URL, data=payload.encode("utf-8"),
-                                 headers={"Content-Type": "application/json"})
-    resp = _opener.open(req)
-    r = json.loads(resp.read())
-    if r.get("error") and isinstance(r["error"], str):
-        raise Exception(r["error"])
-    return r.get("result")
 
+def example_key(jp_raw):
+    """examples/*.json key for a 日文 field: plain text with every space removed
+    (keys never contain one; ' わたしは マイク' → 'わたしはマイク')."""
+    return anki_text.plain(jp_raw).replace(" ", "")
 
-def wait(timeout=30):
-    for _ in range(timeout):
-        try:
-            anki("version")
-            return True
-        except Exception:
-            time.sleep(1)
-    return False
 
-
-def strip_furigana(text):
-    """Remove furigana markup: ' 食[た]べます' → '食べます'
-    Handles adjacent kanji: '先[せん]生[せい]' → '先生'"""
-    text = re.sub(r"\[[^\]]+\]", "", text)  # Remove all [reading]
-    text = text.replace(" ", "")  # Remove furigana marker spaces
-    return text.strip()
-
-
-def load_examples(lesson_range=None):
+def load_examples(lesson_range=None, verbose=True):
     """Load all lesson JSON files into a single dict {word: {jp, cn}}"""
     all_examples = {}
     pattern = os.path.join(EXAMPLES_DIR, "lesson_*.json")
@@ -78,7 +56,8 @@ def load_examples(lesson_range=None):
         with open(fpath, "r", encoding="utf-8") as f:
             data = json.load(f)
         all_examples.update(data)
-        print(f"  loaded {basename}: {len(data)} entries")
+        if verbose:
+            print(f"  loaded {basename}: {len(data)} entries")
     return all_examples
 
 
@@ -95,27 +74,25 @@ def parse_lesson_range(s):
     return result
 
 
-def fill_profile(examples, dry_run=False):
+def fill_profile(examples, dry_run=False, mirror=None):
     """Fill examples for current profile. Returns (updated, skipped, missing)."""
-    nids = anki("findNotes", query=f'"deck:{DECK}"')
-    if not nids:
-        return 0, 0, 0
-    infos = anki("notesInfo", notes=nids)
+    # 已有例句的只数一下（只要 id），真正拉内容的只有例句为空的笔记
+    skipped = len(anki("findNotes", query=anki_query.build(deck=DECK, filled=["例句"])))
+    query = anki_query.build(deck=DECK, empty=["例句"])
+    mirror = mirror or NoteMirror()
+    if not mirror.refresh(query):
+        return 0, skipped, 0
+    infos = mirror.notes(query)
     updated = 0
-    skipped = 0
     missing = 0
+    updates = []
     for n in infos:
         jp_raw = n["fields"]["日文"]["value"]
-        clean = strip_furigana(jp_raw)
+        clean = example_key(jp_raw)
         entry = examples.get(clean)
         if not entry:
             missing += 1
             continue
-        # Skip if already has example
-        existing = n["fields"].get("例句", {}).get("value", "")
-        if existing.strip():
-            skipped += 1
-            continue
         if dry_run:
             print(f"    [dry-run] {clean} → {entry['jp'][:30]}...")
             updated += 1
@@ -123,14 +100,24 @@ def fill_profile(examples, dry_run=False):
         fields = {"例句": entry["jp"]}
         if entry.get("cn"):
             fields["例句翻译"] = entry["cn"]
-        anki("updateNoteFields", note={
-            "id": n["noteId"],
-            "fields": fields,
-        })
-        updated += 1
+        updates.append({"id": n["noteId"], "fields": fields})
+    if updates:
+        results = asyncio.run(update_notes(updates))
+        for r in results:
+            if isinstance(r, Exception):
+                print(f"    ✗ {r}")
+        updated += sum(1 for r in results if not isinstance(r, Exception))
     return updated, skipped, missing
 
 
+async def update_notes(updates):
+    """updateNoteFields for every note, ASYNC_LIMIT requests in flight"""
+    async with AsyncAnki(limit=ASYNC_LIMIT) as client:
+        return await run_bounded(
+            (client.anki("updateNoteFields", note=u) for u in updates),
+            limit=ASYNC_LIMIT * 2)
+
+
 def main():
     parser = argparse.ArgumentParser(description="填充みんなの日本語例句")
     parser.add_argument("--lessons", help="课号范围: 1-5, 1,3,5, 7")
@@ -139,7 +126,7 @@ def main():
 
     lesson_range = parse_lesson_range(args.lessons) if args.lessons else None
 
-    if not wait(5):
+    if not wait_for_anki(5):
         print("✗ 请打开 Anki")
         return
 
@@ -151,14 +138,11 @@ def main():
     print(f"  Total: {len(examples)} entries\n")
 
     for profile in PROFILES:
-        try:
-            anki("loadProfile", name=profile)
-        except Exception:
-            pass
-        time.sleep(10)
-        if not wait():
+        elapsed = switch_profile(profile)
+        if elapsed is None:
             print(f"  ✗ {profile} 超时")
             continue
+        print(f"  {profile}: 切换 {elapsed:.1f}s")
         # Sanity check: verify profile actually switched
         nids_check = anki("findNotes", query=f'"deck:{DECK}"')
         print(f"  {profile}: {len(nids_check)} notes")
@@ -166,11 +150,7 @@ def main():
         print(f"  ✓ {profile}: {updated} 填入, {skipped} 跳过(已有), {missing} 未匹配")
 
     # Switch back
-    try:
-        anki("loadProfile", name="szmz")
-    except Exception:
-        pass
-    time.sleep(3)
+    switch_profile("szmz")
     prefix = "[dry-run] " if args.dry_run else ""
     print(f"\n{prefix}✅ 例句填充完成")
 
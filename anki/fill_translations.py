@@ -1,19 +1,13 @@
 #!/usr/bin/env python3
 """一次性脚本：为補充単語填入例句中文翻译"""
-import json
-import urllib.request
 import os
-import re
-import time
+import sys
 
-os.environ.pop("http_proxy", None)
-os.environ.pop("https_proxy", None)
-os.environ.pop("HTTP_PROXY", None)
-os.environ.pop("HTTPS_PROXY", None)
-os.environ["no_proxy"] = "localhost,127.0.0.1"
-_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ankiconnect import anki, iter_notes_info, switch_profile, wait_for_anki
+import anki_query
+import anki_text
 
-ANKI_URL = "http://localhost:8765"
 PROFILES = ["szmz", "czh"]
 
 TRANSLATIONS = {
@@ -63,40 +57,15 @@ TRANSLATIONS = {
 }
 
 
-def anki(action, **params):
-    payload = json.dumps({"action": action, "version": 6, "params": params})
-    req = urllib.request.Request(ANKI_URL, data=payload.encode("utf-8"),
-                                 headers={"Content-Type": "application/json"})
-    resp = _opener.open(req)
-    r = json.loads(resp.read())
-    if r.get("error") and isinstance(r["error"], str):
-        raise Exception(r["error"])
-    return r.get("result")
-
-
-def wait(timeout=30):
-    for _ in range(timeout):
-        try:
-            anki("version")
-            return True
-        except Exception:
-            time.sleep(1)
-    return False
-
-
-def strip_furigana(text):
-    return re.sub(r" ?(\S+)\[([^\]]+)\]", r"\1", text).strip()
-
 
 def fill_profile():
-    nids = anki("findNotes", query="deck:補充単語")
+    nids = anki("findNotes", query=anki_query.build(deck="補充単語", empty=["例句翻译"]))
     if not nids:
         return 0
-    infos = anki("notesInfo", notes=nids)
     count = 0
-    for n in infos:
+    for n in iter_notes_info(nids):
         jp_raw = n["fields"]["日文"]["value"]
-        clean = strip_furigana(jp_raw)
+        clean = anki_text.plain(jp_raw)
         trans = TRANSLATIONS.get(clean, "")
         if not trans:
             continue
@@ -112,25 +81,18 @@ def fill_profile():
 
 
 def main():
-    if not wait(5):
+    if not wait_for_anki(5):
         print("✗ 请打开 Anki")
         return
     for profile in PROFILES:
-        try:
-            anki("loadProfile", name=profile)
-        except Exception:
-            pass
-        time.sleep(5)
-        if not wait():
+        elapsed = switch_profile(profile)
+        if elapsed is None:
             print(f"  ✗ {profile} 超时")
             continue
+        print(f"  {profile}: 切换 {elapsed:.1f}s")
         count = fill_profile()
         print(f"  ✓ {profile}: {count} 个翻译已填入")
-    try:
-        anki("loadProfile", name="szmz")
-    except Exception:
-        pass
-    time.sleep(3)
+    switch_profile("szmz")
     print("✅ 例句翻译填充完成")
 
 
@@ -1,24 +1,9 @@
 #!/usr/bin/env python3
 """一次性脚本：為補充単語 (1) 回填日文字段furigana (2) 例句TTS音频（剣崎雌雄）"""
-import json
-import urllib.request
-import urllib.parse
 import os
 import sys
-import time
 import hashlib
-import base64
-import re
-
-os.environ.pop("http_proxy", None)
-os.environ.pop("https_proxy", None)
-os.environ.pop("HTTP_PROXY", None)
-os.environ.pop("HTTPS_PROXY", None)
-os.environ["no_proxy"] = "localhost,127.0.0.1"
-_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
-
-ANKI_URL = "http://localhost:8765"
-VOICEVOX_URL = "http://127.0.0.1:50021"
+
 PROFILES = ["szmz", "czh"]
 
 # ── word → reading 映射（用于生成 furigana）──
@@ -69,82 +54,48 @@ READINGS = {
 }
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ankiconnect import anki, switch_profile, wait_for_anki
 from add import make_furigana
+from note_mirror import NoteMirror
+import anki_query
+import anki_text
+import audio_encode
+import media_stage
+import voicevox
 
 
-def anki(action, **params):
-    payload = json.dumps({"action": action, "version": 6, "params": params})
-    req = urllib.request.Request(ANKI_URL, data=payload.encode("utf-8"),
-                                 headers={"Content-Type": "application/json"})
-    resp = _opener.open(req)
-    r = json.loads(resp.read())
-    if r.get("error") and isinstance(r["error"], str):
-        raise Exception(r["error"])
-    return r.get("result")
-
-
-def wait(timeout=30):
-    for _ in range(timeout):
-        try:
-            anki("version")
-            return True
-        except Exception:
-            time.sleep(1)
-    return False
-
-
-def strip_furigana(text):
-    """Remove Anki furigana markup to get clean text for TTS."""
-    text = re.sub(r" (\S+)\[([^\]]+)\]", r"\1", text)
-    return text.strip()
-
 
 def find_speaker(name_part):
     """Find VOICEVOX speaker ID by name substring."""
     try:
-        req = urllib.request.Request(f"{VOICEVOX_URL}/speakers")
-        resp = _opener.open(req, timeout=5)
-        speakers = json.loads(resp.read())
-        for s in speakers:
-            if name_part in s["name"]:
-                return s["styles"][0]["id"]
+        return voicevox.find_speaker(name_part)
     except Exception:
-        pass
-    return None
+        return None
 
 
 def generate_tts(text, speaker_id):
-    """Generate TTS audio, return (filename, base64) or None."""
-    clean = strip_furigana(text)
+    """Generate TTS audio, return (filename, bytes) or None."""
+    clean = anki_text.plain(text)
     if not clean:
         return None
     try:
         h = hashlib.md5(clean.encode("utf-8")).hexdigest()[:10]
-        filename = f"tts_ex_{h}.wav"
-        encoded = urllib.parse.quote(clean)
-        req = urllib.request.Request(
-            f"{VOICEVOX_URL}/audio_query?text={encoded}&speaker={speaker_id}",
-            data=b"", method="POST")
-        resp = _opener.open(req)
-        query = json.loads(resp.read())
-        req = urllib.request.Request(
-            f"{VOICEVOX_URL}/synthesis?speaker={speaker_id}",
-            data=json.dumps(query).encode("utf-8"),
-            headers={"Content-Type": "application/json"})
-        resp = _opener.open(req)
-        wav = resp.read()
-        b64 = base64.b64encode(wav).decode("utf-8")
-        return filename, b64
+        filename = f"tts_ex_{h}.{audio_encode.extension()}"
+        return filename, audio_encode.encode(voicevox.synthesize(clean, speaker_id))
     except Exception as e:
         print(f"    TTS error: {e}")
         return None
 
 
 def process_profile(speaker_id):
-    nids = anki("findNotes", query="deck:補充単語")
-    if not nids:
+    # 日文还没有 furigana（没有 "["）的，或者有例句没例句音频的
+    query = anki_query.build(deck="補充単語", extra=[anki_query.any_of(
+        anki_query.not_(anki_query.field("日文", "*[*")),
+        anki_query.all_of(anki_query.filled("例句"), anki_query.empty("例句音频")))])
+    mirror = NoteMirror()
+    if not mirror.refresh(query):
         return 0, 0
-    infos = anki("notesInfo", notes=nids)
+    infos = mirror.notes(query)
     furi_count = 0
     tts_count = 0
 
@@ -154,7 +105,7 @@ def process_profile(speaker_id):
 
         # ── 1. Furigana 回填 ──
         # Strip any existing furigana to get clean word
-        clean_word = strip_furigana(jp_raw)
+        clean_word = anki_text.plain(jp_raw)
         reading = READINGS.get(clean_word, "")
         if reading and clean_word == jp_raw:
             # Currently plain text, needs furigana
@@ -169,8 +120,8 @@ def process_profile(speaker_id):
         if example and not ex_audio:
             result = generate_tts(example, speaker_id)
             if result:
-                filename, b64 = result
-                anki("storeMediaFile", filename=filename, data=b64)
+                filename, data = result
+                media_stage.store(filename, data)
                 updates["例句音频"] = f"[sound:{filename}]"
                 tts_count += 1
 
@@ -184,7 +135,7 @@ def process_profile(speaker_id):
 
 
 def main():
-    if not wait(5):
+    if not wait_for_anki(5):
         print("✗ 请打开 Anki")
         return
 
@@ -195,22 +146,15 @@ def main():
     print(f"  VOICEVOX: 剣崎雌雄 (speaker={speaker_id})")
 
     for profile in PROFILES:
-        try:
-            anki("loadProfile", name=profile)
-        except Exception:
-            pass
-        time.sleep(5)
-        if not wait():
+        elapsed = switch_profile(profile)
+        if elapsed is None:
             print(f"  ✗ {profile} 超时")
             continue
+        print(f"  {profile}: 切换 {elapsed:.1f}s")
         furi, tts = process_profile(speaker_id)
-        print(f"  ✓ {profile}: furigana {furi} 个, 例句音频 {tts} 个")
+        print(f"  ✓ {profile}: furigana {furi} 个, 例句音频 {tts} 个 ({voicevox.stats()})")
 
-    try:
-        anki("loadProfile", name="szmz")
-    except Exception:
-        pass
-    time.sleep(3)
+    switch_profile("szmz")
     print("✅ 完成")
 
 
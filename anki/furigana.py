@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Furigana 对齐 — 漢字[かんじ] 标注，按读音词典做动态规划对齐
+  - 读音词典：単語牌组里已有的 furigana（先[せん]生[せい] / 言葉[ことば]）+ fix_supplement.READINGS，
+    存 .cache/furigana_readings.json，载入时建成按字查的 trie（嵌套 dict）
+  - 对齐：词和读音逐字 DP，假名必须对上；词典里的汉字 / 词每段代价 1，
+    词典没有的汉字串整段兜底（每字代价 10，每个汉字至少一个假名），取总代价最小的切分
+    → 聞きます 不会再切成 聞[]きます，词典里有单字读音时逐字标注
+  - (word, reading) 结果用 lru_cache 记住；make_furigana_many() 批量接口
+
+用法:
+  python3 anki/furigana.py --build                    # 从当前 Profile 的牌组建读音词典
+  python3 anki/furigana.py --build --apkg anki/blank.apkg
+  python3 anki/furigana.py --check                    # 用牌组自己的 furigana 验证对齐，计时
+  python3 anki/furigana.py 聞きます ききます             # →  聞[き]きます
+
+  from furigana import make_furigana
+  make_furigana("食べる", "たべる")  # " 食[た]べる"
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from functools import lru_cache
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import anki_text
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+DICT_PATH = os.path.join(CACHE_DIR, "furigana_readings.json")
+DECKS = ["みんなの日本語初级1-2 単語", "補充単語"]
+FIELD = "日文"
+
+KNOWN_COST = 1     # 词典里的一段
+FALLBACK_COST = 10  # 词典没有的汉字，每个字（再加一段的 KNOWN_COST，整串兜底比逐字兜底便宜）
+MAX_KANA_PER_KANJI = 5  # 兜底时每个汉字最多几个假名（志[こころざし]）
+
+_trie = None
+
+
+def is_kanji(ch):
+    """CJK ideograph, or 々 (repeat mark)."""
+    cp = ord(ch)
+    return (0x4E00 <= cp <= 0x9FFF or 0x3400 <= cp <= 0x4DBF
+            or 0x20000 <= cp <= 0x2A6DF or 0xF900 <= cp <= 0xFAFF or ch == "々")
+
+
+def is_kana(ch):
+    cp = ord(ch)
+    return 0x3041 <= cp <= 0x3096 or 0x30A1 <= cp <= 0x30FA or ch == "ー"
+
+
+def kata_to_hira(text):
+    return "".join(chr(ord(ch) - 0x60) if 0x30A1 <= ord(ch) <= 0x30F6 else ch for ch in text)
+
+
+def strip_ruby(text):
+    """' 食[た]べます' → ('食べます', 'たべます')"""
+    return anki_text.plain(text), anki_text.kana(text)
+
+
+def ruby_pairs(text):
+    """Yield (kanji, reading) for every kanji[reading] in Anki furigana markup.
+    Kana written inside the base (お金[おかね]) is peeled off both sides."""
+    toks = anki_text.tokens(text)
+    for (kind, base), (_, reading) in zip(toks, toks[1:]):
+        if kind != anki_text.RUBY_BASE:
+            continue
+        reading = reading.strip()
+        start = 0
+        while start < len(base) and not is_kanji(base[start]):
+            start += 1
+        end = len(base)
+        while end > start and not is_kanji(base[end - 1]):
+            end -= 1
+        prefix = kata_to_hira(base[:start])
+        suffix = kata_to_hira(base[end:])
+        hira = kata_to_hira(reading)
+        kanji = base[start:end]
+        if not kanji or not hira.startswith(prefix) or not hira.endswith(suffix):
+            continue
+        if not all(is_kanji(ch) for ch in kanji):
+            continue
+        reading = reading[len(prefix):len(reading) - len(suffix)]
+        if reading and all(is_kana(ch) for ch in reading):
+            yield kanji, kata_to_hira(reading)
+
+
+# ── dictionary ────────────────────────────────────────
+
+def _build_trie(entries):
+    """{kanji: [reading, …]} → nested dict; readings live under the "" key."""
+    root = {}
+    for kanji, readings in entries.items():
+        node = root
+        for ch in kanji:
+            node = node.setdefault(ch, {})
+        node[""] = tuple(readings)
+    return root
+
+
+def load(entries=None):
+    """(Re)load the reading dictionary: `entries`, or the cache file + READINGS."""
+    global _trie
+    if entries is None:
+        entries = {}
+        if os.path.exists(DICT_PATH):
+            with open(DICT_PATH, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+    _trie = _build_trie(entries)
+    align.cache_clear()
+    # READINGS 是整词读音：先按现有词典对齐，兜底出来的汉字段当作新词条
+    from fix_supplement import READINGS
+    extra = {}
+    for word, reading in READINGS.items():
+        for text, furi in align(word, reading):
+            if furi and text not in entries:
+                extra.setdefault(text, []).append(kata_to_hira(furi))
+    if extra:
+        entries = dict(entries, **extra)
+        _trie = _build_trie(entries)
+        align.cache_clear()
+    return entries
+
+
+def trie():
+    if _trie is None:
+        load()
+    return _trie
+
+
+def build(texts):
+    """Count kanji readings in furigana markup → {kanji: [readings, most used first]}."""
+    counts = {}
+    for text in texts:
+        for kanji, reading in ruby_pairs(text):
+            per = counts.setdefault(kanji, {})
+            per[reading] = per.get(reading, 0) + 1
+    return {k: sorted(per, key=lambda r: -per[r]) for k, per in sorted(counts.items())}
+
+
+def save(entries):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(DICT_PATH, "w", encoding="utf-8") as f:
+        json.dump(entries, f, ensure_ascii=False, indent=0)
+    load(entries)
+
+
+# ── alignment ─────────────────────────────────────────
+
+@lru_cache(maxsize=65536)
+def align(word, reading):
+    """Split `word` against `reading`: tuple of (text, furigana or None).
+    Returns () when kana in the word cannot be matched against the reading."""
+    root = trie()
+    rh = kata_to_hira(reading)
+    n, m = len(word), len(rh)
+    inf = float("inf")
+    # cost[i][j]: 词的 word[i:] 对上读音 rh[j:] 的最小代价；step 记下怎么走
+    cost = [[inf] * (m + 1) for _ in range(n + 1)]
+    step = [[None] * (m + 1) for _ in range(n + 1)]
+    cost[n][m] = 0
+    for j in range(m - 1, -1, -1):  # 读音末尾多出的标点
+        if not is_kana(rh[j]) and cost[n][j + 1] < inf:
+            cost[n][j], step[n][j] = cost[n][j + 1], (n, j + 1, None)
+
+    for i in range(n - 1, -1, -1):
+        ch = word[i]
+        run = i
+        while run < n and is_kanji(word[run]):
+            run += 1
+        for j in range(m, -1, -1):
+            best, how = inf, None
+            if run > i:
+                # 词典：沿 trie 走，每个到达的词条试它的读音
+                node, k = root, i
+                while k < run and word[k] in node:
+                    node = node[word[k]]
+                    k += 1
+                    for r in node.get("", ()):
+                        if rh.startswith(r, j) and KNOWN_COST + cost[k][j + len(r)] < best:
+                            best = KNOWN_COST + cost[k][j + len(r)]
+                            how = (k, j + len(r), r)
+                # 兜底：word[i:k] 整段配 rh[j:j+span]，短的优先
+                for k in range(i + 1, run + 1):
+                    for span in range(k - i, min(MAX_KANA_PER_KANJI * (k - i), m - j) + 1):
+                        c = FALLBACK_COST * (k - i) + KNOWN_COST + cost[k][j + span]
+                        if c < best:
+                            best, how = c, (k, j + span, rh[j:j + span])
+            else:
+                hira = kata_to_hira(ch)
+                if j < m and rh[j] == hira:
+                    best, how = cost[i + 1][j + 1], (i + 1, j + 1, None)
+                elif not is_kana(ch) and cost[i + 1][j] < best:
+                    best, how = cost[i + 1][j], (i + 1, j, None)  # 标点 / 空格 / 字母
+                if j < m and not is_kana(rh[j]) and cost[i][j + 1] < best:
+                    best, how = cost[i][j + 1], (i, j + 1, None)  # 读音里多出的标点
+            cost[i][j], step[i][j] = best, how
+
+    if cost[0][0] == inf:
+        return ()
+    pieces = []
+    i = j = 0
+    while (i, j) != (n, m):
+        k, jj, furi = step[i][j]
+        if k > i:
+            text = word[i:k]
+            if furi is not None:
+                furi = reading[j:jj]  # 保留原读音的片假名
+            if furi is None and pieces and pieces[-1][1] is None:
+                pieces[-1] = (pieces[-1][0] + text, None)
+            else:
+                pieces.append((text, furi))
+        i, j = k, jj
+    return tuple(pieces)
+
+
+def make_furigana(word, reading):
+    """Anki furigana for `word` read as `reading`.
+
+    Examples:
+        make_furigana("弄びます", "もてあそびます") → " 弄[もてあそ]びます"
+        make_furigana("聞きます", "ききます") → " 聞[き]きます"
+        make_furigana("先生", "せんせい") → " 先[せん]生[せい]"  (词典里有单字读音时)
+        make_furigana("コンビニ", "コンビニ") → "コンビニ"  (no kanji, no change)
+    """
+    if not word or not reading:
+        return word
+    if kata_to_hira(word) == kata_to_hira(reading) or not any(is_kanji(ch) for ch in word):
+        return word
+    pieces = align(word, reading)
+    if not pieces:
+        return f" {word}[{reading}]"  # 假名对不上：整词标注
+    out = []
+    for idx, (text, furi) in enumerate(pieces):
+        if not furi:
+            out.append(text)
+        elif idx and pieces[idx - 1][1]:
+            out.append(f"{text}[{furi}]")  # 紧挨着的汉字段：先[せん]生[せい]
+        else:
+            out.append(f" {text}[{furi}]")
+    return "".join(out)
+
+
+def make_furigana_many(pairs):
+    """make_furigana for every (word, reading); repeated pairs are computed once."""
+    return [make_furigana(word, reading) for word, reading in pairs]
+
+
+# ── CLI ───────────────────────────────────────────────
+
+def deck_texts(apkg=None):
+    """日文 field of every vocabulary note: from an .apkg, or the current profile."""
+    if apkg:
+        from apkg_reader import ApkgReader
+        with ApkgReader(apkg) as reader:
+            return [fields.get(FIELD, "") for _, _, fields in reader.iter_notes()]
+    from note_mirror import NoteMirror
+    import anki_query
+    query = anki_query.any_of(*(anki_query.deck(d) for d in DECKS))
+    mirror = NoteMirror()
+    mirror.refresh(query)
+    return [n["fields"].get(FIELD, {}).get("value", "") for n in mirror.notes(query)]
+
+
+def check(texts):
+    """Re-derive each note's furigana from its plain word + reading."""
+    pairs = [strip_ruby(t) for t in texts
+             if any(kind == anki_text.RUBY_BASE for kind, _ in anki_text.tokens(t))]
+    t0 = time.perf_counter()
+    results = make_furigana_many(pairs)
+    elapsed = time.perf_counter() - t0
+    same = 0
+    diffs = []
+    for (word, reading), new in zip(pairs, results):
+        if strip_ruby(new) == (word, reading):
+            same += 1
+        else:
+            diffs.append((word, reading, new))
+    print(f"  {len(pairs)} 条，{same} 条对齐一致，{elapsed * 1000:.0f}ms "
+          f"({align.cache_info().currsize} 条缓存)")
+    for word, reading, new in diffs[:20]:
+        print(f"  ✗ {word} ({reading}) → {new}")
+    return not diffs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Furigana 对齐 / 读音词典")
+    parser.add_argument("word", nargs="?")
+    parser.add_argument("reading", nargs="?")
+    parser.add_argument("--build", action="store_true", help="从牌组 furigana 建读音词典")
+    parser.add_argument("--check", action="store_true", help="用牌组 furigana 验证对齐")
+    parser.add_argument("--apkg", help="从 .apkg 读，不连 Anki")
+    args = parser.parse_args()
+
+    if args.build or args.check:
+        if not args.apkg:
+            from ankiconnect import wait_for_anki
+            if not wait_for_anki(5):
+                print("✗ 请打开 Anki")
+                return
+        texts = deck_texts(args.apkg)
+        if args.build:
+            entries = build(texts)
+            save(entries)
+            print(f"✓ 读音词典: {len(entries)} 个汉字 / 词 → {DICT_PATH}")
+        if args.check:
+            check(texts)
+    if args.word:
+        print(make_furigana(args.word, args.reading or args.word))
+
+
+if __name__ == "__main__":
+    main()
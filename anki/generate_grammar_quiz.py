@@ -14,36 +14,42 @@
 }
 
 用法：
-  python3 generate_grammar_quiz.py          # 生成初始模板
-  python3 generate_grammar_quiz.py --check  # 检查已有 quiz JSON 完整性
+  python3 generate_grammar_quiz.py           # 生成初始模板
+  python3 generate_grammar_quiz.py --update  # 只处理 parse_grammar 上次变化的课：补新语法点、同步标题
+  python3 generate_grammar_quiz.py --check   # 检查已有 quiz JSON 完整性
 """
 import json
 import os
 import sys
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from parse_grammar import changed_lessons
+
 DIR = os.path.dirname(os.path.abspath(__file__))
 DATA = os.path.join(DIR, "grammar", "grammar_data.json")
 QUIZ = os.path.join(DIR, "grammar", "grammar_quiz.json")
 
 
+def template(item):
+    ex1_jp = item["examples"][0]["jp"] if item["examples"] else ""
+    return {
+        "id": item["id"],
+        "lesson": item["lesson"],
+        "title": item["title"],
+        "question": "",       # 填入题干（含 ___ 空位）
+        "options": ["", "", "", ""],  # 4 个选项
+        "answer": "",         # 正确答案（必须是 options 之一）
+        "hint": "",           # 翻面解说
+        "_ref_example": ex1_jp,  # 参考例句（不导入，仅供出题参考）
+    }
+
+
 def generate_template():
     """生成空白模板，每个语法点 1 题，需手工填写"""
     with open(DATA, "r", encoding="utf-8") as f:
         data = json.load(f)
 
-    quizzes = []
-    for item in data:
-        ex1_jp = item["examples"][0]["jp"] if item["examples"] else ""
-        quizzes.append({
-            "id": item["id"],
-            "lesson": item["lesson"],
-            "title": item["title"],
-            "question": "",       # 填入题干（含 ___ 空位）
-            "options": ["", "", "", ""],  # 4 个选项
-            "answer": "",         # 正确答案（必须是 options 之一）
-            "hint": "",           # 翻面解说
-            "_ref_example": ex1_jp,  # 参考例句（不导入，仅供出题参考）
-        })
+    quizzes = [template(item) for item in data]
 
     os.makedirs(os.path.dirname(QUIZ), exist_ok=True)
     with open(QUIZ, "w", encoding="utf-8") as f:
@@ -54,6 +60,43 @@ def generate_template():
     print("   编辑完成后运行 --check 检查完整性")
 
 
+def update():
+    """Sync quiz entries of the lessons parse_grammar last changed:
+    add templates for new grammar points, refresh lesson / title, keep filled-in answers."""
+    lessons = set(changed_lessons())
+    if not lessons:
+        print("parse_grammar 没有记录变化的课，无需更新")
+        return
+    with open(DATA, "r", encoding="utf-8") as f:
+        data = [item for item in json.load(f) if item["lesson_num"] in lessons]
+    with open(QUIZ, "r", encoding="utf-8") as f:
+        quizzes = json.load(f)
+
+    by_id = {q["id"]: q for q in quizzes}
+    added = renamed = 0
+    for item in data:
+        q = by_id.get(item["id"])
+        if q is None:
+            q = by_id[item["id"]] = template(item)
+            quizzes.append(q)
+            added += 1
+        elif (q["lesson"], q["title"]) != (item["lesson"], item["title"]):
+            q["lesson"], q["title"] = item["lesson"], item["title"]
+            renamed += 1
+    # 语法点被删掉的题不自动删（可能已经手工填好），只提示
+    live = {item["id"] for item in data}
+    orphans = [q["id"] for q in quizzes
+               if q["id"] not in live and int(q["id"][1:].split("-")[0]) in lessons]
+
+    if added or renamed:
+        quizzes.sort(key=lambda q: tuple(int(x) for x in q["id"][1:].split("-")))
+        with open(QUIZ, "w", encoding="utf-8") as f:
+            json.dump(quizzes, f, ensure_ascii=False, indent=2)
+    print(f"✅ 更新 {len(lessons)} 课: +{added} 题模板，{renamed} 题标题同步 → {QUIZ}")
+    for qid in orphans:
+        print(f"  ⚠ {qid}: 语法点已不存在，请手工删除")
+
+
 def check():
     """检查 quiz JSON 完整性"""
     with open(QUIZ, "r", encoding="utf-8") as f:
@@ -96,6 +139,8 @@ def check():
 def main():
     if "--check" in sys.argv:
         check()
+    elif "--update" in sys.argv:
+        update()
     else:
         if os.path.exists(QUIZ):
             print(f"⚠ {QUIZ} 已存在，跳过生成")
@@ -3,39 +3,51 @@
 从 blank.apkg 导入 Anki — Duolingo 风格，双向卡片
   卡片1: 日文→含义（主力）
   卡片2: 中文→日文（默认挂起，用 unlock.py 解锁）
+
+默认增量同步（upsert）：每个 apkg note 算指纹，与 .cache/vocab_manifest_<profile>.json
+对比，只新增 / 更新 / 删除变化的 note，复习记录保留；音频交给 media_sync 按内容去重、只传缺失的。
+--full 才删除整个牌组重新导入（复习记录清空）。
+
+用法:
+  python3 anki/import_apkg.py                          # 增量同步到当前打开的 Profile
+  python3 anki/import_apkg.py --full                   # 删牌组全量重导
+  python3 anki/import_apkg.py --direct --profile czh   # Anki 关闭时直接写 collection
+  python3 anki/import_apkg.py --package                # 新单词（带例句）+ 缺失音频打成 .apkg，一次 importPackage
 """
+import argparse
+import asyncio
+import hashlib
 import json
-import sqlite3
-import urllib.request
-import zipfile
 import os
+import re
 import sys
-import base64
-import tempfile
 
-# Bypass proxy for localhost
-os.environ.pop("http_proxy", None)
-os.environ.pop("https_proxy", None)
-os.environ.pop("HTTP_PROXY", None)
-os.environ.pop("HTTPS_PROXY", None)
-os.environ["no_proxy"] = "localhost,127.0.0.1"
-_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ankiconnect import anki, iter_notes_info
+from ankiconnect_async import AsyncAnki, run_bounded
+from collection_backend import check_direct, open_profile
+from media_sync import MediaSync
+from apkg_reader import ApkgReader
+from fill_minna_examples import example_key, load_examples
+import apkg_writer
+import bulk_insert
 
 APKG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "blank.apkg")
-ANKI_URL = "http://localhost:8765"
 DECK = "みんなの日本語初级1-2 単語"
 MODEL = "みんなの日本語"
+NOTE_BATCH = 200   # 每个 multi 请求的 updateNote 数
+ASYNC_LIMIT = 2    # 同时在途的 multi 请求数（Anki 串行写库，2 个足够让编码与传输重叠）
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
 
-
-def anki(action, **params):
-    payload = json.dumps({"action": action, "version": 6, "params": params})
-    req = urllib.request.Request(ANKI_URL, data=payload.encode("utf-8"),
-                                 headers={"Content-Type": "application/json"})
-    resp = _opener.open(req)
-    r = json.loads(resp.read())
-    if r.get("error") and isinstance(r["error"], str):
-        raise Exception(r["error"])
-    return r.get("result")
+# 来自 apkg 的字段 — upsert 只写这些；例句 / 例句翻译 / 例句音频 / 笔记 由其他脚本填充，不覆盖
+APKG_FIELDS = ["日文", "音调核", "词性", "基本形", "外来语", "中文", "音频",
+               "是否需要从汉字到假名", "是否需要缩小日文", "是否需要缩小假名",
+               "是否需要缩小中文", "課"]
+# 导入脚本管理的 tag：课号 + 词性；其余（mastered / leech / marked…）是用户的，更新时保留
+LESSON_TAG_RE = re.compile(r"^第\d+課$")
+MODEL_FIELDS = ["日文", "音调核", "词性", "基本形", "外来语", "中文", "音频",
+                "是否需要从汉字到假名", "是否需要缩小日文", "是否需要缩小假名",
+                "是否需要缩小中文", "例句", "課", "例句音频", "笔记", "例句翻译"]
 
 
 # ─── CSS ─────────────────────────────────────────────
@@ -436,55 +448,271 @@ function markMastered(btn) {
 </script>
 """
 
+TEMPLATES = [
+    {"Name": "日文", "Front": FRONT_JP, "Back": BACK_JP},
+    {"Name": "中文", "Front": FRONT_CN, "Back": BACK_CN},
+]
 
-def extract_apkg():
-    """Extract notes, decks, and media from blank.apkg"""
-    zf = zipfile.ZipFile(APKG, "r")
-    media_map = json.loads(zf.read("media"))
-
-    tmp = tempfile.mktemp(suffix=".db")
-    with open(tmp, "wb") as f:
-        f.write(zf.read("collection.anki21"))
-
-    db = sqlite3.connect(tmp)
-    col_data = db.execute("SELECT models, decks FROM col").fetchone()
-    models = json.loads(col_data[0])
-    decks_raw = json.loads(col_data[1])
-
-    # deck_id -> lesson name
-    deck_map = {}
-    for did, d in decks_raw.items():
-        name = d["name"]
-        if "::第" in name:
-            part = name.split("::")[1]
-            lesson = part.split("\u3000")[0]  # fullwidth space
-            lesson = lesson.translate(str.maketrans("０１２３４５６７８９", "0123456789"))
-            deck_map[int(did)] = lesson
-        else:
-            deck_map[int(did)] = ""
 
-    model = list(models.values())[0]
-    field_names = [f["name"] for f in model["flds"]]
+def lesson_of(deck_name):
+    """'…::第１課　xxx' → '第1課'; top-level decks → ''"""
+    if "::第" not in deck_name:
+        return ""
+    lesson = deck_name.split("::")[1].split("\u3000")[0]  # fullwidth space
+    return lesson.translate(str.maketrans("０１２３４５６７８９", "0123456789"))
 
-    notes = db.execute("SELECT id, flds FROM notes").fetchall()
-    note_decks = {}
-    for nid, did in db.execute("SELECT nid, did FROM cards"):
-        if nid not in note_decks:
-            note_decks[nid] = did
 
+def extract_apkg():
+    """Parse blank.apkg → (notes, media_map, apkg).
+    The collection is streamed to a private temp file and dropped once the
+    notes are read; media stay in the zip and are read one at a time."""
+    apkg = ApkgReader(APKG)
+    deck_map = {did: lesson_of(name) for did, name in apkg.decks().items()}
     parsed = []
-    for nid, flds in notes:
-        fields = flds.split("\x1f")
-        note = {name: (fields[i] if i < len(fields) else "") for i, name in enumerate(field_names)}
-        note["_lesson"] = deck_map.get(note_decks.get(nid, 0), "")
+    for nid, did, fields in apkg.iter_notes():
+        note = dict(fields)
+        note["_lesson"] = deck_map.get(did, "")
+        note["_nid"] = str(nid)  # apkg 内的 note id，跨版本稳定，作为 manifest 的 key
         parsed.append(note)
+    media_map = apkg.media_map()
+    apkg.close_collection()
+    return parsed, media_map, apkg
+
+
+def build_note(note, examples=None):
+    """apkg note dict → AnkiConnect addNotes entry.
+    examples ({plain 日文: {jp, cn}}) pre-fills 例句 / 例句翻译 (package import)."""
+    lesson = note["_lesson"]
+    example = (examples or {}).get(example_key(note["日文"]), {})
+    return {
+        "deckName": f"{DECK}::{lesson}" if lesson else DECK,
+        "modelName": MODEL,
+        "fields": {
+            "日文": note["日文"],
+            "音调核": note["音调核"],
+            "词性": note["词性"],
+            "基本形": note["基本形"],
+            "外来语": note["外来语"],
+            "中文": note["中文"],
+            "音频": note["音频"],
+            "是否需要从汉字到假名": note["是否需要从汉字到假名"],
+            "是否需要缩小日文": note.get("是否需要缩小日文", ""),
+            "是否需要缩小假名": note.get("是否需要缩小假名", ""),
+            "是否需要缩小中文": note.get("是否需要缩小中文", ""),
+            "例句": example.get("jp", ""),
+            "課": lesson,
+            "例句音频": "",
+            "笔记": "",
+            "例句翻译": example.get("cn", ""),
+        },
+        "options": {"allowDuplicate": False},
+        "tags": [lesson, note["词性"]] if lesson else [note["词性"]],
+    }
 
-    db.close()
-    os.unlink(tmp)
-    return parsed, media_map, zf
+
+def note_guid(note):
+    """Deterministic guid of an apkg note (same word → same guid in every package)."""
+    return apkg_writer.guid_for("vocab", note["_nid"])
+
+
+def package_notes(adds, media, profile):
+    """Write new notes (例句 pre-filled) + media Anki is missing into one .apkg and
+    importPackage it. Returns (ids aligned with adds, media names delivered, seconds)."""
+    names = media.pending()
+    if not adds and not names:
+        return [], [], 0.0
+    before = set(anki("findNotes", query=f'"deck:{DECK}"'))
+    writer = apkg_writer.ApkgWriter()
+    writer.add_model(MODEL, anki("modelFieldNames", modelName=MODEL), TEMPLATES, CSS,
+                     model_id=anki("modelNamesAndIds")[MODEL])
+    examples = load_examples(verbose=False)
+    for note in adds:
+        writer.add_note(build_note(note, examples), note_guid(note), suspend=[1])
+    for name in names:
+        writer.add_media(name, media.openers[name])
+    print(f"  打包: {writer.summary()}")
+    seconds = apkg_writer.import_package(writer, f"vocab_{profile}")
+
+    # 包内 note id 导入后可能被改，按 (課, 日文) 找回新 note
+    fresh = set(anki("findNotes", query=f'"deck:{DECK}"')) - before
+    by_key = {}
+    for info in iter_notes_info(sorted(fresh)):
+        f = info["fields"]
+        by_key[(f.get("課", {}).get("value", ""), f.get("日文", {}).get("value", ""))] = info["noteId"]
+    ids = [by_key.get((n["_lesson"], n["日文"])) for n in adds]
+    media.mark_stored(names)
+    return ids, names, seconds
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _progress(done, total):
+    sys.stdout.write(f"\r  [{done}/{total}]")
+    sys.stdout.flush()
+
+
+def add_notes(notes):
+    """Add notes in addNotes batches (bulk_insert: failing batches are bisected).
+    Returns (ids, requests); ids is aligned with notes: new note id, or None."""
+    report = bulk_insert.insert([build_note(n) for n in notes], label="单词")
+    for i, err in report.failures()[:5]:
+        print(f"  ✗ {notes[i]['日文']}: {err}")
+    return report.ids, report.requests
+
+
+def merge_tags(current, tags, managed):
+    """Note tags after an update: lesson / 词性 tags (`managed`) replaced by `tags`,
+    every other tag on the note kept."""
+    return sorted({t for t in current if not (t in managed or LESSON_TAG_RE.match(t))} | set(tags))
+
+
+async def update_notes(updates, managed=()):
+    """updates: [(anki_nid, note)] → multi(updateNote) with the apkg fields only;
+    tags merged with the note's current ones (see merge_tags).
+    Returns (set of updated anki nids, requests)."""
+    current = {n["noteId"]: n["tags"] for n in iter_notes_info([nid for nid, _ in updates]) if n}
+    done = 0
+    ok = set()
+    async with AsyncAnki(limit=ASYNC_LIMIT) as client:
+        async def send(chunk):
+            nonlocal done
+            actions = []
+            for nid, note in chunk:
+                entry = build_note(note)
+                actions.append(("updateNote", {"note": {
+                    "id": nid,
+                    "fields": {k: entry["fields"][k] for k in APKG_FIELDS},
+                    "tags": merge_tags(current.get(nid, ()), entry["tags"], managed),
+                }}))
+            results = await client.multi(actions)
+            for (nid, _), r in zip(chunk, results):
+                if not isinstance(r, Exception):
+                    ok.add(nid)
+            done += len(chunk)
+            _progress(done, len(updates))
+
+        await run_bounded((send(c) for c in _chunks(updates, NOTE_BATCH)),
+                          limit=ASYNC_LIMIT)
+        return ok, client.requests
+
+
+# ─── Manifest（增量同步）───────────────────────────────
+def note_fingerprint(note):
+    """Hash of everything the importer writes for this apkg note."""
+    entry = build_note(note)
+    key = {"deck": entry["deckName"], "tags": entry["tags"],
+           "fields": {k: entry["fields"][k] for k in APKG_FIELDS}}
+    return hashlib.sha1(json.dumps(key, ensure_ascii=False, sort_keys=True)
+                        .encode("utf-8")).hexdigest()
+
+
+def manifest_path(profile):
+    return os.path.join(CACHE_DIR, f"vocab_manifest_{profile}.json")
+
+
+def load_manifest(profile):
+    try:
+        with open(manifest_path(profile), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"notes": {}}
+
+
+def save_manifest(profile, manifest):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = manifest_path(profile)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+
+def active_profile():
+    try:
+        return anki("getActiveProfile")
+    except Exception:
+        return "default"  # 旧版 AnkiConnect 没有 getActiveProfile
+
+
+def bootstrap_manifest(notes, existing_nids):
+    """No manifest yet but the deck exists (old full import): match collection
+    notes to apkg notes by (課, 日文) so the first upsert doesn't re-add them.
+    Notes whose apkg fields already match get their fingerprint recorded."""
+    by_key = {}
+    for info in iter_notes_info(existing_nids):
+        f = info["fields"]
+        key = (f.get("課", {}).get("value", ""), f.get("日文", {}).get("value", ""))
+        by_key[key] = (info["noteId"],
+                       {k: f.get(k, {}).get("value", "") for k in APKG_FIELDS})
+    entries = {}
+    for note in notes:
+        entry = build_note(note)
+        hit = by_key.get((note["_lesson"], note["日文"]))
+        if not hit:
+            continue
+        nid, current = hit
+        same = current == {k: entry["fields"][k] for k in APKG_FIELDS}
+        entries[note["_nid"]] = {"nid": nid, "hash": note_fingerprint(note) if same else ""}
+    return entries
+
+
+def plan_upsert(notes, manifest, existing_nids):
+    """→ (adds [note], updates [(anki_nid, note)], removes [anki_nid])"""
+    adds, updates = [], []
+    seen = set()
+    for note in notes:
+        seen.add(note["_nid"])
+        m = manifest["notes"].get(note["_nid"])
+        if not m or m["nid"] not in existing_nids:
+            adds.append(note)
+        elif m["hash"] != note_fingerprint(note):
+            updates.append((m["nid"], note))
+    removes = [m["nid"] for k, m in manifest["notes"].items()
+               if k not in seen and m["nid"] in existing_nids]
+    return adds, updates, removes
+
+
+def move_cards(updates):
+    """Updated notes whose lesson changed: move their cards to the new sub-deck."""
+    by_deck = {}
+    for nid, note in updates:
+        by_deck.setdefault(build_note(note)["deckName"], []).append(nid)
+    moved = 0
+    for deck, nids in by_deck.items():
+        cards = anki("findCards", query=f'nid:{",".join(map(str, nids))} -"deck:{deck}"')
+        if cards:
+            anki("changeDeck", cards=cards, deck=deck)
+            moved += len(cards)
+    return moved
 
 
 def main():
+    parser = argparse.ArgumentParser(description="blank.apkg → Anki")
+    parser.add_argument("--full", action="store_true",
+                        help="删除牌组后全量重导（清空复习记录）")
+    parser.add_argument("--direct", action="store_true",
+                        help="Anki 关闭时直接读写 collection（需配合 --profile）")
+    parser.add_argument("--profile", help="--direct 时要写入的 Profile")
+    parser.add_argument("--package", action="store_true",
+                        help="新单词 + 缺失音频打成 .apkg，一次 importPackage 导入")
+    args = parser.parse_args()
+
+    if not args.direct:
+        run_import(full=args.full, package=args.package)
+        return
+    if not args.profile:
+        parser.error("--direct 需要 --profile")
+    err = check_direct([args.profile])
+    if err:
+        print(f"✗ {err}")
+        sys.exit(1)
+    with open_profile(args.profile):
+        run_import(full=args.full, package=args.package)
+
+
+def run_import(full=False, package=False):
     print("=" * 55)
     print("  blank.apkg → Anki (Duolingo Style)")
     print("  2 卡片: 日文→含义 + 中文→日文(挂起)")
@@ -492,7 +720,7 @@ def main():
 
     # 1. Extract
     print("\n[1/6] 解压 apkg...")
-    notes, media_map, zf = extract_apkg()
+    notes, media_map, apkg = extract_apkg()
     print(f"  {len(notes)} 个单词, {len(media_map)} 个音频")
 
     # 2. Connect
@@ -503,27 +731,39 @@ def main():
         print("  ✗ 请打开 Anki")
         return
 
-    # 3. Clean old data
-    print("\n[2/6] 清理旧数据...")
-    try:
-        deck_names = anki("deckNames")
-        to_delete = [d for d in deck_names if d == DECK or d.startswith(DECK + "::")]
-        if to_delete:
-            anki("deleteDecks", decks=to_delete, cardsToo=True)
-            print(f"  已删除 {len(to_delete)} 个牌组")
-    except Exception:
-        pass
-
-    # Also clean old model if exists (to recreate fresh)
-    try:
-        existing_models = anki("modelNames")
-        if MODEL in existing_models:
-            # Check if model has notes - if deck deleted, notes gone, safe to proceed
-            # We'll just recreate below; if model exists with no notes, createModel will fail
-            # so we update instead
+    profile = active_profile()
+    manifest = load_manifest(profile) if not full else {"notes": {}}
+    if package and not apkg_writer.can_import():
+        print("  ⚠ AnkiConnect 不在本机，importPackage 读不到本地文件，改用 addNotes")
+        package = False
+
+    # 音频按内容去重：同一段音频的多个文件名只保留 canonical，字段引用跟着改
+    media = MediaSync(profile, {name: (lambda num=num: apkg.open_media(num))
+                                for num, name in media_map.items() if apkg.has_media(num)})
+    for note in notes:
+        note["音频"] = media.rewrite(note["音频"])
+
+    # 3. Clean old data (--full) / diff against manifest (upsert)
+    if full:
+        print("\n[2/6] 清理旧数据...")
+        try:
+            deck_names = anki("deckNames")
+            to_delete = [d for d in deck_names if d == DECK or d.startswith(DECK + "::")]
+            if to_delete:
+                anki("deleteDecks", decks=to_delete, cardsToo=True)
+                print(f"  已删除 {len(to_delete)} 个牌组")
+        except Exception:
             pass
-    except Exception:
-        pass
+        adds, updates, removes = notes, [], []
+    else:
+        print(f"\n[2/6] 对比 manifest ({profile})...")
+        existing_nids = set(anki("findNotes", query=f'"deck:{DECK}"'))
+        if not manifest["notes"] and existing_nids:
+            manifest["notes"] = bootstrap_manifest(notes, existing_nids)
+            print(f"  首次增量同步: 按 (課, 日文) 匹配到 {len(manifest['notes'])} 个已有 note")
+        adds, updates, removes = plan_upsert(notes, manifest, existing_nids)
+        print(f"  新增 {len(adds)}  更新 {len(updates)}  删除 {len(removes)}  "
+              f"不变 {len(notes) - len(adds) - len(updates)}")
 
     # 4. Create model
     print("\n[3/6] 创建模型...")
@@ -532,36 +772,22 @@ def main():
         if MODEL not in existing:
             anki("createModel",
                  modelName=MODEL,
-                 inOrderFields=["日文", "音调核", "词性", "基本形", "外来语",
-                                "中文", "音频", "是否需要从汉字到假名",
-                                "是否需要缩小日文", "是否需要缩小假名",
-                                "是否需要缩小中文", "例句", "課", "例句音频",
-                                "笔记"],
+                 inOrderFields=MODEL_FIELDS,
                  css=CSS,
-                 cardTemplates=[
-                     {"Name": "日文", "Front": FRONT_JP, "Back": BACK_JP},
-                     {"Name": "中文", "Front": FRONT_CN, "Back": BACK_CN},
-                 ])
+                 cardTemplates=TEMPLATES)
             print(f"  模型「{MODEL}」已创建 (2 模板)")
         else:
             # Add new fields first (before templates reference them)
             fields = anki("modelFieldNames", modelName=MODEL)
-            if "例句" not in fields:
-                anki("modelFieldAdd", modelName=MODEL, fieldName="例句", index=len(fields))
-            fields = anki("modelFieldNames", modelName=MODEL)
-            if "課" not in fields:
-                anki("modelFieldAdd", modelName=MODEL, fieldName="課", index=len(fields))
-            fields = anki("modelFieldNames", modelName=MODEL)
-            if "例句音频" not in fields:
-                anki("modelFieldAdd", modelName=MODEL, fieldName="例句音频", index=len(fields))
+            for fname in MODEL_FIELDS:
+                if fname not in fields:
+                    anki("modelFieldAdd", modelName=MODEL, fieldName=fname, index=len(fields))
+                    fields.append(fname)
             # Now update styling and templates
             anki("updateModelStyling", model={"name": MODEL, "css": CSS})
             anki("updateModelTemplates", model={
                 "name": MODEL,
-                "templates": {
-                    "日文": {"Front": FRONT_JP, "Back": BACK_JP},
-                    "中文": {"Front": FRONT_CN, "Back": BACK_CN},
-                }
+                "templates": {t["Name"]: {"Front": t["Front"], "Back": t["Back"]} for t in TEMPLATES}
             })
             print(f"  模型「{MODEL}」已更新")
     except Exception as e:
@@ -573,69 +799,70 @@ def main():
     for lesson in lessons:
         anki("createDeck", deck=f"{DECK}::{lesson}")
 
-    # 6. Upload media
-    print(f"\n[4/6] 上传 {len(media_map)} 个音频...")
-    uploaded = 0
-    for num_str, filename in media_map.items():
-        try:
-            data = zf.read(num_str)
-            b64 = base64.b64encode(data).decode("utf-8")
-            anki("storeMediaFile", filename=filename, data=b64)
-            uploaded += 1
-            if uploaded % 200 == 0:
-                sys.stdout.write(f"\r  [{uploaded}/{len(media_map)}]")
-                sys.stdout.flush()
-        except Exception:
-            pass
-    print(f"\r  {uploaded} 个媒体文件已上传")
-
-    # 7. Import notes
-    print(f"\n[5/6] 导入 {len(notes)} 个单词...")
-    added = 0
-    skipped = 0
-    for i, note in enumerate(notes):
-        lesson = note["_lesson"]
-        deck_name = f"{DECK}::{lesson}" if lesson else DECK
+    # 6. Upload media（content-addressed：只传 Anki 缺失 / 内容变了的 canonical 文件）
+    #    --package：缺失的媒体和新单词打进同一个 .apkg
+    if package:
+        print(f"\n[4/6] 导入 {len(adds)} 个单词 + 缺失音频（.apkg）...")
+        ids, stored, seconds = package_notes(adds, media, profile)
+        media.save()
+        uploaded = len(stored)
+        print(f"  importPackage {seconds:.1f}s: {uploaded} 个媒体文件")
+        print(f"  {media.report()}")
+    else:
+        print(f"\n[4/6] 同步 {len(media_map)} 个音频...")
+        stored, requests = asyncio.run(media.upload())
+        media.save()
+        uploaded = len(stored)
+        print(f"\r  {uploaded} 个媒体文件已上传 ({requests} 次请求)")
+        print(f"  {media.report()}")
+
+    # 7. Import notes（整批 addNotes，失败的批二分定位坏笔记；--package 上一步已导入）
+    print(f"\n[5/6] 导入 {len(adds)} 个单词...")
+    if package:
+        via = "1 次 importPackage" if adds or stored else "无需导入"
+    else:
+        ids, requests = add_notes(adds)
+        via = f"{requests} 次请求"
+    new_nids = [nid for nid in ids if nid]
+    added = len(new_nids)
+    skipped = len(adds) - added
+    print(f"\r  {added} 张新卡片, {skipped} 张跳过 ({via})")
+    for note, nid in zip(adds, ids):
+        if nid:
+            manifest["notes"][note["_nid"]] = {"nid": nid, "hash": note_fingerprint(note)}
+
+    if updates:
+        print(f"  更新 {len(updates)} 个单词（只写 apkg 字段，例句 / 笔记保留）...")
+        ok, requests = asyncio.run(update_notes(updates, {n["词性"] for n in notes}))
+        moved = move_cards([(nid, n) for nid, n in updates if nid in ok])
+        print(f"\r  {len(ok)} 个已更新, {moved} 张卡片换课 ({requests} 次请求)")
+        for nid, note in updates:
+            if nid in ok:
+                manifest["notes"][note["_nid"]] = {"nid": nid, "hash": note_fingerprint(note)}
+
+    keep = {n["_nid"] for n in notes}
+    if removes:
         try:
-            ids = anki("addNotes", notes=[{
-                "deckName": deck_name,
-                "modelName": MODEL,
-                "fields": {
-                    "日文": note["日文"],
-                    "音调核": note["音调核"],
-                    "词性": note["词性"],
-                    "基本形": note["基本形"],
-                    "外来语": note["外来语"],
-                    "中文": note["中文"],
-                    "音频": note["音频"],
-                    "是否需要从汉字到假名": note["是否需要从汉字到假名"],
-                    "是否需要缩小日文": note.get("是否需要缩小日文", ""),
-                    "是否需要缩小假名": note.get("是否需要缩小假名", ""),
-                    "是否需要缩小中文": note.get("是否需要缩小中文", ""),
-                    "例句": "",
-                    "課": note["_lesson"],
-                    "例句音频": "",
-                    "笔记": "",
-                },
-                "options": {"allowDuplicate": False},
-                "tags": [lesson, note["词性"]] if lesson else [note["词性"]],
-            }])
-            if ids and ids[0]:
-                added += 1
-            else:
-                skipped += 1
-        except Exception:
-            skipped += 1
-        if (i + 1) % 100 == 0:
-            sys.stdout.write(f"\r  [{i+1}/{len(notes)}] +{added}")
-            sys.stdout.flush()
-    print(f"\r  {added} 张新卡片, {skipped} 张跳过")
+            anki("deleteNotes", notes=removes)
+            print(f"  删除 {len(removes)} 个 apkg 中已不存在的单词")
+        except Exception as e:
+            print(f"  ✗ 删除失败: {e}")
+            keep = set(manifest["notes"])  # 留在 manifest 里，下次重试
+    manifest["notes"] = {k: m for k, m in manifest["notes"].items() if k in keep}
 
-    # 8. Suspend all 中文→日文 cards (ord=1, 0-indexed)
+    save_manifest(profile, manifest)
+
+    # 8. Suspend 中文→日文 cards (ord=1, 0-indexed) — 只挂起本次新增的，
+    #    已用 unlock.py 解锁的卡片不受影响
     print(f"\n[6/6] 挂起「中文→日文」卡片...")
     try:
-        # Find all cards for this deck, then filter by template ord
-        card_ids = anki("findCards", query=f'"deck:{DECK}" card:2')
+        if full:
+            # Find all cards for this deck, then filter by template ord
+            card_ids = anki("findCards", query=f'"deck:{DECK}" card:2')
+        elif new_nids:
+            card_ids = anki("findCards", query=f'nid:{",".join(map(str, new_nids))} card:2')
+        else:
+            card_ids = []
         if card_ids:
             anki("suspend", cards=card_ids)
             print(f"  {len(card_ids)} 张「中文→日文」卡片已挂起")
@@ -647,13 +874,13 @@ def main():
 
     # Summary
     print(f"\n{'=' * 55}")
-    print(f"  ✅ 导入完成！")
+    print(f"  ✅ 导入完成！{'（全量）' if full else '（增量）'}")
     print(f"  牌组: {DECK} ({len(lessons)} 课)")
-    print(f"  单词: {added}  音频: {uploaded}")
+    print(f"  新增: {added}  更新: {len(updates)}  删除: {len(removes)}  音频: {uploaded}")
     print(f"  日文→含义: 正常学习")
     print(f"  中文→日文: 已挂起 (run unlock.py)")
     print(f"{'=' * 55}")
-    zf.close()
+    apkg.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+按路径上传媒体 — storeMediaFile 传 path，不再把 base64 塞进 JSON
+  - 数据先写到本地暂存目录 .cache/media_stage/，把绝对路径交给 AnkiConnect，
+    由 Anki 自己读文件拷进媒体库：省掉 base64 编码、4/3 体积膨胀和大 JSON 字符串
+  - apkg 里的媒体用 copyfileobj 分块流到暂存文件，不整块读进内存
+  - AnkiConnect 不在本机（ANKICONNECT_URL 指向别的主机）时 Anki 读不到本地路径，
+    退回 base64 data；MEDIA_BY_PATH=0 可强制退回
+  - 请求完成后 release() 删掉对应暂存文件（mkstemp 文件名唯一，多进程共用目录不冲突）
+
+用法:
+  p = media_stage.params("a.mp3", data)            # 或 stream=zf.open(num)
+  anki("storeMediaFile", **p)
+  media_stage.release(p)
+
+  media_stage.store("a.mp3", data)                  # 上面三行的简写
+"""
+import base64
+import os
+import shutil
+import sys
+import tempfile
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import ankiconnect
+
+STAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "media_stage")
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+COPY_CHUNK = 1024 * 1024
+
+
+def by_path():
+    """Can the receiving side read files from this machine's disk?"""
+    if os.environ.get("MEDIA_BY_PATH") == "0":
+        return False
+    if ankiconnect._backend is not None:  # --direct：同一进程
+        return True
+    return urllib.parse.urlsplit(ankiconnect.ANKI_URL).hostname in LOCAL_HOSTS
+
+
+def params(filename, data=None, stream=None):
+    """storeMediaFile params for `filename` from bytes or a readable stream:
+    {"filename", "path"} when staged locally, else {"filename", "data"}."""
+    if not by_path():
+        raw = data if data is not None else stream.read()
+        return {"filename": filename, "data": base64.b64encode(raw).decode("utf-8")}
+    os.makedirs(STAGE_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=STAGE_DIR, suffix=os.path.splitext(filename)[1])
+    with os.fdopen(fd, "wb") as out:
+        if data is not None:
+            out.write(data)
+        else:
+            shutil.copyfileobj(stream, out, COPY_CHUNK)
+    return {"filename": filename, "path": path}
+
+
+def release(p):
+    """Delete the staged file behind params() once its request is done."""
+    path = p.get("path")
+    if path:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def store(filename, data):
+    """storeMediaFile one file (by path when possible)."""
+    p = params(filename, data)
+    try:
+        return ankiconnect.anki("storeMediaFile", **p)
+    finally:
+        release(p)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+内容寻址的媒体同步 — 只上传 Anki 里缺失或内容变化的文件
+  - 每个文件算 sha1；内容相同、文件名不同的只传一份（canonical = 组内最小文件名），
+    rewrite() 把字段里的 [sound:别名] / 纯文件名 改成 canonical
+  - getMediaFilesNames 取 Anki 已有文件名 + .cache/media_manifest_<profile>.json
+    记录上次传过的 sha1：已存在且 sha1 没变 → 跳过
+  - 统计 bytes_sent / bytes_skipped
+  - 哈希和上传都按流读取；上传经 media_stage 按路径交给 Anki（不 base64）
+
+用法:
+  sync = MediaSync(profile, {filename: opener})   # opener() → 可读的二进制流
+  fields = sync.rewrite(field_value)
+  stored, requests = asyncio.run(sync.upload())
+  sync.save()
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ankiconnect import anki
+from ankiconnect_async import AsyncAnki, run_bounded
+import media_stage
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+BATCH = 50         # 每个 multi 请求的 storeMediaFile 数
+ASYNC_LIMIT = 2    # 同时在途的 multi 请求数
+HASH_CHUNK = 256 * 1024
+
+_SOUND_RE = re.compile(r"\[sound:([^\]]+)\]")
+
+
+def _fmt_bytes(n):
+    return f"{n / 1024 / 1024:.1f} MB" if n >= 1024 * 1024 else f"{n / 1024:.0f} KB"
+
+
+def manifest_path(profile):
+    return os.path.join(CACHE_DIR, f"media_manifest_{profile}.json")
+
+
+class MediaSync:
+    def __init__(self, profile, openers):
+        self.profile = profile
+        self.openers = openers
+        self.sha1 = {}
+        self.size = {}
+        for name, opener in openers.items():
+            h, size = hashlib.sha1(), 0
+            with opener() as f:
+                for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+                    h.update(chunk)
+                    size += len(chunk)
+            self.sha1[name] = h.hexdigest()
+            self.size[name] = size
+
+        # 相同内容 → 组内最小文件名作为 canonical（与 profile 无关，结果稳定）
+        groups = {}
+        for name in sorted(self.sha1):
+            groups.setdefault(self.sha1[name], []).append(name)
+        self.aliases = {n: g[0] for g in groups.values() for n in g[1:]}
+
+        try:
+            with open(manifest_path(profile), "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError):
+            self.manifest = {}
+
+        self.bytes_sent = 0
+        self.bytes_skipped = 0
+        self.skipped = 0
+
+    def canonical(self, name):
+        return self.aliases.get(name, name)
+
+    def rewrite(self, text):
+        """Point [sound:alias] / a bare alias filename at its canonical file."""
+        if not self.aliases or not text:
+            return text
+        if text in self.aliases:
+            return self.aliases[text]
+        return _SOUND_RE.sub(lambda m: f"[sound:{self.canonical(m.group(1))}]", text)
+
+    def pending(self):
+        """Canonical files Anki is missing, or whose content changed since the
+        last sync. Files already present but never synced by us are trusted."""
+        present = set(anki("getMediaFilesNames", pattern="*") or [])
+        todo = []
+        for name in sorted(self.sha1):
+            if name in self.aliases:
+                self.skipped += 1
+                self.bytes_skipped += self.size[name]
+                continue
+            known = self.manifest.get(name)
+            if name in present and known in (None, self.sha1[name]):
+                self.manifest[name] = self.sha1[name]
+                self.skipped += 1
+                self.bytes_skipped += self.size[name]
+            else:
+                todo.append(name)
+        return todo
+
+    async def upload(self, names=None):
+        """Upload `names` (default: pending()) via multi(storeMediaFile).
+        Returns (stored filenames, requests)."""
+        names = self.pending() if names is None else names
+        stored = set()
+        done = 0
+        async with AsyncAnki(limit=ASYNC_LIMIT) as client:
+            async def send(chunk):
+                nonlocal done
+                staged = []
+                for name in chunk:
+                    with self.openers[name]() as f:
+                        staged.append(media_stage.params(name, stream=f))
+                try:
+                    results = await client.multi([("storeMediaFile", p) for p in staged])
+                finally:
+                    for p in staged:
+                        media_stage.release(p)
+                for name, r in zip(chunk, results):
+                    if not isinstance(r, Exception):
+                        stored.add(name)
+                        self.manifest[name] = self.sha1[name]
+                        self.bytes_sent += self.size[name]
+                done += len(chunk)
+                sys.stdout.write(f"\r  [{done}/{len(names)}]")
+                sys.stdout.flush()
+
+            await run_bounded((send(names[i:i + BATCH])
+                               for i in range(0, len(names), BATCH)),
+                              limit=ASYNC_LIMIT)
+            return stored, client.requests
+
+    def mark_stored(self, names):
+        """Record files delivered some other way (e.g. inside an importPackage .apkg)."""
+        for name in names:
+            self.manifest[name] = self.sha1[name]
+            self.bytes_sent += self.size[name]
+
+    def save(self):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        path = manifest_path(self.profile)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f)
+        os.replace(path + ".tmp", path)
+
+    def report(self):
+        return (f"发送 {_fmt_bytes(self.bytes_sent)}, 跳过 {self.skipped} 个 "
+                f"{_fmt_bytes(self.bytes_skipped)}（其中 {len(self.aliases)} 个重复内容）")
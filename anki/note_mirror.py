@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+笔记本地镜像 — 每个 Profile 一个 SQLite，筛选在本地完成，不再每次 notesInfo 整个牌组
+  - .cache/notes_<profile>.sqlite：note id / mod / 完整 notesInfo
+  - refresh(query)：findNotes（只有 id）+ notesModTime（id → mod），
+    只对 mod 变了的笔记调 notesInfo；查不到的从这个 query 的范围里删掉
+  - 筛选写在 query 里交给 Anki（anki_query.build(filled=…, empty=…)），镜像只按 query 取回
+  - 旧版 AnkiConnect 没有 notesModTime 时退回整批 notesInfo（结果一样，只是不省流量）
+
+用法:
+  query = anki_query.build(deck=DECK, filled=["例句"], empty=["例句音频"])
+  mirror = NoteMirror()                         # 当前 Profile
+  mirror.refresh(query)
+  for n in mirror.notes(query):
+      n["noteId"], n["fields"]["例句"]["value"]  # 与 notesInfo 同结构
+"""
+import json
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ankiconnect import anki, iter_notes_info
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
+
+def active_profile():
+    try:
+        return anki("getActiveProfile")
+    except Exception:
+        return "default"  # 旧版 AnkiConnect 没有 getActiveProfile
+
+
+class NoteMirror:
+    def __init__(self, profile=None):
+        self.profile = profile or active_profile()
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(CACHE_DIR, f"notes_{self.profile}.sqlite"))
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS notes (
+                id INTEGER PRIMARY KEY, mod INTEGER, fetched INTEGER, info TEXT);
+            DROP TABLE IF EXISTS fields;
+            CREATE TABLE IF NOT EXISTS scope (
+                query TEXT, nid INTEGER, PRIMARY KEY (query, nid));
+        """)
+
+    def close(self):
+        self.db.close()
+
+    def refresh(self, query):
+        """Bring the notes matching `query` up to date. Returns their ids."""
+        t0 = time.perf_counter()
+        nids = anki("findNotes", query=query) or []
+        try:
+            mods = {m["noteId"]: m["mod"] for m in anki("notesModTime", notes=nids)} if nids else {}
+            known = {nid: (mod, fetched) for nid, mod, fetched
+                     in self.db.execute("SELECT id, mod, fetched FROM notes")}
+            # mod 只精确到秒：拉取的那一秒内被改过的笔记，之后同一秒可能又改了，也重新拉
+            stale = [n for n in nids
+                     if n not in known or known[n][0] != mods.get(n) or known[n][0] >= known[n][1]]
+        except Exception:
+            stale = nids  # 旧版 AnkiConnect：全部重新拉
+
+        self._store(iter_notes_info(stale))
+
+        with self.db:
+            self.db.execute("DELETE FROM scope WHERE query = ?", (query,))
+            self.db.executemany("INSERT INTO scope VALUES (?, ?)", ((query, n) for n in nids))
+            # 不在任何 query 范围内的笔记（已删除）一起清掉
+            self.db.execute("DELETE FROM notes WHERE id NOT IN (SELECT nid FROM scope)")
+        print(f"  镜像 {self.profile}: {len(nids)} 条笔记，拉取 {len(stale)} 条 "
+              f"({(time.perf_counter() - t0) * 1000:.0f}ms)")
+        return nids
+
+    def _store(self, infos):
+        fetched = int(time.time())
+        with self.db:
+            for n in infos:
+                if not n:
+                    continue  # 刚好被删掉
+                nid = n["noteId"]
+                self.db.execute("INSERT OR REPLACE INTO notes VALUES (?, ?, ?, ?)",
+                                (nid, n.get("mod", 0), fetched, json.dumps(n, ensure_ascii=False)))
+
+    def notes(self, query):
+        """notesInfo-shaped dicts for the notes of `query`'s last refresh."""
+        return [json.loads(info) for (info,) in self.db.execute(
+            "SELECT n.info FROM scope s JOIN notes n ON n.id = s.nid WHERE s.query = ? ORDER BY n.id",
+            (query,))]
@@ -1,136 +1,171 @@
 #!/usr/bin/env python3
-"""解析 初级1/文法.md → grammar_data.json"""
+"""
+解析 初级1/文法.md + 初级2/文法.md → grammar_data.json（按课增量）
+  - 源文件按「## 第N課」切成课，每课内容算 sha1；和上次一样的课直接用缓存的解析结果
+  - 缓存：.cache/grammar_lessons.json（课 → hash + 语法点）
+  - 有课变化（新增 / 修改 / 删除）才重写 grammar_data.json，并记下变化的课号，
+    下游（generate_grammar_quiz --update）只处理这些课
+
+用法:
+  python3 anki/parse_grammar.py           # 增量
+  python3 anki/parse_grammar.py --force   # 忽略缓存全部重新解析
+"""
+import argparse
+import hashlib
 import json
-import re
 import os
+import re
 
-GRAMMAR_MD = os.path.join(os.path.dirname(os.path.abspath(__file__)),
-                          "..", "初级1", "文法.md")
-OUT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
-                   "grammar", "grammar_data.json")
+DIR = os.path.dirname(os.path.abspath(__file__))
+BOOKS = [os.path.join(DIR, "..", book, "文法.md") for book in ("初级1", "初级2")]
+OUT = os.path.join(DIR, "grammar", "grammar_data.json")
+CACHE = os.path.join(DIR, ".cache", "grammar_lessons.json")
+PARSER_VERSION = 1  # 解析逻辑改了就加 1，缓存全部失效
 
+LESSON_RE = re.compile(r"^## 第(\d+)課", re.M)
+POINT_RE = re.compile(r"^### (\d+)\. (.+)$")
+BODY_END_RE = re.compile(r"^(?:###? |---)")
+CN_RE = re.compile(r"（(.+?)）\s*$")
+CIRCLE_NUMS = "①②③④⑤⑥⑦⑧⑨⑩⑪⑫⑬⑭⑮⑯⑰⑱⑲⑳"
 
-def parse():
-    with open(GRAMMAR_MD, "r", encoding="utf-8") as f:
-        text = f.read()
 
-    results = []
-    current_lesson = ""
+def split_lessons(text):
+    """[(lesson_num, section text)] for every ## 第N課 section."""
+    heads = list(LESSON_RE.finditer(text))
+    return [(int(m.group(1)), text[m.start():heads[k + 1].start() if k + 1 < len(heads) else len(text)])
+            for k, m in enumerate(heads)]
 
-    # Split into lines for processing
-    lines = text.split("\n")
+
+def parse_lesson(lesson_num, section):
+    """Grammar points of one ## 第N課 section."""
+    lesson = f"第{lesson_num}課"
+    results = []
+    lines = section.split("\n")
     i = 0
     while i < len(lines):
-        line = lines[i]
+        # Detect grammar point: ### N. title
+        m = POINT_RE.match(lines[i])
+        i += 1
+        if not m:
+            continue
+        number = int(m.group(1))
+        title = m.group(2).strip()
 
-        # Detect lesson heading: ## 第N課
-        m = re.match(r"^## 第(\d+)課", line)
-        if m:
-            current_lesson = f"第{m.group(1)}課"
+        # Collect everything until next ### or ## or ---
+        body_lines = []
+        while i < len(lines) and not BODY_END_RE.match(lines[i]):
+            body_lines.append(lines[i])
             i += 1
-            continue
 
-        # Detect grammar point: ### N. title
-        m = re.match(r"^### (\d+)\. (.+)$", line)
-        if m:
-            number = int(m.group(1))
-            title = m.group(2).strip()
+        examples = []
+        explanation_lines = []
+        for bline in body_lines:
+            stripped = bline.strip()
+            if not stripped:
+                continue
+            # Example: ① JP text（CN text）
+            if stripped[0] in CIRCLE_NUMS:
+                content = stripped[1:].strip()
+                cn_match = CN_RE.search(content)
+                if cn_match:
+                    examples.append({"jp": content[:cn_match.start()].strip(),
+                                     "cn": cn_match.group(1)})
+                else:
+                    examples.append({"jp": content, "cn": ""})
+                continue
+            # Skip response lines (……), tables and × (wrong usage) lines
+            if stripped.startswith(("……", "|", "---", "×")):
+                continue
+            explanation_lines.append(stripped)
+
+        results.append({
+            "id": f"L{lesson_num}-{number}",
+            "lesson": lesson,
+            "lesson_num": lesson_num,
+            "number": number,
+            "title": title,
+            "explanation": "\n".join(explanation_lines),
+            "examples": examples,
+        })
+    return results
 
-            # Collect everything until next ### or ## or end
-            i += 1
-            body_lines = []
-            while i < len(lines):
-                if re.match(r"^###? ", lines[i]) or re.match(r"^---", lines[i]):
-                    break
-                body_lines.append(lines[i])
-                i += 1
-
-            body = "\n".join(body_lines)
-
-            # Extract examples: lines starting with circled numbers ①②③...
-            # Pattern: ① Japanese text（Chinese text）
-            examples = []
-            circle_nums = "①②③④⑤⑥⑦⑧⑨⑩⑪⑫⑬⑭⑮⑯⑰⑱⑲⑳"
-            for bline in body_lines:
-                bline = bline.strip()
-                if not bline:
-                    continue
-                # Check if line starts with a circled number
-                if bline and bline[0] in circle_nums:
-                    # Extract JP and CN parts
-                    # Format: ① JP text（CN text）
-                    content = bline[1:].strip()
-                    # Find Chinese in （...）
-                    cn_match = re.search(r"（(.+?)）\s*$", content)
-                    if cn_match:
-                        cn = cn_match.group(1)
-                        jp = content[:cn_match.start()].strip()
-                    else:
-                        jp = content
-                        cn = ""
-                    examples.append({"jp": jp, "cn": cn})
-
-            # Build explanation: non-example, non-empty lines
-            explanation_lines = []
-            for bline in body_lines:
-                stripped = bline.strip()
-                if not stripped:
-                    continue
-                # Skip example lines (circled numbers)
-                if stripped and stripped[0] in circle_nums:
-                    continue
-                # Skip response lines starting with ……
-                if stripped.startswith("……"):
-                    continue
-                # Skip table lines
-                if stripped.startswith("|") or stripped.startswith("---"):
-                    continue
-                # Skip [注] lines (include them actually - they're useful)
-                # Skip × lines (wrong usage examples)
-                if stripped.startswith("×"):
-                    continue
-                explanation_lines.append(stripped)
-
-            explanation = "\n".join(explanation_lines)
-
-            # Build global ID
-            global_id = f"L{current_lesson[1:-1].replace('第','').replace('課','')}-{number}"
-
-            results.append({
-                "id": global_id,
-                "lesson": current_lesson,
-                "lesson_num": int(re.search(r"\d+", current_lesson).group()),
-                "number": number,
-                "title": title,
-                "explanation": explanation,
-                "examples": examples,
-            })
-            continue
 
-        i += 1
+def load_cache():
+    try:
+        with open(CACHE, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        if cache.get("version") == PARSER_VERSION:
+            return cache
+    except (OSError, ValueError):
+        pass
+    return {"version": PARSER_VERSION, "lessons": {}, "changed": []}
 
-    return results
+
+def save_cache(cache):
+    os.makedirs(os.path.dirname(CACHE), exist_ok=True)
+    with open(CACHE, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False)
+
+
+def parse(force=False):
+    """Parse both books, reusing unchanged lessons; rewrite OUT if anything changed.
+    Returns (grammar points, changed lesson numbers, lessons re-parsed)."""
+    cache = {"version": PARSER_VERSION, "lessons": {}, "changed": []} if force else load_cache()
+    old = cache["lessons"]
+    lessons = {}
+    parsed = 0
+    for path in BOOKS:
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        for num, section in split_lessons(text):
+            h = hashlib.sha1(section.encode("utf-8")).hexdigest()
+            prev = old.get(str(num))
+            if prev and prev["hash"] == h:
+                lessons[str(num)] = prev
+            else:
+                lessons[str(num)] = {"hash": h, "items": parse_lesson(num, section)}
+                parsed += 1
+
+    changed = sorted(int(n) for n in set(old) | set(lessons)
+                     if (old.get(n) or {}).get("items") != (lessons.get(n) or {}).get("items"))
+    data = [item for n in sorted(lessons, key=int) for item in lessons[n]["items"]]
+    # 先写 OUT 再存缓存：中途失败时下次还会当作有变化
+    if changed or force or not os.path.exists(OUT):
+        os.makedirs(os.path.dirname(OUT), exist_ok=True)
+        with open(OUT, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    if parsed or changed:
+        cache["lessons"] = lessons
+        if changed:
+            cache["changed"] = changed  # 没变化的重跑不覆盖，下游还能拿到上次的变化
+        save_cache(cache)
+    return data, changed, parsed
+
+
+def changed_lessons():
+    """Lesson numbers that changed in the last parse that changed anything."""
+    return load_cache()["changed"]
 
 
 def main():
-    data = parse()
-    os.makedirs(os.path.dirname(OUT), exist_ok=True)
-    with open(OUT, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    parser = argparse.ArgumentParser(description="文法.md → grammar_data.json")
+    parser.add_argument("--force", action="store_true", help="忽略缓存，全部重新解析")
+    args = parser.parse_args()
 
-    # Summary
+    data, changed, parsed = parse(force=args.force)
     lessons = {}
     for item in data:
-        l = item["lesson"]
-        lessons[l] = lessons.get(l, 0) + 1
-
-    print(f"✅ 解析完成: {len(data)} 个语法点")
-    total_ex = sum(len(item["examples"]) for item in data)
-    print(f"   例句总数: {total_ex}")
-    print(f"   课数: {len(lessons)}")
-    for l in sorted(lessons, key=lambda x: int(re.search(r"\d+", x).group())):
-        print(f"   {l}: {lessons[l]} 个语法点")
-    print(f"\n→ {OUT}")
+        lessons[item["lesson"]] = lessons.get(item["lesson"], 0) + 1
+
+    print(f"✅ 解析完成: {len(data)} 个语法点，{len(lessons)} 课（重新解析 {parsed} 课）")
+    print(f"   例句总数: {sum(len(item['examples']) for item in data)}")
+    if changed or args.force:
+        print(f"   变化的课: {', '.join(f'第{n}課' for n in changed) or '无'}")
+        print(f"\n→ {OUT}")
+    else:
+        print("   没有变化，grammar_data.json 未改写")
 
 
 if __name__ == "__main__":
@@ -2,75 +2,74 @@
 """
 同步词库到 czh 和 szmz 两个 Profile
 切换 Profile → 导入/更新卡片 → 切换下一个
+
+用法:
+  python3 anki/sync.py            # 通过 AnkiConnect，依次切换两个 Profile
+  python3 anki/sync.py --direct   # Anki 关闭时直接写 collection，两个 Profile 并行导入
+  python3 anki/sync.py --full     # 删牌组全量重导（默认增量，保留复习记录）
 """
-import json
-import urllib.request
+import argparse
 import os
 import sys
-import time
 import subprocess
 
-os.environ.pop("http_proxy", None)
-os.environ.pop("https_proxy", None)
-os.environ.pop("HTTP_PROXY", None)
-os.environ.pop("HTTPS_PROXY", None)
-os.environ["no_proxy"] = "localhost,127.0.0.1"
-_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ankiconnect import anki, switch_profile, wait_for_anki
+from collection_backend import check_direct
 
-ANKI_URL = "http://localhost:8765"
 PROFILES = ["szmz", "czh"]
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
-def anki(action, **params):
-    payload = json.dumps({"action": action, "version": 6, "params": params})
-    req = urllib.request.Request(ANKI_URL, data=payload.encode("utf-8"),
-                                 headers={"Content-Type": "application/json"})
-    resp = _opener.open(req)
-    r = json.loads(resp.read())
-    if r.get("error") and isinstance(r["error"], str):
-        raise Exception(r["error"])
-    return r.get("result")
-
-
-def wait_for_anki(timeout=30):
-    """Wait for AnkiConnect to be ready after profile switch"""
-    for i in range(timeout):
-        try:
-            anki("version")
-            return True
-        except Exception:
-            if i % 5 == 0:
-                sys.stdout.write(f"\r  等待 Anki 就绪... ({i}s)")
-                sys.stdout.flush()
-            time.sleep(1)
-    print()
-    return False
-
-
-def switch_profile(name):
-    """Switch profile with robust retry logic"""
-    # First try loadProfile
-    try:
-        result = anki("loadProfile", name=name)
-        if result:
-            time.sleep(5)
-            if wait_for_anki(30):
-                return True
-    except Exception:
-        pass
-
-    # If loadProfile failed (connection reset during switch), wait longer
-    print(f"  等待 Profile 切换完成...")
-    time.sleep(8)
-    return wait_for_anki(30)
+def sync_direct(extra):
+    """Import into every profile at once, one import_apkg process each."""
+    err = check_direct(PROFILES)
+    if err:
+        print(f"✗ {err}")
+        return False
+
+    import_script = os.path.join(SCRIPT_DIR, "import_apkg.py")
+    procs = {}
+    for profile in PROFILES:
+        procs[profile] = subprocess.Popen(
+            [sys.executable, import_script, "--direct", "--profile", profile] + extra,
+            cwd=SCRIPT_DIR, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            text=True)
+        print(f"  ▶ {profile}: 导入中 (pid {procs[profile].pid})")
+
+    ok = True
+    for profile, proc in procs.items():
+        out, _ = proc.communicate()
+        print(f"\n{'─' * 50}")
+        print(f"  {profile}")
+        print(f"{'─' * 50}")
+        print(out, end="")
+        if proc.returncode != 0:
+            print(f"  ✗ 导入失败 (exit {proc.returncode})")
+            ok = False
+    return ok
 
 
 def main():
+    parser = argparse.ArgumentParser(description="同步词库到两个 Profile")
+    parser.add_argument("--direct", action="store_true",
+                        help="Anki 关闭时直接读写 collection，两个 Profile 并行")
+    parser.add_argument("--full", action="store_true",
+                        help="删除牌组后全量重导（清空复习记录）")
+    args = parser.parse_args()
+    extra = ["--full"] if args.full else []
+
     print("=" * 50)
     print("  同步词库 → czh + szmz")
     print("=" * 50)
 
+    if args.direct:
+        if sync_direct(extra):
+            print(f"\n{'=' * 50}")
+            print("  ✅ 两个 Profile 同步完成！（direct）")
+            print(f"{'=' * 50}")
+        return
+
     # Check Anki is running
     if not wait_for_anki(5):
         print("✗ 请打开 Anki")
@@ -87,16 +86,17 @@ def main():
         print(f"  切换到 Profile: {profile}")
         print(f"{'─' * 50}")
 
-        if not switch_profile(profile):
+        elapsed = switch_profile(profile)
+        if elapsed is None:
             print(f"  ✗ 切换超时，跳过")
             continue
 
-        print(f"  ✓ 已切换到 {profile}")
+        print(f"  ✓ 已切换到 {profile} ({elapsed:.1f}s)")
 
         # Run import script as subprocess
         import_script = os.path.join(SCRIPT_DIR, "import_apkg.py")
         proc = subprocess.run(
-            [sys.executable, import_script],
+            [sys.executable, import_script] + extra,
             cwd=SCRIPT_DIR,
             capture_output=False,
         )
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+daemon 的 VOICEVOX 暂停逻辑 — 引擎探测成功一次后停掉，tts 任务要进入 waiting 而不是排队
+
+  python3 -m unittest anki/test_daemon.py
+"""
+import json
+import os
+import sys
+import threading
+import types
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import anki_emulator
+import ankiconnect
+import daemon
+import voicevox
+
+
+class FakeEngine(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps("0.14.0").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class VoicevoxStopsTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = ThreadingHTTPServer(("127.0.0.1", 0), FakeEngine)
+        threading.Thread(target=self.engine.serve_forever, daemon=True).start()
+        self.saved = voicevox.VOICEVOX_URL, voicevox._version, ankiconnect.ANKI_URL
+        voicevox.VOICEVOX_URL = f"http://127.0.0.1:{self.engine.server_address[1]}"
+        voicevox._version = None
+
+    def tearDown(self):
+        voicevox.VOICEVOX_URL, voicevox._version, ankiconnect.ANKI_URL = self.saved
+        ankiconnect.close()
+
+    def stop_engine(self):
+        self.engine.shutdown()
+        self.engine.server_close()
+
+    def test_is_running_after_engine_stops(self):
+        self.assertTrue(voicevox.is_running())
+        self.assertEqual(voicevox.version(), "0.14.0")
+        self.stop_engine()
+        self.assertFalse(voicevox.is_running())
+        self.assertIsNone(voicevox._version)
+
+    def test_tts_task_waits_instead_of_queueing(self):
+        args = types.SimpleNamespace(unlock_every=0, fill_every=0, tts_every=0, poll=60,
+                                     threshold=3, workers=1, port=0)
+        with anki_emulator.serve() as url:
+            ankiconnect.ANKI_URL = url
+            d = daemon.Daemon(args)
+            task = d.tasks["tts"]
+            d.tick()
+            self.assertIsNone(task.waiting)
+            self.assertIn("tts", d.queue)  # 首次探测 → 排队
+
+            d.queue.clear()
+            task.signature.clear()  # 签名不同，引擎在的话会再排队
+            self.stop_engine()
+            d.tick()
+            self.assertIn("VOICEVOX", task.waiting)
+            self.assertNotIn("tts", d.queue)
+            self.assertEqual(task.errors, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
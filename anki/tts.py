@@ -15,69 +15,47 @@ Usage:
   python3 anki/tts.py --words --deck 補充単語 --all-profiles
   python3 anki/tts.py --examples --all-profiles
 
+  # Anki closed: open both collections directly, profiles in parallel
+  python3 anki/tts.py --words --deck 補充単語 --direct
+
+  # Convert already generated tts_*.wav to the compressed format (TTS_FORMAT)
+  python3 anki/tts.py --reencode --deck みんなの日本語初级1-2 単語 --all-profiles
+
   # List available speakers
   python3 anki/tts.py --list-speakers
 """
-import json
-import urllib.request
 import os
 import sys
+import base64
 import hashlib
 import re
-import time
-import base64
 import argparse
+from concurrent.futures import wait
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ankiconnect import Batch, anki, iter_notes_info, switch_profile, wait_for_anki
+from collection_backend import check_direct, run_profiles
+from note_mirror import NoteMirror
+import anki_query
+import anki_text
+import audio_encode
+import media_stage
+import voicevox
+import tts_pipeline
 
-os.environ.pop("http_proxy", None)
-os.environ.pop("https_proxy", None)
-os.environ.pop("HTTP_PROXY", None)
-os.environ.pop("HTTPS_PROXY", None)
-os.environ["no_proxy"] = "localhost,127.0.0.1"
-_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
-
-ANKI_URL = "http://localhost:8765"
-VOICEVOX_URL = "http://127.0.0.1:50021"
 MODEL = "みんなの日本語"
 PROFILES = ["szmz", "czh"]
+WAV_REF = re.compile(r"tts_\w+\.wav")  # 本工具生成过的 WAV（[sound:] 或纯文件名）
 
 # Speaker IDs — will be resolved at runtime from /speakers
 SPEAKER_WORD = None   # 琴詠ニア
 SPEAKER_EXAMPLE = None  # 剣崎雌雄
 
 
-def anki(action, **params):
-    payload = json.dumps({"action": action, "version": 6, "params": params})
-    req = urllib.request.Request(ANKI_URL, data=payload.encode("utf-8"),
-                                 headers={"Content-Type": "application/json"})
-    resp = _opener.open(req)
-    r = json.loads(resp.read())
-    if r.get("error") and isinstance(r["error"], str):
-        raise Exception(r["error"])
-    return r.get("result")
-
-
-def voicevox_get(path):
-    req = urllib.request.Request(f"{VOICEVOX_URL}{path}")
-    resp = _opener.open(req)
-    return json.loads(resp.read())
-
-
-def voicevox_post(path, data=None, content_type="application/json"):
-    body = json.dumps(data).encode("utf-8") if data else None
-    req = urllib.request.Request(f"{VOICEVOX_URL}{path}", data=body,
-                                 headers={"Content-Type": content_type} if body else {})
-    if not body:
-        req = urllib.request.Request(f"{VOICEVOX_URL}{path}", data=b"",
-                                     method="POST")
-    resp = _opener.open(req)
-    return resp.read()
-
-
 def resolve_speakers():
     """Find speaker IDs for 琴詠ニア and 剣崎雌雄"""
     global SPEAKER_WORD, SPEAKER_EXAMPLE
-    speakers = voicevox_get("/speakers")
-    for s in speakers:
+    for s in voicevox.speakers():
         name = s["name"]
         if "琴詠ニア" in name:
             # Use the first style
@@ -88,188 +66,185 @@ def resolve_speakers():
 
 
 def list_speakers():
-    speakers = voicevox_get("/speakers")
-    for s in speakers:
+    for s in voicevox.speakers():
         print(f"\n{s['name']}:")
         for st in s["styles"]:
             print(f"  [{st['id']}] {st['name']}")
 
 
-def clean_text(text):
-    """Remove furigana markup and HTML tags, extract plain text for TTS"""
-    # Remove HTML tags
-    text = re.sub(r"<[^>]+>", "", text)
-    # Handle furigana: 食[た]べる → 食べる (keep kanji, remove bracket content)
-    # But also handle ruby: <ruby>食<rt>た</rt></ruby> → 食
-    text = re.sub(r"\[([^\]]*)\]", "", text)
-    # Remove sound references
-    text = re.sub(r"\[sound:[^\]]+\]", "", text)
-    # Clean whitespace
-    text = text.strip()
-    return text
-
-
-def generate_audio(text, speaker_id):
-    """Generate WAV audio via VOICEVOX"""
-    # Step 1: audio_query
-    encoded = urllib.parse.quote(text)
-    query_url = f"/audio_query?text={encoded}&speaker={speaker_id}"
-    req = urllib.request.Request(f"{VOICEVOX_URL}{query_url}", data=b"", method="POST")
-    resp = _opener.open(req)
-    query = json.loads(resp.read())
-
-    # Step 2: synthesis
-    synth_url = f"/synthesis?speaker={speaker_id}"
-    req = urllib.request.Request(f"{VOICEVOX_URL}{synth_url}",
-                                 data=json.dumps(query).encode("utf-8"),
-                                 headers={"Content-Type": "application/json"})
-    resp = _opener.open(req)
-    return resp.read()  # WAV bytes
-
-
 def make_filename(prefix, text):
     """Generate deterministic filename from text"""
     h = hashlib.md5(text.encode("utf-8")).hexdigest()[:10]
-    return f"tts_{prefix}_{h}.wav"
+    return f"tts_{prefix}_{h}.{audio_encode.extension()}"
+
+
+def _dry_run(items, prefix):
+    count = 0
+    for _, raw in items:
+        text = anki_text.plain(raw)
+        if text:
+            print(f"  {text[:30]} → {make_filename(prefix, text)} (dry-run)")
+            count += 1
+    print(f"  Generated: {count}")
+    return count
 
 
-def process_words(deck, dry_run=False):
+def process_words(deck, dry_run=False, workers=tts_pipeline.WORKERS):
     """Generate word audio for cards missing 音频 field"""
     print(f"\n--- 単語音声 ({deck}) ---")
     if SPEAKER_WORD is None:
         print("  ! 琴詠ニア not found in VOICEVOX speakers")
         return 0
 
-    # Find notes with empty 音频
-    note_ids = anki("findNotes", query=f'"deck:{deck}" 音频:')
-    if not note_ids:
-        # Try broader: all notes in deck
-        note_ids = anki("findNotes", query=f'"deck:{deck}"')
-
-    if not note_ids:
-        print("  No notes found")
+    # Only notes with 日文 but empty 音频 — nothing to do → nothing fetched
+    query = anki_query.build(deck=deck, filled=["日文"], empty=["音频"])
+    mirror = NoteMirror()
+    if not mirror.refresh(query):
+        print("  Nothing to do")
         return 0
 
-    notes_info = anki("notesInfo", notes=note_ids)
-    count = 0
-    for note in notes_info:
-        audio_val = note["fields"].get("音频", {}).get("value", "")
-        if audio_val.strip():
-            continue  # Already has audio
-
-        jp_text = note["fields"].get("日文", {}).get("value", "")
-        if not jp_text:
-            continue
-
-        text = clean_text(jp_text)
-        if not text:
-            continue
-
-        filename = make_filename("word", text)
-        print(f"  {text} → {filename}", end="")
-
-        if dry_run:
-            print(" (dry-run)")
-            count += 1
-            continue
-
-        try:
-            wav_data = generate_audio(text, SPEAKER_WORD)
-            b64 = base64.b64encode(wav_data).decode("utf-8")
-            anki("storeMediaFile", filename=filename, data=b64)
-            anki("updateNoteFields", note={
-                "id": note["noteId"],
-                "fields": {"音频": f"[sound:{filename}]"}
-            })
-            print(" OK")
-            count += 1
-        except Exception as e:
-            print(f" FAIL: {e}")
+    items = [(note["noteId"], note["fields"]["日文"]["value"])  # (note_id, 日文)
+             for note in mirror.notes(query)]
 
+    if dry_run:
+        return _dry_run(items, "word")
+    count = tts_pipeline.run(items, SPEAKER_WORD, "音频", clean=anki_text.plain,
+                             filename=lambda t: make_filename("word", t),
+                             workers=workers, batch=voicevox.MULTI_BATCH)
     print(f"  Generated: {count}")
     return count
 
 
-def process_examples(deck, dry_run=False):
+def process_examples(deck, dry_run=False, workers=tts_pipeline.WORKERS):
     """Generate example sentence audio for cards with 例句 but no 例句音频"""
     print(f"\n--- 例句音声 ({deck}) ---")
     if SPEAKER_EXAMPLE is None:
         print("  ! 剣崎雌雄 not found in VOICEVOX speakers")
         return 0
 
-    note_ids = anki("findNotes", query=f'"deck:{deck}"')
-    if not note_ids:
-        print("  No notes found")
+    query = anki_query.build(deck=deck, filled=["例句"], empty=["例句音频"])
+    mirror = NoteMirror()
+    if not mirror.refresh(query):
+        print("  Nothing to do")
         return 0
 
-    notes_info = anki("notesInfo", notes=note_ids)
-    count = 0
-    for note in notes_info:
-        example = note["fields"].get("例句", {}).get("value", "")
-        if not example.strip():
-            continue
-
-        ex_audio = note["fields"].get("例句音频", {}).get("value", "")
-        if ex_audio.strip():
-            continue  # Already has audio
-
-        text = clean_text(example)
-        if not text:
-            continue
-
-        filename = make_filename("ex", text)
-        print(f"  {text[:30]}... → {filename}", end="")
-
-        if dry_run:
-            print(" (dry-run)")
-            count += 1
-            continue
-
-        try:
-            wav_data = generate_audio(text, SPEAKER_EXAMPLE)
-            b64 = base64.b64encode(wav_data).decode("utf-8")
-            anki("storeMediaFile", filename=filename, data=b64)
-            anki("updateNoteFields", note={
-                "id": note["noteId"],
-                "fields": {"例句音频": f"[sound:{filename}]"}
-            })
-            print(" OK")
-            count += 1
-        except Exception as e:
-            print(f" FAIL: {e}")
+    items = [(note["noteId"], note["fields"]["例句"]["value"])  # (note_id, 例句)
+             for note in mirror.notes(query)]
 
+    if dry_run:
+        return _dry_run(items, "ex")
+    count = tts_pipeline.run(items, SPEAKER_EXAMPLE, "例句音频", clean=anki_text.plain,
+                             filename=lambda t: make_filename("ex", t),
+                             workers=workers)
     print(f"  Generated: {count}")
     return count
 
 
-def wait_for_anki(timeout=10):
-    for _ in range(timeout):
-        try:
-            anki("version")
-            return True
-        except Exception:
-            time.sleep(1)
-    return False
 
+def reencode_existing(deck, dry_run=False):
+    """Re-encode generated tts_*.wav referenced by 音频 / 例句音频 into
+    audio_encode's format and point the fields at the new files.
+    Old WAVs stay in the media folder until Tools → Check Media."""
+    print(f"\n--- 重新编码 ({deck}) ---")
+    ext = audio_encode.extension()
+    if ext == "wav":
+        print("  输出格式是 WAV，无需转换")
+        return 0
+    wav = "*tts_*.wav*"
+    note_ids = anki("findNotes", query=anki_query.build(deck=deck, extra=[anki_query.any_of(
+        anki_query.field("音频", wav), anki_query.field("例句音频", wav))]))
+    fields = []  # (note_id, field, value)
+    names = set()
+    for note in iter_notes_info(note_ids):
+        for field in ("音频", "例句音频"):
+            val = note["fields"].get(field, {}).get("value", "")
+            found = WAV_REF.findall(val)
+            if found:
+                names.update(found)
+                fields.append((note["noteId"], field, val))
+    print(f"  {len(names)} 个 WAV, {len(fields)} 个字段")
+    if dry_run or not names:
+        return 0
+
+    stores = {}  # wav name → storeMediaFile future
+    before = after = 0
+    with Batch(max_size=tts_pipeline.UPLOAD_BATCH) as batch:
+        for name in sorted(names):
+            b64 = anki("retrieveMediaFile", filename=name)
+            if not b64:
+                print(f"  {name} 不在媒体文件夹，跳过")
+                continue
+            wav = base64.b64decode(b64)
+            try:
+                data = audio_encode.encode(wav)
+            except Exception as e:
+                print(f"  {name} FAIL: {e}")
+                continue
+            before += len(wav)
+            after += len(data)
+            media = media_stage.params(name[:-3] + ext, data)
+            stores[name] = batch.submit("storeMediaFile", **media)
+            stores[name].add_done_callback(lambda _, media=media: media_stage.release(media))
+    # 只改上传成功的引用；失败的保持 .wav，下次 --reencode 还会选中
+    wait(stores.values())
+    converted = set()
+    for name, fut in stores.items():
+        if fut.exception():
+            print(f"  {name} upload FAIL: {fut.exception()}")
+        else:
+            converted.add(name)
+
+    def swap(m):
+        return m.group(0)[:-3] + ext if m.group(0) in converted else m.group(0)
+
+    with Batch(max_size=50) as batch:
+        for note_id, field, val in fields:
+            new = WAV_REF.sub(swap, val)
+            if new != val:
+                batch.submit("updateNoteFields", note={"id": note_id, "fields": {field: new}})
+    print(f"  ✓ {len(converted)} 个文件 {before / 1024:.0f} KB → {after / 1024:.0f} KB "
+          f"{audio_encode.describe()}，旧 WAV 可用「工具 → 检查媒体」清理")
+    return len(converted)
+
+
+def process_profile(words, examples, deck, dry_run=False, workers=tts_pipeline.WORKERS,
+                    reencode=False):
+    """Run the requested passes on the current profile."""
+    if reencode:
+        reencode_existing(deck, dry_run=dry_run)
+        return
+    if SPEAKER_WORD is None and SPEAKER_EXAMPLE is None:
+        resolve_speakers()  # --direct worker processes start without them
+    if words:
+        process_words(deck, dry_run=dry_run, workers=workers)
+    if examples:
+        process_examples(deck, dry_run=dry_run, workers=workers)
+    print(f"  {voicevox.stats()}")
 
-def main():
-    import urllib.parse  # needed for generate_audio
 
+def main():
     parser = argparse.ArgumentParser(description="VOICEVOX TTS for Anki")
     parser.add_argument("--words", action="store_true", help="Generate word audio (琴詠ニア)")
     parser.add_argument("--examples", action="store_true", help="Generate example audio (剣崎雌雄)")
     parser.add_argument("--deck", default="補充単語", help="Target deck name")
     parser.add_argument("--all-profiles", action="store_true", help="Run on all profiles")
+    parser.add_argument("--direct", action="store_true",
+                        help="Anki closed: edit all profiles' collections directly, in parallel")
     parser.add_argument("--list-speakers", action="store_true", help="List VOICEVOX speakers")
     parser.add_argument("--dry-run", action="store_true", help="Show what would be generated")
+    parser.add_argument("--workers", type=int, default=tts_pipeline.WORKERS,
+                        help="Concurrent VOICEVOX synthesis requests")
+    parser.add_argument("--reencode", action="store_true",
+                        help="Convert existing tts_*.wav in --deck to TTS_FORMAT (mp3/opus)")
     args = parser.parse_args()
 
-    # Check VOICEVOX
-    try:
-        voicevox_get("/version")
+    # Check VOICEVOX (--reencode only touches existing media)
+    if args.reencode:
+        pass
+    elif voicevox.is_running():
         print("VOICEVOX OK")
-    except Exception:
-        print("! VOICEVOX not running (http://127.0.0.1:50021)")
+    else:
+        print(f"! VOICEVOX not running ({voicevox.VOICEVOX_URL})")
         print("  Please start VOICEVOX first")
         return
 
@@ -277,8 +252,23 @@ def main():
         list_speakers()
         return
 
-    if not args.words and not args.examples:
-        print("Specify --words and/or --examples")
+    if not args.words and not args.examples and not args.reencode:
+        print("Specify --words and/or --examples (or --reencode)")
+        return
+
+    if not args.reencode:
+        resolve_speakers()
+        print(f"  琴詠ニア: speaker_id={SPEAKER_WORD}")
+        print(f"  剣崎雌雄: speaker_id={SPEAKER_EXAMPLE}")
+
+    if args.direct:
+        err = check_direct(PROFILES)
+        if err:
+            print(f"! {err}")
+            return
+        run_profiles(process_profile, PROFILES, args.words, args.examples,
+                     args.deck, args.dry_run, args.workers, args.reencode)
+        print("\nDone!")
         return
 
     # Check Anki
@@ -286,37 +276,22 @@ def main():
         print("! Anki not running")
         return
 
-    # Resolve speakers
-    resolve_speakers()
-    print(f"  琴詠ニア: speaker_id={SPEAKER_WORD}")
-    print(f"  剣崎雌雄: speaker_id={SPEAKER_EXAMPLE}")
-
     profiles = PROFILES if args.all_profiles else [None]
 
     for profile in profiles:
         if profile:
-            try:
-                anki("loadProfile", name=profile)
-            except Exception:
-                pass
-            time.sleep(3)
-            if not wait_for_anki():
+            elapsed = switch_profile(profile)
+            if elapsed is None:
                 print(f"! {profile} switch failed")
                 continue
-            print(f"\n=== Profile: {profile} ===")
+            print(f"\n=== Profile: {profile} (switched in {elapsed:.1f}s) ===")
 
-        if args.words:
-            process_words(args.deck, dry_run=args.dry_run)
-        if args.examples:
-            process_examples(args.deck, dry_run=args.dry_run)
+        process_profile(args.words, args.examples, args.deck, args.dry_run, args.workers,
+                        args.reencode)
 
     # Switch back
     if args.all_profiles:
-        try:
-            anki("loadProfile", name="szmz")
-        except Exception:
-            pass
-        time.sleep(2)
+        switch_profile("szmz")
 
     print("\nDone!")
 
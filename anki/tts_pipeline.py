@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+TTS 流水线 — 清洗 / 合成 / 上传三段重叠执行
+  [clean] 1 线程  →  q_text (有界)  →  [synth] N 线程 audio_query + synthesis
+          + [encode] 同一线程 WAV → MP3/Opus（audio_encode）
+          →  q_wav (有界)  →  [upload] 主线程 Batch 攒 multi(storeMediaFile)，
+                                      上传成功的再由第二个 Batch 攒 multi(updateNoteFields)
+                                      （音频经 media_stage 写暂存文件，按 path 上传）
+  - 上传失败的不写字段：字段留空，下次运行的「音频为空」查询还会选中它重试
+  - 队列有界：上传慢时合成自动停下，合成慢时清洗不会跑太远（背压）
+  - 结束后打印每段的条数 / 忙碌时间 / 吞吐，以及压缩前后的音频大小
+  - batch > 1（短单词）时每个合成线程一次取最多 batch 条，走 voicevox.synthesize_many
+    （一次 multi_synthesis 合成一组）
+
+用法:
+  count = run(items, speaker_id, "例句音频", clean=anki_text.plain,
+              filename=lambda t: make_filename("ex", t), workers=4)
+  items: 可迭代的 (note_id, 原始字段文本)
+"""
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import wait
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ankiconnect import Batch
+import audio_encode
+import media_stage
+import voicevox
+
+WORKERS = 4        # 同时在途的合成请求数（VOICEVOX 引擎多核 / GPU 时可调大）
+QUEUE_SIZE = 16    # 每段之间最多缓冲多少条
+UPLOAD_BATCH = 20  # storeMediaFile / updateNoteFields per multi request
+
+_DONE = object()
+
+
+class Stage:
+    def __init__(self, name, threads=1):
+        self.name = name
+        self.threads = threads
+        self.items = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds, n=1):
+        with self._lock:
+            self.items += n
+            self.busy += seconds
+
+    def report(self, wall):
+        rate = self.items / wall if wall > 0 else 0.0
+        who = f"{self.name}×{self.threads}" if self.threads > 1 else self.name
+        return f"{who:<10} {self.items:>5} 条  忙 {self.busy:6.1f}s  {rate:6.1f} 条/s"
+
+
+def run(items, speaker_id, field, clean, filename, value=None,
+        workers=WORKERS, batch_size=UPLOAD_BATCH, batch=1):
+    """Clean → synthesize → upload every (note_id, raw_text) in `items`.
+    `value(filename)` is what goes into `field` (default "[sound:filename]").
+    `batch` > 1 synthesizes that many texts per multi_synthesis call.
+    Returns the number of notes whose audio was stored and linked."""
+    value = value or (lambda f: f"[sound:{f}]")
+    q_text = queue.Queue(QUEUE_SIZE)
+    q_wav = queue.Queue(QUEUE_SIZE)
+    s_clean, s_synth, s_upload = Stage("clean"), Stage("synth", workers), Stage("upload")
+    s_encode = Stage("encode", workers)
+    sizes = [0, 0]  # WAV bytes, encoded bytes
+    t0 = time.perf_counter()
+
+    def cleaner():
+        try:
+            for note_id, raw in items:
+                t = time.perf_counter()
+                text = clean(raw)
+                if not text:
+                    continue
+                job = (note_id, text, filename(text))
+                s_clean.record(time.perf_counter() - t)
+                q_text.put(job)
+        finally:
+            for _ in range(workers):
+                q_text.put(_DONE)
+
+    def synthesize(jobs):
+        """{text: wav bytes or Exception} for one group of jobs; never raises."""
+        try:
+            if len(jobs) == 1:
+                return {jobs[0][1]: voicevox.synthesize(jobs[0][1], speaker_id)}
+            return voicevox.synthesize_many([j[1] for j in jobs], speaker_id, batch=batch)
+        except Exception as e:  # 缓存 SQLite / 磁盘出错、version() 失败…
+            return {j[1]: e for j in jobs}
+
+    def synthesizer():
+        try:
+            while True:
+                job = q_text.get()
+                if job is _DONE:
+                    return
+                jobs = [job]
+                while len(jobs) < batch:  # 顺手多取几条凑成一组，不等待
+                    try:
+                        nxt = q_text.get_nowait()
+                    except queue.Empty:
+                        break
+                    if nxt is _DONE:
+                        q_text.put(_DONE)  # 留给自己下一轮退出
+                        break
+                    jobs.append(nxt)
+                t = time.perf_counter()
+                wavs = synthesize(jobs)
+                s_synth.record(time.perf_counter() - t, len(jobs))
+                for j in jobs:
+                    wav = wavs.get(j[1], Exception("no audio returned"))
+                    if not isinstance(wav, Exception):
+                        t = time.perf_counter()
+                        try:
+                            data = audio_encode.encode(wav)
+                            with s_encode._lock:
+                                sizes[0] += len(wav)
+                                sizes[1] += len(data)
+                            wav = data
+                        except Exception as e:
+                            wav = e
+                        s_encode.record(time.perf_counter() - t)
+                    q_wav.put((j, wav))
+        except Exception as e:
+            # 意外错误：剩下的任务记为失败并继续取到 _DONE，清洗线程不会卡在满队列上
+            job = q_text.get()
+            while job is not _DONE:
+                q_wav.put((job, e))
+                job = q_text.get()
+        finally:
+            q_wav.put(_DONE)  # 无论怎么退出都通知主线程
+
+    threads = [threading.Thread(target=cleaner, daemon=True)]
+    threads += [threading.Thread(target=synthesizer, daemon=True) for _ in range(workers)]
+    for th in threads:
+        th.start()
+
+    pending = []  # [text, note_id, fname, storeMediaFile future, updateNoteFields future or None]
+    uploader = Batch(max_size=batch_size)
+    writer = Batch(max_size=batch_size)
+
+    def write_stored():
+        """Queue updateNoteFields for every finished, successful store not yet written."""
+        for p in pending:
+            if p[4] is None and p[3].done() and not p[3].exception():
+                p[4] = writer.submit("updateNoteFields", note={
+                    "id": p[1], "fields": {field: value(p[2])}})
+    finished = 0
+    while finished < workers:
+        got = q_wav.get()
+        if got is _DONE:
+            finished += 1
+            continue
+        (note_id, text, fname), wav = got
+        if isinstance(wav, Exception):
+            print(f"  {text[:30]} → {fname} FAIL: {wav}")
+            continue
+        t = time.perf_counter()
+        media = media_stage.params(fname, wav)
+        store = uploader.submit("storeMediaFile", **media)
+        store.add_done_callback(lambda _, media=media: media_stage.release(media))
+        pending.append([text, note_id, fname, store, None])
+        write_stored()
+        s_upload.record(time.perf_counter() - t)
+    t = time.perf_counter()
+    uploader.flush()
+    wait([p[3] for p in pending])  # 定时 flush 可能还在别的线程上传
+    write_stored()
+    writer.flush()
+    s_upload.busy += time.perf_counter() - t
+    for th in threads:
+        th.join()
+
+    failed = 0
+    for text, _, fname, store, update in pending:
+        err = store.exception() or update.exception()
+        if err:
+            print(f"  {text[:30]} → {fname} upload FAIL: {err}")
+            failed += 1
+        else:
+            print(f"  {text[:30]} → {fname} OK")
+
+    wall = time.perf_counter() - t0
+    print(f"  pipeline {wall:.1f}s, {uploader.round_trips + writer.round_trips} 次上传请求:")
+    for st in (s_clean, s_synth, s_encode, s_upload):
+        print(f"    {st.report(wall)}")
+    if sizes[0]:
+        print(f"  音频 {sizes[0] / 1024:.0f} KB WAV → {sizes[1] / 1024:.0f} KB "
+              f"{audio_encode.describe()}")
+    return len(pending) - failed
@@ -2,97 +2,104 @@
 """
 解锁「中文→日文」卡片
 只解锁那些「日文→含义」方向已复习 ≥ N 次的词
+  - 筛选交给 Anki 搜索：card:1 prop:reps>=N 找到笔记，再找这些笔记里挂起的 card:2，
+    一共 3 个小请求，不再拉 cardsInfo
+  - --every 分钟：定时重复运行（Anki 没开时等下一轮）
+
+用法:
+  python3 anki/unlock.py             # 默认复习 ≥ 3 次
+  python3 anki/unlock.py 5           # ≥ 5 次
+  python3 anki/unlock.py --every 30  # 每 30 分钟检查一次
 """
-import json
-import urllib.request
+import argparse
 import os
 import sys
+import time
 
-os.environ.pop("http_proxy", None)
-os.environ.pop("https_proxy", None)
-os.environ.pop("HTTP_PROXY", None)
-os.environ.pop("HTTPS_PROXY", None)
-os.environ["no_proxy"] = "localhost,127.0.0.1"
-_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ankiconnect import anki, unpack_multi, wait_for_anki
+import anki_query
 
-ANKI_URL = "http://localhost:8765"
 DECK = "みんなの日本語初级1-2 単語"
 MIN_REVIEWS = 3  # 日文→含义 复习 ≥ 3 次后解锁中文→日文
 
 
-def anki(action, **params):
-    payload = json.dumps({"action": action, "version": 6, "params": params})
-    req = urllib.request.Request(ANKI_URL, data=payload.encode("utf-8"),
-                                 headers={"Content-Type": "application/json"})
-    resp = _opener.open(req)
-    r = json.loads(resp.read())
-    if r.get("error") and isinstance(r["error"], str):
-        raise Exception(r["error"])
-    return r.get("result")
-
-
-def main():
-    threshold = MIN_REVIEWS
-    if len(sys.argv) > 1:
-        try:
-            threshold = int(sys.argv[1])
-        except ValueError:
-            pass
-
-    print(f"解锁条件: 日文→含义 已复习 ≥ {threshold} 次")
-    print("-" * 40)
-
-    try:
-        anki("version")
-    except Exception:
-        print("✗ 请打开 Anki")
-        return
-
-    # 获取所有「日文→含义」卡片 (card:1 = 第一个模板)
-    jp_cards = anki("findCards", query=f'"deck:{DECK}" card:1')
-    if not jp_cards:
+def unlock(threshold=MIN_REVIEWS):
+    """Unsuspend card:2 of every note whose card:1 has ≥ threshold reviews.
+    Returns (card:1 total, ready notes, unlocked, still suspended)."""
+    # 1 次 multi：三个搜索只回 id
+    total, ready, suspended = unpack_multi(anki("multi", actions=[
+        {"action": "findCards", "version": 6,
+         "params": {"query": anki_query.build(deck=DECK, card=1)}},
+        {"action": "findNotes", "version": 6, "params": {"query": anki_query.build(
+            deck=DECK, card=1, extra=[anki_query.prop(f"reps>={threshold}")])}},
+        {"action": "findCards", "version": 6, "params": {"query": anki_query.build(
+            deck=DECK, card=2, extra=[anki_query.is_("suspended")])}},
+    ]), 3)
+    for r in (total, ready, suspended):
+        if isinstance(r, Exception):
+            raise r
+    if not ready or not suspended:
+        return len(total), len(ready), 0, len(suspended)
+
+    # 2. 这些笔记里挂起的 card:2
+    to_unsuspend = anki("findCards", query=anki_query.build(
+        deck=DECK, card=2, extra=[anki_query.is_("suspended"), anki_query.nids(ready)]))
+    # 3. 解锁
+    if to_unsuspend:
+        anki("unsuspend", cards=to_unsuspend)
+    return len(total), len(ready), len(to_unsuspend), len(suspended) - len(to_unsuspend)
+
+
+def report(threshold):
+    total, ready, unlocked, remaining = unlock(threshold)
+    if not total:
         print("未找到卡片")
         return
-
-    jp_info = anki("cardsInfo", cards=jp_cards)
-
-    # 找出复习次数 >= threshold 的 note IDs
-    ready_notes = set()
-    for card in jp_info:
-        if card["reps"] >= threshold:
-            ready_notes.add(card["note"])
-
-    print(f"日文→含义 总卡片: {len(jp_cards)}")
-    print(f"已复习 ≥{threshold} 次: {len(ready_notes)} 个词")
-
-    if not ready_notes:
+    print(f"日文→含义 总卡片: {total}")
+    print(f"已复习 ≥{threshold} 次: {ready} 个词")
+    if not ready:
         print("\n暂无可解锁的卡片，继续复习吧！")
-        return
-
-    # 获取所有已挂起的「中文→日文」卡片 (card:2 = 第二个模板)
-    cn_cards = anki("findCards", query=f'"deck:{DECK}" card:2 is:suspended')
-    if not cn_cards:
+    elif unlocked:
+        print(f"\n✅ 解锁了 {unlocked} 张「中文→日文」卡片！")
+        print(f"剩余挂起: {remaining} 张")
+    elif not remaining:
         print("\n没有已挂起的中文→日文卡片")
-        return
+    else:
+        print("\n所有符合条件的中文→日文卡片已解锁")
 
-    cn_info = anki("cardsInfo", cards=cn_cards)
 
-    # 找出对应的挂起卡片
-    to_unsuspend = []
-    for card in cn_info:
-        if card["note"] in ready_notes:
-            to_unsuspend.append(card["cardId"])
+def main():
+    parser = argparse.ArgumentParser(description="解锁「中文→日文」卡片")
+    parser.add_argument("threshold", nargs="?", type=int, default=MIN_REVIEWS,
+                        help=f"日文→含义 至少复习几次（默认 {MIN_REVIEWS}）")
+    parser.add_argument("--every", type=float, metavar="MIN",
+                        help="每隔 MIN 分钟重复运行")
+    args = parser.parse_args()
+
+    print(f"解锁条件: 日文→含义 已复习 ≥ {args.threshold} 次")
+    print("-" * 40)
 
-    if not to_unsuspend:
-        print("\n所有符合条件的中文→日文卡片已解锁")
+    if not args.every:
+        if not wait_for_anki(5):
+            print("✗ 请打开 Anki")
+            return
+        report(args.threshold)
         return
 
-    anki("unsuspend", cards=to_unsuspend)
-    print(f"\n✅ 解锁了 {len(to_unsuspend)} 张「中文→日文」卡片！")
-
-    # 统计剩余挂起
-    remaining = len(cn_cards) - len(to_unsuspend)
-    print(f"剩余挂起: {remaining} 张")
+    while True:
+        stamp = time.strftime("%H:%M:%S")
+        try:
+            if wait_for_anki(5):
+                t0 = time.perf_counter()
+                _, ready, unlocked, remaining = unlock(args.threshold)
+                print(f"[{stamp}] 解锁 {unlocked} 张，可解锁词 {ready}，剩余挂起 {remaining} "
+                      f"({(time.perf_counter() - t0) * 1000:.0f}ms)")
+            else:
+                print(f"[{stamp}] ✗ Anki 未运行，下一轮再试")
+        except Exception as e:
+            print(f"[{stamp}] ✗ {e}")
+        time.sleep(args.every * 60)
 
 
 if __name__ == "__main__":
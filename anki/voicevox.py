@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+VOICEVOX 共享客户端 + 磁盘缓存 — 所有 TTS 脚本统一 `voicevox.synthesize(text, speaker)`
+  - 绕过系统代理直连 VOICEVOX（默认 127.0.0.1:50021，VOICEVOX_URL 可覆盖）
+  - 合成结果缓存在 .cache/tts/：SQLite 索引 + WAV blob 目录，
+    key = (清洗后的文本, speaker style id, VOICEVOX 版本)，版本升级自动失效
+  - 总大小超过 TTS_CACHE_MB（默认 500MB）时按最近最少使用淘汰
+  - 第二个 Profile / 重跑同一批句子不再调用 audio_query + synthesis
+  - synthesize_many(): 短单词批量合成，audio_query 仍逐个，合成走一次
+    multi_synthesis（返回 zip，按顺序拆回每个词）；引擎不支持时退回逐个 synthesis
+
+用法:
+  if voicevox.is_running(): ...
+  sid = voicevox.find_speaker("琴詠ニア")
+  wav = voicevox.synthesize("こんにちは", sid)
+  print(voicevox.stats())
+"""
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import zipfile
+
+VOICEVOX_URL = os.environ.get("VOICEVOX_URL", "http://127.0.0.1:50021")
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "tts")
+CACHE_MAX_BYTES = int(os.environ.get("TTS_CACHE_MB", "500")) * 1024 * 1024
+PROBE_TIMEOUT = 2  # 秒；is_running() 探测
+MULTI_BATCH = 20  # 每个 multi_synthesis 请求的单词数（单词 1–3 秒，zip 不会太大）
+
+_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+_version = None
+_multi_supported = True  # 旧引擎没有 /multi_synthesis，首次 404 后置 False
+
+
+# ─── HTTP ─────────────────────────────────────────────
+def get(path, timeout=None):
+    req = urllib.request.Request(f"{VOICEVOX_URL}{path}")
+    return json.loads(_opener.open(req, timeout=timeout).read())
+
+
+def post(path, data=None):
+    """POST JSON (or an empty body) → raw response bytes."""
+    if data is None:
+        req = urllib.request.Request(f"{VOICEVOX_URL}{path}", data=b"", method="POST")
+    else:
+        req = urllib.request.Request(f"{VOICEVOX_URL}{path}",
+                                     data=json.dumps(data).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    return _opener.open(req).read()
+
+
+def version():
+    """Engine version (cache key part); cached until the next is_running() probe."""
+    global _version
+    if _version is None:
+        _version = get("/version", timeout=5)
+    return _version
+
+
+def is_running(timeout=PROBE_TIMEOUT):
+    """Uncached GET /version: refreshes the cached version on success (an
+    upgraded engine gets new cache keys), clears it on failure."""
+    global _version
+    try:
+        _version = get("/version", timeout=timeout)
+        return True
+    except Exception:
+        _version = None
+        return False
+
+
+def speakers():
+    return get("/speakers", timeout=5)
+
+
+def find_speaker(name_part, style_part=None):
+    """Style id of the first speaker whose name contains name_part
+    (and style name contains style_part, falling back to its first style)."""
+    for s in speakers():
+        if name_part in s["name"]:
+            for st in s["styles"]:
+                if style_part and style_part in st["name"]:
+                    return st["id"]
+            return s["styles"][0]["id"]
+    return None
+
+
+# ─── Cache ────────────────────────────────────────────
+class TTSCache:
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        # 多个进程（--direct 并行 Profile）共用同一个缓存，WAL + busy timeout
+        self.db = sqlite3.connect(os.path.join(root, "index.sqlite"), timeout=30,
+                                  check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS audio (
+            key TEXT PRIMARY KEY, text TEXT, speaker INTEGER, version TEXT,
+            size INTEGER, last_used REAL)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS audio_lru ON audio(last_used)")
+
+    @staticmethod
+    def key(text, speaker, engine_version):
+        raw = f"{engine_version}\x00{speaker}\x00{text}".encode("utf-8")
+        return hashlib.sha1(raw).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key + ".wav")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        with self._lock:
+            self.db.execute("UPDATE audio SET last_used = ? WHERE key = ?",
+                            (time.time(), key))
+        return data
+
+    def put(self, key, text, speaker, engine_version, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self.db.execute("INSERT OR REPLACE INTO audio VALUES (?, ?, ?, ?, ?, ?)",
+                            (key, text, speaker, engine_version, len(data), time.time()))
+            self._evict()
+
+    def _evict(self):
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM audio").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.db.execute(
+                "SELECT key, size FROM audio ORDER BY last_used").fetchall():
+            if total <= self.max_bytes * 0.9:  # 淘汰到 90%，避免每次写入都触发
+                break
+            self.db.execute("DELETE FROM audio WHERE key = ?", (key,))
+            try:
+                os.unlink(self._path(key))
+            except OSError:
+                pass
+            total -= size
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def cache():
+    global _cache
+    with _cache_lock:  # 流水线的多个合成线程会同时第一次调用
+        if _cache is None:
+            _cache = TTSCache()
+        return _cache
+
+
+def synthesize(text, speaker_id):
+    """WAV bytes for `text` (already cleaned) — from cache, else audio_query + synthesis."""
+    c = cache()
+    engine = version()
+    key = c.key(text, speaker_id, engine)
+    wav = c.get(key)
+    if wav is not None:
+        c.hits += 1
+        return wav
+    c.misses += 1
+    query = _audio_query(text, speaker_id)
+    wav = post(f"/synthesis?speaker={speaker_id}", query)
+    c.put(key, text, speaker_id, engine, wav)
+    return wav
+
+
+def _audio_query(text, speaker_id):
+    return json.loads(post(f"/audio_query?text={urllib.parse.quote(text)}&speaker={speaker_id}"))
+
+
+def multi_synthesis(queries, speaker_id):
+    """One /multi_synthesis call → WAV bytes per query, in order."""
+    data = post(f"/multi_synthesis?speaker={speaker_id}", queries)
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        names = sorted(n for n in zf.namelist() if n.endswith(".wav"))
+        if len(names) != len(queries):
+            raise Exception(f"multi_synthesis returned {len(names)} files for {len(queries)} queries")
+        return [zf.read(n) for n in names]
+
+
+def synthesize_many(texts, speaker_id, batch=MULTI_BATCH):
+    """{text: WAV bytes} for many short texts — cache first, then the misses
+    through multi_synthesis in groups of `batch`. A text that fails maps
+    to its Exception."""
+    global _multi_supported
+    c = cache()
+    engine = version()
+    out, todo = {}, []
+    for text in dict.fromkeys(texts):
+        wav = c.get(c.key(text, speaker_id, engine))
+        if wav is not None:
+            c.hits += 1
+            out[text] = wav
+        else:
+            todo.append(text)
+
+    for i in range(0, len(todo), batch):
+        group = todo[i:i + batch]
+        queries = []
+        for text in group:
+            try:
+                queries.append((text, _audio_query(text, speaker_id)))
+            except Exception as e:
+                out[text] = e
+        if not queries:
+            continue
+        wavs = None
+        if _multi_supported and len(queries) > 1:
+            try:
+                wavs = multi_synthesis([q for _, q in queries], speaker_id)
+            except urllib.error.HTTPError as e:
+                if e.code in (404, 405):
+                    _multi_supported = False
+            except Exception:
+                pass  # 这一组退回逐个 synthesis
+        for n, (text, query) in enumerate(queries):
+            c.misses += 1
+            try:
+                wav = wavs[n] if wavs else post(f"/synthesis?speaker={speaker_id}", query)
+            except Exception as e:
+                out[text] = e
+                continue
+            c.put(c.key(text, speaker_id, engine), text, speaker_id, engine, wav)
+            out[text] = wav
+    return out
+
+
+def stats():
+    c = cache()
+    return f"TTS cache: {c.hits} hit / {c.misses} synthesized"